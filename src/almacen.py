@@ -0,0 +1,194 @@
+# Almacén de imágenes fuera de la base de datos
+# Cada imagen se guarda una sola vez con su SHA-256 como clave (las filas con la misma imagen la comparten);
+# Productos y Perfiles_Empleados solo guardan la clave. ALMACEN_DESTINO elige dónde viven:
+#   local (por defecto): archivos en ALMACEN_DIR. Se sirven con send_file, así que gunicorn los manda con
+#       sendfile() y el kernel hace la copia; detrás de un servidor web se le puede dejar el envío completo
+#       con ALMACEN_X_SENDFILE=1 (Apache, lighttpd) o ALMACEN_X_ACCEL=/prefijo/ (nginx, location internal).
+#   s3: un bucket de S3 o de un servicio compatible (MinIO, R2...) con boto3; ALMACEN_S3_ENDPOINT apunta al
+#       servicio si no es AWS. Las imágenes se sirven redirigiendo a una URL firmada.
+# Los dos destinos tienen las mismas operaciones por clave que S3: subir, descargar, existe, borrar y listar.
+import hashlib
+import os
+import re
+import threading
+from datetime import datetime
+from flask import redirect, send_file, Response
+from bitacora import get_logger
+
+log = get_logger('almacen')
+
+ALMACEN_DESTINO = os.getenv('ALMACEN_DESTINO', 'local')
+ALMACEN_DIR = os.getenv('ALMACEN_DIR', os.path.join(os.path.dirname(__file__), 'almacen'))
+ALMACEN_X_SENDFILE = os.getenv('ALMACEN_X_SENDFILE') == '1'
+ALMACEN_X_ACCEL = os.getenv('ALMACEN_X_ACCEL')
+ALMACEN_S3_BUCKET = os.getenv('ALMACEN_S3_BUCKET')
+ALMACEN_S3_PREFIJO = os.getenv('ALMACEN_S3_PREFIJO', 'imagenes/')
+ALMACEN_S3_ENDPOINT = os.getenv('ALMACEN_S3_ENDPOINT')
+ALMACEN_S3_URL_EXPIRA = int(os.getenv('ALMACEN_S3_URL_EXPIRA', 3600))
+
+# Las claves salen de la base, pero nunca se arma una ruta con algo que no sea un hash
+FORMATO_CLAVE = re.compile(r'^[0-9a-f]{64}$')
+
+def calcular_clave(datos):
+    return hashlib.sha256(datos).hexdigest() if datos else None
+
+def validar_clave(clave):
+    if not FORMATO_CLAVE.match(clave or ''):
+        raise ValueError(f"Clave de almacén no válida: {clave!r}")
+    return clave
+
+# ===== DESTINOS =====
+class AlmacenLocal:
+    # Un archivo por clave, repartidos en subdirectorios por los primeros caracteres del hash
+    def __init__(self, directorio):
+        self.directorio = directorio
+
+    def ruta(self, clave):
+        validar_clave(clave)
+        return os.path.join(self.directorio, clave[:2], clave[2:4], clave)
+
+    def subir(self, clave, datos, mimetype=None):
+        ruta = self.ruta(clave)
+        if os.path.exists(ruta):
+            return
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Se escribe aparte y se renombra: nadie lee un archivo a medias
+        temporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(temporal, 'wb') as archivo:
+                archivo.write(datos)
+                archivo.flush()
+                os.fsync(archivo.fileno())
+            os.replace(temporal, ruta)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    def descargar(self, clave):
+        with open(self.ruta(clave), 'rb') as archivo:
+            return archivo.read()
+
+    def existe(self, clave):
+        return os.path.exists(self.ruta(clave))
+
+    def borrar(self, clave):
+        try:
+            os.remove(self.ruta(clave))
+        except FileNotFoundError:
+            pass
+
+    def listar(self):
+        """
+        (clave, fecha de modificación) de todo lo guardado
+        """
+        for carpeta, _, archivos in os.walk(self.directorio):
+            for nombre in archivos:
+                if FORMATO_CLAVE.match(nombre):
+                    yield nombre, datetime.utcfromtimestamp(os.path.getmtime(os.path.join(carpeta, nombre)))
+
+    def respuesta(self, clave, mimetype):
+        ruta = self.ruta(clave)
+        if ALMACEN_X_ACCEL:
+            if not os.path.exists(ruta):
+                return None
+            respuesta = Response(mimetype=mimetype)
+            respuesta.headers['X-Accel-Redirect'] = ALMACEN_X_ACCEL + os.path.relpath(ruta, self.directorio)
+            return respuesta
+        try:
+            # El ETag y el caché los pone servir_imagen; con USE_X_SENDFILE Flask solo manda la cabecera
+            return send_file(ruta, mimetype=mimetype, conditional=False, etag=False, max_age=None)
+        except FileNotFoundError:
+            return None
+
+class AlmacenS3:
+    def __init__(self, bucket, prefijo, endpoint=None):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("Para ALMACEN_DESTINO=s3 se necesita el paquete boto3")
+        if not bucket:
+            raise RuntimeError("Para ALMACEN_DESTINO=s3 se necesita ALMACEN_S3_BUCKET")
+        self.cliente = boto3.client('s3', endpoint_url=endpoint or None)
+        self.error_cliente = ClientError
+        self.bucket = bucket
+        self.prefijo = prefijo
+
+    def llave(self, clave):
+        return self.prefijo + validar_clave(clave)
+
+    def subir(self, clave, datos, mimetype=None):
+        if self.existe(clave):
+            return
+        self.cliente.put_object(
+            Bucket=self.bucket, Key=self.llave(clave), Body=datos,
+            ContentType=mimetype or 'application/octet-stream', CacheControl='public, max-age=31536000, immutable'
+        )
+
+    def descargar(self, clave):
+        return self.cliente.get_object(Bucket=self.bucket, Key=self.llave(clave))['Body'].read()
+
+    def existe(self, clave):
+        try:
+            self.cliente.head_object(Bucket=self.bucket, Key=self.llave(clave))
+            return True
+        except self.error_cliente as error:
+            if error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def borrar(self, clave):
+        self.cliente.delete_object(Bucket=self.bucket, Key=self.llave(clave))
+
+    def listar(self):
+        paginador = self.cliente.get_paginator('list_objects_v2')
+        for pagina in paginador.paginate(Bucket=self.bucket, Prefix=self.prefijo):
+            for objeto in pagina.get('Contents', []):
+                clave = objeto['Key'][len(self.prefijo):]
+                if FORMATO_CLAVE.match(clave):
+                    yield clave, objeto['LastModified'].replace(tzinfo=None)
+
+    def respuesta(self, clave, mimetype):
+        url = self.cliente.generate_presigned_url('get_object', Params={
+            'Bucket': self.bucket, 'Key': self.llave(clave), 'ResponseContentType': mimetype,
+        }, ExpiresIn=ALMACEN_S3_URL_EXPIRA)
+        respuesta = redirect(url)
+        # La redirección no puede durar en caché más que la firma
+        respuesta.cache_control.private = True
+        respuesta.cache_control.max_age = ALMACEN_S3_URL_EXPIRA // 2
+        return respuesta
+
+almacen = None
+candado_almacen = threading.Lock()
+
+def get_almacen():
+    global almacen
+    with candado_almacen:
+        if almacen is None:
+            if ALMACEN_DESTINO == 's3':
+                almacen = AlmacenS3(ALMACEN_S3_BUCKET, ALMACEN_S3_PREFIJO, ALMACEN_S3_ENDPOINT)
+            else:
+                almacen = AlmacenLocal(ALMACEN_DIR)
+        return almacen
+
+# ===== OPERACIONES =====
+def guardar_blob(datos, mimetype=None):
+    """
+    Sube los datos (si no estaban ya) y regresa su clave; None si no hay datos
+    """
+    clave = calcular_clave(datos)
+    if clave:
+        get_almacen().subir(clave, datos, mimetype)
+    return clave
+
+def leer_blob(clave):
+    return get_almacen().descargar(clave)
+
+def respuesta_blob(clave, mimetype):
+    """
+    Respuesta que manda el archivo sin pasar los bytes por Python; None si ya no existe
+    """
+    return get_almacen().respuesta(clave, mimetype)
+
+def instalar_almacen(app):
+    app.config['USE_X_SENDFILE'] = ALMACEN_X_SENDFILE
@@ -1,144 +1,55 @@
 import datetime
-from flask import Flask, redirect, render_template, request, session, url_for, Response
+from flask import Flask, g, jsonify, redirect, render_template, request, session, stream_with_context, url_for, Response
 from functools import wraps
-from io import BytesIO
-from PIL import Image
-from database import db_session
-from database.models import Empleados, Productos, Paquetes, Paquetes_Productos, Perfiles_Empleados, Roles
+from database import db_session, get_estadisticas_pool
+from database.models import Empleados, Productos, Paquetes, Paquetes_Productos, Perfiles_Empleados, Roles, Imagenes_Variantes, Sucursales
+from database.models import calcular_hash_imagen, describir_imagen, mimetype_seguro, LADOS_VARIANTES
+from imagenes import encolar_imagen
+from almacen import instalar_almacen, respuesta_blob
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
 from werkzeug.security import generate_password_hash
 from itsdangerous import URLSafeTimedSerializer
 from flask_mail import Mail, Message
 from config import Config
+from paginacion import paginate
+from busqueda import buscar_empleados, buscar_productos
+from perfilador import instalar_perfilador, get_estadisticas_consultas
+from metricas import instalar_metricas, acceso_metricas, exponer, incrementar
+from bitacora import get_logger
+from correos import instalar_correos, encolar_correo
+from tablero import get_tablero, quitar_despacho, registrar_despacho
+from catalogo import ErrorImportacion, exportar_productos, importar_productos
+from codigos import buscar_codigos, invalidar_codigos
+from fragmentos import EMPLEADOS, PAQUETES, PRODUCTOS, fragmento_en_cache, invalidar_fragmentos
+from borradores import iniciar_barrido
+from inventario import CantidadInvalida, StockInsuficiente, agrupar_cantidades, ajustar_stock, cargar_productos, registrar_alta, reservar_stock, validar_stock
 import json
-import math
 import os
 
 app = Flask(__name__)
 app.secret_key = 'LA POBLANITA'
 
 app.config.from_object(Config)
+instalar_perfilador(app)
+instalar_metricas(app)
+log = get_logger('app')
 correo = Mail(app)
+instalar_correos(app, correo)
+instalar_almacen(app)
 serializador = URLSafeTimedSerializer(Config.SECRET_KEY)
 
-# ===== FUNCIÓN DE PAGINACIÓN MANUAL =====
-def paginate(query, page, per_page):
-
-    page = max(1, page)
-    total = query.count()
-    items = query.offset((page - 1) * per_page).limit(per_page).all()
-    
-    class Pagination:
-        def __init__(self, items, page, per_page, total):
-            self.items = items
-            self.page = page
-            self.per_page = per_page
-            self.total = total
-            self.pages = math.ceil(total / per_page) if per_page > 0 else 0
-            
-        @property
-        def has_prev(self):
-            return self.page > 1
-            
-        @property
-        def has_next(self):
-            return self.page < self.pages
-            
-        @property
-        def prev_num(self):
-            return self.page - 1 if self.has_prev else None
-            
-        @property
-        def next_num(self):
-            return self.page + 1 if self.has_next else None
-            
-        def iter_pages(self, left_edge=2, left_current=2, right_current=2, right_edge=2):
-
-            total_pages = self.pages
-            if total_pages <= 1:
-                return
-
-            left_range = range(1, min(left_edge, total_pages) + 1)
-            right_range = range(max(total_pages - right_edge + 1, left_edge + 1), total_pages + 1)
-            
-            current_page = self.page
-            middle_range = range(
-                max(current_page - left_current, left_edge + 1),
-                min(current_page + right_current + 1, right_range[0] if right_range else total_pages + 1)
-            )
-            
-            last = 0
-            for page_num in left_range:
-                yield page_num
-                last = page_num
-                
-            if last + 1 < middle_range[0] if middle_range else last + 1 < right_range[0] if right_range else False:
-                yield None
-                
-            for page_num in middle_range:
-                yield page_num
-                last = page_num
-                
-            if last + 1 < right_range[0] if right_range else False:
-                yield None
-                
-            for page_num in right_range:
-                yield page_num
-
-    return Pagination(items, page, per_page, total)
-
-
-# ===== FUNCIONES DE BÚSQUEDA =====
-def buscar_empleados(termino):
-    """
-    Buscador de empleados por nombre, apellidos, usuario, email o teléfono
-    """
-    return db_session.query(Empleados).join(Perfiles_Empleados).filter(
-        (Empleados.nombre_usuario.ilike(f'%{termino}%')) |
-        (Perfiles_Empleados.nombre.ilike(f'%{termino}%')) |
-        (Perfiles_Empleados.apellidoP.ilike(f'%{termino}%')) |
-        (Perfiles_Empleados.apellidoM.ilike(f'%{termino}%')) |
-        (Perfiles_Empleados.email.ilike(f'%{termino}%')) |
-        (Empleados.telefono.ilike(f'%{termino}%'))
-    )
-
-def buscar_productos(termino):
-    """
-    Buscador de productos por nombre o código de barras exacto
-    """
-    producto_por_codigo = db_session.query(Productos).filter(
-        Productos.codigo_barras == termino
-    ).first()
-    
-    if producto_por_codigo:
-        return db_session.query(Productos).filter(Productos.codigo_barras == termino)
-    else:
-        return db_session.query(Productos).filter(
-            Productos.nombre.ilike(f'%{termino}%')
-        )
-
-def buscar_paquetes(termino):
-    """
-    Buscador de paquetes por ID, sucursal o productos contenidos
-    """
-    # Buscador por ID de paquete
-    if termino.isdigit():
-        paquete_id = int(termino)
-        return db_session.query(Paquetes).filter(
-            (Paquetes.id_paquete == paquete_id) |
-            (Paquetes.sucursal.ilike(f'%{termino}%'))
-        ).filter(Paquetes.paquetes_productos.any())
-    
-    # Buscador por sucursal o productos
-    return db_session.query(Paquetes).filter(
-        (Paquetes.sucursal.ilike(f'%{termino}%')) |
-        (Paquetes.paquetes_productos.any(
-            Paquetes_Productos.producto.has(Productos.nombre.ilike(f'%{termino}%'))
-        ))
-    ).filter(Paquetes.paquetes_productos.any())
-
 # ===== FUNCIONES AUXILIARES =====
 def get_usuario_actual():
-    return db_session.query(Empleados).filter_by(id_empleado=session['usuario_id']).first() if 'usuario_id' in session else None
+    """
+    Usuario de la sesión, cargado una sola vez por petición con su rol y perfil (sin la foto)
+    """
+    if 'usuario_actual' not in g:
+        g.usuario_actual = db_session.query(Empleados).options(
+            joinedload(Empleados.rol),
+            joinedload(Empleados.perfil).defer(Perfiles_Empleados.foto_perfil)
+        ).filter_by(id_empleado=session['usuario_id']).first() if 'usuario_id' in session else None
+    return g.usuario_actual
 
 def get_perfil_usuario_actual():
     usuario = get_usuario_actual()
@@ -152,6 +63,13 @@ def get_rol_usuario_actual():
         return usuario.rol.nombre
     return 'user'
 
+# Roles que pueden importar productos (ruta y formulario)
+ROLES_IMPORTACION = ('admin', 'boss')
+
+@app.context_processor
+def permisos_plantillas():
+    return {'puede_importar': get_rol_usuario_actual() in ROLES_IMPORTACION}
+
 def requiere_login(f):
     def decorador(*args, **kwargs):
         return f(*args, **kwargs) if get_usuario_actual() else redirect(url_for('login'))
@@ -170,6 +88,17 @@ def requiere_rol(*roles):
         return decorated_function
     return decorador
 
+def requiere_sesion(f):
+    """
+    Para la API en JSON: solo revisa la cookie de sesión (firmada) sin consultar al empleado
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'usuario_id' not in session:
+            return jsonify({'error': 'Sesión requerida'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
 def puede_editar_empleado(usuario_actual, empleado_id):
     rol_actual = get_rol_usuario_actual()
     if rol_actual == 'boss': 
@@ -189,12 +118,14 @@ def puede_cambiar_rol(usuario_actual, nuevo_rol_id):
     return False
 
 def manejar_imagen(archivo):
-
+    """
+    Valida la imagen subida; la compresión y las miniaturas se hacen en segundo plano (ver imagenes.py)
+    """
     if not archivo or not archivo.filename:
         return None
     
     if not archivo.content_type.startswith('image/'):
-        print(f"Archivo no es una imagen: {archivo.content_type}")
+        log.warning("Archivo no es una imagen", extra={'datos': {'content_type': archivo.content_type}})
         return None
     
     try:
@@ -206,94 +137,124 @@ def manejar_imagen(archivo):
         archivo.seek(0)
         
         if file_size > max_size:
-            print(f"Imagen demasiado grande: {file_size} bytes")
+            log.warning("Imagen demasiado grande", extra={'datos': {'bytes': file_size}})
             return None
         
         imagen_data = archivo.read()
         
         if len(imagen_data) > max_size:
-            print(f"Imagen demasiado grande después de leer: {len(imagen_data)} bytes")
+            log.warning("Imagen demasiado grande después de leer", extra={'datos': {'bytes': len(imagen_data)}})
             return None
         
-        if len(imagen_data) <= 1 * 1024 * 1024:
-            print(f"Imagen aceptada sin compresión: {len(imagen_data)} bytes")
-            return imagen_data
-        
-        try:
-            imagen = Image.open(BytesIO(imagen_data))
-            print(f"Imagen original: {imagen.format}, tamaño: {imagen.size}, modo: {imagen.mode}")
-            
-            # Formatos JPEG, PNG o WEBP
-            formato_original = imagen.format
-            formatos_sin_perdida = ['JPEG', 'PNG', 'WEBP']
-            
-            # Redimensiona
-            max_width, max_height = 600, 600
-            if imagen.width > max_width or imagen.height > max_height:
-                imagen.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
-                print(f"Imagen redimensionada a: {imagen.size}")
-            
-            # Comprime la imagen
-            calidad = 85
-            max_intentos = 5
-            
-            for intento in range(max_intentos):
-                output = BytesIO()
-                
-                if formato_original in formatos_sin_perdida:
-
-                    if formato_original == 'JPEG' and imagen.mode in ('RGBA', 'P'):
-                        imagen = imagen.convert('RGB')
-                    elif formato_original == 'PNG':
-  
-                        imagen.save(output, format='PNG', optimize=True)
-                    else:
-                        imagen.save(output, format=formato_original, optimize=True)
-                else:
-
-                    if imagen.mode in ('RGBA', 'P'):
-                        imagen = imagen.convert('RGB')
-                    imagen.save(output, format='JPEG', quality=calidad, optimize=True)
-                
-                imagen_comprimida = output.getvalue()
-                
-                if len(imagen_comprimida) <= 1 * 1024 * 1024:
-                    print(f"Imagen comprimida exitosamente: {len(imagen_data)} -> {len(imagen_comprimida)} bytes (calidad: {calidad}%)")
-                    return imagen_comprimida
-                
-                calidad -= 15
-                if calidad < 30:
-                    break
-            
-            if len(imagen_comprimida) <= 15 * 1024 * 1024:
-                print(f"Imagen comprimida (último intento): {len(imagen_data)} -> {len(imagen_comprimida)} bytes")
-                return imagen_comprimida
-            else:
-                print(f"Imagen demasiado grande después de compresión: {len(imagen_comprimida)} bytes")
-                return None
-            
-        except Exception as e:
-            print(f"Error procesando imagen con PIL: {e}")
-
-            if len(imagen_data) <= 1 * 1024 * 1024:
-                return imagen_data
+        imagen = describir_imagen(imagen_data)
+        if imagen['ancho'] is None:
+            log.warning("Imagen que no se puede abrir", extra={'datos': {'bytes': len(imagen_data), 'content_type': archivo.content_type}})
             return None
+        return imagen
             
-    except Exception as e:
-        print(f"Error general procesando imagen: {e}")
+    except Exception:
+        log.exception("Error general procesando imagen")
         return None
 
-def validar_stock_paquete(productos_seleccionados):
-    insuficientes = []
-    for item in productos_seleccionados:
-        producto = db_session.query(Productos).filter_by(id_producto=item['id']).first()
-        if not producto or producto.cantidad < item['cantidad']:
-            insuficientes.append({
-                'nombre': producto.nombre if producto else f'Producto {item["id"]}',
-                'solicitado': item['cantidad'],
-                'disponible': producto.cantidad if producto else 0
-            })
-    return insuficientes
+def variante_solicitada():
+    lado = request.args.get('size', type=int)
+    return lado if lado in LADOS_VARIANTES else None
+
+def etag_imagen(hash_imagen, lado=None):
+    return f'{hash_imagen}-{lado}' if lado else hash_imagen
+
+def imagen_en_cache(hash_imagen, lado=None):
+    return bool(hash_imagen) and etag_imagen(hash_imagen, lado) in request.if_none_match
+
+def respuesta_imagen(datos, hash_imagen, mimetype='image/jpeg', lado=None):
+    return preparar_respuesta_imagen(Response(datos, mimetype=mimetype), hash_imagen, lado)
+
+def preparar_respuesta_imagen(respuesta, hash_imagen, lado=None):
+    """
+    ETag de la imagen; si la URL trae la versión (?v=hash) se cachea de forma permanente
+    """
+    respuesta.set_etag(etag_imagen(hash_imagen, lado))
+    # El navegador no adivina otro tipo a partir del contenido
+    respuesta.headers['X-Content-Type-Options'] = 'nosniff'
+    if request.args.get('v') == hash_imagen and lado == variante_solicitada():
+        respuesta.cache_control.no_cache = None
+        respuesta.cache_control.public = True
+        respuesta.cache_control.max_age = 31536000
+        respuesta.cache_control.immutable = True
+    else:
+        respuesta.cache_control.no_cache = True
+    return respuesta.make_conditional(request)
+
+def respuesta_imagen_no_modificada(hash_imagen, lado=None):
+    respuesta = respuesta_imagen(None, hash_imagen, lado=lado)
+    respuesta.status_code = 304
+    return respuesta
+
+def servir_imagen(columna_datos, columna_clave, columna_hash, columna_mimetype, imagen_por_defecto, **filtro):
+    """
+    Sirve la imagen (o su miniatura con ?size=) consultando la BD lo menos posible; la original sale
+    del almacén sin pasar por Python (ver almacen.py)
+    """
+    lado = variante_solicitada()
+
+    # La versión en la URL es el hash del contenido, si el navegador ya la tiene no se consulta la BD
+    version = request.args.get('v')
+    if imagen_en_cache(version, lado):
+        return respuesta_imagen_no_modificada(version, lado)
+
+    imagen_hash, mimetype, clave = db_session.query(
+        columna_hash, columna_mimetype, columna_clave
+    ).filter_by(**filtro).first() or (None, None, None)
+    # Filas guardadas antes de validar las subidas pueden tener el tipo que mandó el navegador
+    mimetype = mimetype_seguro(mimetype)
+    if imagen_en_cache(imagen_hash, lado):
+        return respuesta_imagen_no_modificada(imagen_hash, lado)
+
+    if lado and imagen_hash:
+        variante = db_session.query(Imagenes_Variantes.datos, Imagenes_Variantes.mimetype).filter_by(
+            hash_original=imagen_hash, lado=lado
+        ).first()
+        if variante:
+            incrementar('imagenes_servidas_total', origen='miniatura')
+            return respuesta_imagen(variante.datos, imagen_hash, variante.mimetype, lado)
+
+    if clave:
+        respuesta = respuesta_blob(clave, mimetype)
+        if respuesta is not None:
+            incrementar('imagenes_servidas_total', origen='almacen')
+            # Las redirecciones a una URL firmada ya traen su propio caché
+            if respuesta.status_code != 200:
+                return respuesta
+            return preparar_respuesta_imagen(respuesta, imagen_hash)
+        log.warning("Imagen sin archivo en el almacén", extra={'datos': {'clave': clave}})
+
+    # Imágenes que todavía no se mueven al almacén (database/mover_imagenes.py)
+    datos = db_session.query(columna_datos).filter_by(**filtro).scalar()
+    if datos:
+        incrementar('imagenes_servidas_total', origen='base')
+        return respuesta_imagen(datos, imagen_hash or calcular_hash_imagen(datos), mimetype)
+    return redirect(url_for('static', filename=imagen_por_defecto))
+
+def registrar_sucursal(nombre):
+    """
+    Mantiene la tabla de sucursales usada por el filtro de paquetes
+    """
+    if db_session.query(Sucursales.id_sucursal).filter_by(nombre=nombre).first():
+        return
+    try:
+        with db_session.begin_nested():
+            db_session.add(Sucursales(nombre=nombre))
+    except IntegrityError:
+        pass
+
+def quitar_sucursal(nombre):
+    """
+    Saca la sucursal del filtro de paquetes cuando ya no la usa ningún paquete confirmado
+    """
+    db_session.query(Sucursales).filter(
+        Sucursales.nombre == nombre,
+        ~db_session.query(Paquetes.id_paquete).filter_by(sucursal=nombre, estado=Paquetes.CONFIRMADO).exists()
+    ).delete(synchronize_session=False)
 
 def crear_rol_user_si_no_existe():
 
@@ -306,10 +267,10 @@ def crear_rol_user_si_no_existe():
                 nuevo_rol = Roles(nombre=nombre_rol)
                 db_session.add(nuevo_rol)
                 db_session.commit()
-                print(f"Rol '{nombre_rol}' creado automáticamente")
-            except Exception as e:
+                log.info("Rol creado automáticamente", extra={'datos': {'rol': nombre_rol}})
+            except Exception:
                 db_session.rollback()
-                print(f"Error creando rol {nombre_rol}: {e}")
+                log.exception("Error creando rol", extra={'datos': {'rol': nombre_rol}})
     
     return db_session.query(Roles).filter_by(nombre='user').first()
 
@@ -359,9 +320,9 @@ def register():
             
             return redirect(url_for('login'))
             
-        except Exception as e:
+        except Exception:
             db_session.rollback()
-            print(f"Error en registro: {e}")
+            log.exception("Error en registro")
             return render_template('auth/register.html', error='Error en el registro. Intente nuevamente.')
     
     return render_template('auth/register.html')
@@ -399,19 +360,16 @@ def reset_password_request():
                 Este enlace expira en 1 hora.
                 """
             else:
-                # LOCAL seguir enviando correo normal
-                try:
-                    msg = Message(
-                        "Recuperación de Contraseña - La Poblanita",
-                        sender=app.config['MAIL_USERNAME'],
-                        recipients=[email]
-                    )
-                    msg.body = f"Enlace de recuperación:\n\n{url_reinicio}"
-                    correo.send(msg)
-                    
-                    mensaje = "Se ha enviado un enlace de recuperación a tu correo."
-                except Exception as e:
-                    error = f"Error enviando correo: {str(e)}"
+                # LOCAL seguir enviando correo normal (en segundo plano, ver correos.py)
+                msg = Message(
+                    "Recuperación de Contraseña - La Poblanita",
+                    sender=app.config['MAIL_USERNAME'],
+                    recipients=[email]
+                )
+                msg.body = f"Enlace de recuperación:\n\n{url_reinicio}"
+                encolar_correo(msg)
+
+                mensaje = "Se ha enviado un enlace de recuperación a tu correo."
         else:
             mensaje = "Si el correo existe, se enviará el enlace."
     
@@ -427,10 +385,10 @@ def reset_password(token):
     
     try:
         email = serializador.loads(token, salt='reinicio-contraseña', max_age=3600)
-        print(f"Email recuperado del token: {email}")
+        log.debug("Email recuperado del token", extra={'datos': {'email': email}})
     except Exception as e:
         error = "El enlace es inválido o ha expirado."
-        print(f"Error cargando token: {e}")
+        log.warning("Token de recuperación inválido o vencido", extra={'datos': {'error': str(e)}})
         return render_template('auth/reset_password.html', error=error)
     
     empleado = db_session.query(Empleados).join(Perfiles_Empleados).filter(
@@ -440,10 +398,10 @@ def reset_password(token):
     
     if not empleado:
         error = "Usuario no encontrado o inactivo."
-        print(f"Empleado no encontrado para email: {email}")
+        log.warning("Empleado no encontrado para el email del token", extra={'datos': {'email': email}})
         return render_template('auth/reset_password.html', error=error)
     
-    print(f"Empleado encontrado: {empleado.nombre_usuario}")
+    log.debug("Empleado encontrado", extra={'datos': {'usuario': empleado.nombre_usuario}})
     
     if request.method == 'POST':
         nueva_contraseña = request.form['nueva_contraseña']
@@ -455,10 +413,10 @@ def reset_password(token):
                 empleado.contraseña_hash = generate_password_hash(nueva_contraseña)
                 db_session.commit()
                 mensaje = "Contraseña actualizada correctamente."
-                print(f"Contraseña actualizada para usuario: {empleado.nombre_usuario}")
-            except Exception as e:
+                log.info("Contraseña actualizada", extra={'datos': {'usuario': empleado.nombre_usuario}})
+            except Exception:
                 error = "Error al actualizar la contraseña. Intente nuevamente."
-                print(f"Error actualizando contraseña: {e}")
+                log.exception("Error actualizando contraseña")
                 db_session.rollback()
     
     return render_template('auth/reset_password.html', error=error, mensaje=mensaje)
@@ -469,7 +427,8 @@ def reset_password(token):
 def home():
     return render_template('pages/home.html', 
                          usuario=get_usuario_actual(), 
-                         perfil=get_perfil_usuario_actual())
+                         perfil=get_perfil_usuario_actual(),
+                         tablero=get_tablero())
 
 # ===== GESTIÓN DE PRODUCTOS =====
 @app.route('/products')
@@ -482,34 +441,40 @@ def products():
     filtro_stock_min = request.args.get('filtro_stock_min', '').strip()
     filtro_stock_max = request.args.get('filtro_stock_max', '').strip()
     
-    por_pagina = 10
-    productos_query = db_session.query(Productos)
-    if busqueda:
-        productos_query = buscar_productos(busqueda)
-    if filtro_nombre:
-        productos_query = productos_query.filter(Productos.nombre.ilike(f'%{filtro_nombre}%'))
-    if filtro_codigo:
-        productos_query = productos_query.filter(Productos.codigo_barras.ilike(f'%{filtro_codigo}%'))
-    if filtro_stock_min:
-        try:
-            productos_query = productos_query.filter(Productos.cantidad >= int(filtro_stock_min))
-        except ValueError:
-            pass
-    if filtro_stock_max:
-        try:
-            productos_query = productos_query.filter(Productos.cantidad <= int(filtro_stock_max))
-        except ValueError:
-            pass
-    productos_paginados = paginate(productos_query, pagina, por_pagina)
+    def generar():
+        por_pagina = 10
+        productos_query = db_session.query(Productos)
+        if busqueda:
+            productos_query = buscar_productos(busqueda)
+        if filtro_nombre:
+            productos_query = productos_query.filter(Productos.nombre.ilike(f'%{filtro_nombre}%'))
+        if filtro_codigo:
+            productos_query = productos_query.filter(Productos.codigo_barras.ilike(f'%{filtro_codigo}%'))
+        if filtro_stock_min:
+            try:
+                productos_query = productos_query.filter(Productos.cantidad >= int(filtro_stock_min))
+            except ValueError:
+                pass
+        if filtro_stock_max:
+            try:
+                productos_query = productos_query.filter(Productos.cantidad <= int(filtro_stock_max))
+            except ValueError:
+                pass
+        productos_paginados = paginate(productos_query, pagina, por_pagina, orden=None if busqueda else [Productos.id_producto], cursor=request.args.get('cursor'))
+        return render_template('partials/products_list.html', 
+                             productos=productos_paginados.items,
+                             pagination=productos_paginados,
+                             busqueda=busqueda,
+                             filtro_nombre=filtro_nombre,
+                             filtro_codigo=filtro_codigo,
+                             filtro_stock_min=filtro_stock_min,
+                             filtro_stock_max=filtro_stock_max)
     
+    # La tabla es igual para todos los usuarios de un mismo permiso; solo la barra de navegación se renderiza
+    # en cada petición
+    variante = 'importar' if get_rol_usuario_actual() in ROLES_IMPORTACION else None
     return render_template('pages/management_products.html', 
-                         productos=productos_paginados.items,
-                         pagination=productos_paginados,
-                         busqueda=busqueda,
-                         filtro_nombre=filtro_nombre,
-                         filtro_codigo=filtro_codigo,
-                         filtro_stock_min=filtro_stock_min,
-                         filtro_stock_max=filtro_stock_max,
+                         contenido=fragmento_en_cache('products', request.args, [PRODUCTOS], generar, variante),
                          usuario=get_usuario_actual(),
                          perfil=get_perfil_usuario_actual())
 
@@ -526,7 +491,7 @@ def add_product():
                 productos_query = buscar_productos(busqueda)
             else:
                 productos_query = db_session.query(Productos)
-            productos_paginados = paginate(productos_query, pagina, 10)
+            productos_paginados = paginate(productos_query, pagina, 10, orden=None if busqueda else [Productos.id_producto], cursor=request.args.get('cursor'))
             return render_template('pages/management_products.html', 
                                 productos=productos_paginados.items,
                                 pagination=productos_paginados,
@@ -539,16 +504,54 @@ def add_product():
             cantidad=int(request.form['cantidad']),
             codigo_barras=codigo_barras
         )
-        imagen_data = manejar_imagen(request.files.get('imagen'))
-        if imagen_data: 
-            producto.imagen = imagen_data
+        imagen = manejar_imagen(request.files.get('imagen'))
+        if imagen: 
+            producto.asignar_imagen(imagen)
         db_session.add(producto)
+        registrar_alta(producto, session.get('usuario_id'))
         db_session.commit()
-    except Exception as e: 
-        print(f"Error agregando producto: {e}")
+        invalidar_codigos([producto.id_producto])
+        invalidar_fragmentos(PRODUCTOS)
+        if imagen:
+            encolar_imagen(producto, 'imagen', imagen)
+    except Exception:
+        log.exception("Error agregando producto")
         db_session.rollback()
     return redirect(url_for('products'))
 
+@app.route('/products/import', methods=['POST'])
+@requiere_login
+@requiere_rol(*ROLES_IMPORTACION)
+def import_products():
+    archivo = request.files.get('archivo')
+    resultado = None
+    error = None
+    if not archivo or not archivo.filename:
+        error = "Selecciona un archivo CSV o XLSX"
+    else:
+        try:
+            resultado = importar_productos(archivo.stream, archivo.filename, session.get('usuario_id'))
+        except ErrorImportacion as e:
+            error = str(e)
+        except Exception:
+            log.exception("Error importando productos", extra={'datos': {'archivo': archivo.filename}})
+            error = "Error guardando los productos; los lotes anteriores al error sí se guardaron"
+    return render_template('pages/import_products.html',
+                         resultado=resultado,
+                         archivo=archivo.filename if archivo else None,
+                         errores_mostrados=500,
+                         error=error,
+                         usuario=get_usuario_actual(),
+                         perfil=get_perfil_usuario_actual())
+
+@app.route('/products/export')
+@requiere_login
+@requiere_rol('user', 'admin', 'boss')
+def export_products():
+    nombre = f"productos_{datetime.datetime.now():%Y%m%d}.csv"
+    return Response(stream_with_context(exportar_productos()), mimetype='text/csv; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename="{nombre}"'})
+
 @app.route('/products/edit/<int:id>', methods=['POST'])
 @requiere_login
 @requiere_rol('user', 'admin', 'boss')
@@ -557,7 +560,13 @@ def edit_product(id):
     if producto:
         try:
             codigo_barras = request.form.get('codigo_barras')
+            cantidad = request.form.get('cantidad', type=int)
+            error = None
             if not codigo_barras:
+                error = "El código de barras es obligatorio"
+            elif cantidad is None or cantidad < 0:
+                error = "La cantidad debe ser un número entero mayor o igual a cero"
+            if error:
                 # Manejar el error
                 pagina = request.args.get('pagina', 1, type=int)
                 busqueda = request.args.get('busqueda', '').strip()
@@ -567,24 +576,29 @@ def edit_product(id):
                 else:
                     productos_query = db_session.query(Productos)
                     
-                productos_paginados = paginate(productos_query, pagina, 10)
+                productos_paginados = paginate(productos_query, pagina, 10, orden=None if busqueda else [Productos.id_producto], cursor=request.args.get('cursor'))
                 return render_template('pages/management_products.html', 
                                     productos=productos_paginados.items,
                                     pagination=productos_paginados,
                                     busqueda=busqueda,
                                     usuario=get_usuario_actual(),
                                     perfil=get_perfil_usuario_actual(),
-                                    error="El código de barras es obligatorio")
+                                    error=error)
             
+            ajustar_stock(producto, cantidad, session.get('usuario_id'))
             producto.nombre = request.form['nombre']
-            producto.cantidad = int(request.form['cantidad'])
             producto.codigo_barras = codigo_barras
-            imagen_data = manejar_imagen(request.files.get('imagen'))
-            if imagen_data: 
-                producto.imagen = imagen_data
+            imagen = manejar_imagen(request.files.get('imagen'))
+            if imagen: 
+                producto.asignar_imagen(imagen)
             db_session.commit()
-        except Exception as e: 
-            print(f"Error editando producto: {e}")
+            invalidar_codigos([id])
+            # El historial de paquetes muestra el nombre y el código de cada producto
+            invalidar_fragmentos(PRODUCTOS, PAQUETES)
+            if imagen:
+                encolar_imagen(producto, 'imagen', imagen)
+        except Exception:
+            log.exception("Error editando producto", extra={'datos': {'id_producto': id}})
             db_session.rollback()
     return redirect(url_for('products'))
 
@@ -614,7 +628,7 @@ def delete_product(id):
             else:
                 productos_query = db_session.query(Productos)
                 
-            productos_paginados = paginate(productos_query, pagina, 10)
+            productos_paginados = paginate(productos_query, pagina, 10, orden=None if busqueda else [Productos.id_producto], cursor=request.args.get('cursor'))
             return render_template('pages/management_products.html', 
                                 productos=productos_paginados.items,
                                 pagination=productos_paginados,
@@ -625,6 +639,8 @@ def delete_product(id):
         else:
             db_session.delete(producto)
             db_session.commit()
+            invalidar_codigos([id])
+            invalidar_fragmentos(PRODUCTOS)
     
     return redirect(url_for('products'))
 
@@ -637,40 +653,49 @@ def packages():
     filtro_fecha_hasta = request.args.get('filtro_fecha_hasta', '').strip()
     filtro_sucursal = request.args.get('filtro_sucursal', '').strip()
     
-    por_pagina = 10
-    
-    paquetes_query = db_session.query(Paquetes).filter(Paquetes.paquetes_productos.any())
-    
-    if filtro_fecha_desde:
-        try:
-            fecha_desde = datetime.strptime(filtro_fecha_desde, '%Y-%m-%d')
-            paquetes_query = paquetes_query.filter(Paquetes.fecha_creacion >= fecha_desde)
-        except ValueError:
-            pass
-    
-    if filtro_fecha_hasta:
-        try:
-            fecha_hasta = datetime.strptime(filtro_fecha_hasta, '%Y-%m-%d')
-            fecha_hasta = fecha_hasta.replace(hour=23, minute=59, second=59)
-            paquetes_query = paquetes_query.filter(Paquetes.fecha_creacion <= fecha_hasta)
-        except ValueError:
-            pass
-
-    if filtro_sucursal:
-        paquetes_query = paquetes_query.filter(Paquetes.sucursal.ilike(f'%{filtro_sucursal}%'))
-    
-    paquetes_paginados = paginate(paquetes_query, pagina, por_pagina)
-    
-    sucursales = db_session.query(Paquetes.sucursal).distinct().all()
-    sucursales = [s[0] for s in sucursales if s[0]]
+    def generar():
+        por_pagina = 10
+        
+        # Productos de la página en una sola consulta extra, sin imágenes
+        paquetes_query = db_session.query(Paquetes).options(
+            selectinload(Paquetes.paquetes_productos).joinedload(Paquetes_Productos.producto).load_only(
+                Productos.id_producto, Productos.nombre, Productos.codigo_barras, Productos.imagen_hash
+            )
+        ).filter(Paquetes.estado == Paquetes.CONFIRMADO)
+        
+        if filtro_fecha_desde:
+            try:
+                fecha_desde = datetime.datetime.strptime(filtro_fecha_desde, '%Y-%m-%d')
+                paquetes_query = paquetes_query.filter(Paquetes.fecha_creacion >= fecha_desde)
+            except ValueError:
+                pass
+        
+        if filtro_fecha_hasta:
+            try:
+                fecha_hasta = datetime.datetime.strptime(filtro_fecha_hasta, '%Y-%m-%d')
+                fecha_hasta = fecha_hasta.replace(hour=23, minute=59, second=59)
+                paquetes_query = paquetes_query.filter(Paquetes.fecha_creacion <= fecha_hasta)
+            except ValueError:
+                pass
+
+        if filtro_sucursal:
+            paquetes_query = paquetes_query.filter(Paquetes.sucursal.ilike(f'%{filtro_sucursal}%'))
+        
+        paquetes_paginados = paginate(paquetes_query, pagina, por_pagina, orden=[Paquetes.fecha_creacion, Paquetes.id_paquete],
+                                      cursor=request.args.get('cursor'), descendente=True)
+        
+        sucursales = [s.nombre for s in db_session.query(Sucursales.nombre).order_by(Sucursales.nombre)]
+        
+        return render_template('partials/packages_list.html', 
+                             paquetes=paquetes_paginados.items,
+                             pagination=paquetes_paginados,
+                             filtro_fecha_desde=filtro_fecha_desde,
+                             filtro_fecha_hasta=filtro_fecha_hasta,
+                             filtro_sucursal=filtro_sucursal,
+                             sucursales=sucursales)
     
     return render_template('pages/management_packages.html', 
-                         paquetes=paquetes_paginados.items,
-                         pagination=paquetes_paginados,
-                         filtro_fecha_desde=filtro_fecha_desde,
-                         filtro_fecha_hasta=filtro_fecha_hasta,
-                         filtro_sucursal=filtro_sucursal,
-                         sucursales=sucursales,
+                         contenido=fragmento_en_cache('packages', request.args, [PAQUETES], generar),
                          usuario=get_usuario_actual(),
                          perfil=get_perfil_usuario_actual())
 
@@ -682,11 +707,20 @@ def generate_package():
         if not productos_data: 
             return redirect(url_for('products'))
         
-        productos_seleccionados = json.loads(productos_data)
-        insuficientes = validar_stock_paquete(productos_seleccionados)
+        error_msg = None
+        try:
+            cantidades = agrupar_cantidades(json.loads(productos_data))
+        except CantidadInvalida as error:
+            producto = db_session.get(Productos, error.id_producto)
+            nombre = producto.nombre if producto else error.id_producto
+            error_msg = f"No se puede generar el paquete: la cantidad de {nombre} debe ser mayor que cero (se pidió {error.cantidad})"
+        else:
+            productos = cargar_productos(list(cantidades))
+            insuficientes = validar_stock(cantidades, productos)
+            if insuficientes:
+                error_msg = "No se puede generar el paquete ya que no hay suficiente stock para\n" + "\n".join([f"( {p['nombre']}: Solicitado {p['solicitado']}, Disponible {p['disponible']} )" for p in insuficientes])
         
-        if insuficientes:
-            error_msg = "No se puede generar el paquete ya que no hay suficiente stock para\n" + "\n".join([f"( {p['nombre']}: Solicitado {p['solicitado']}, Disponible {p['disponible']} )" for p in insuficientes])
+        if error_msg:
             pagina = request.args.get('pagina', 1, type=int)
             busqueda = request.args.get('busqueda', '').strip()
             
@@ -695,7 +729,7 @@ def generate_package():
             else:
                 productos_query = db_session.query(Productos)
                 
-            productos_paginados = paginate(productos_query, pagina, 10)
+            productos_paginados = paginate(productos_query, pagina, 10, orden=None if busqueda else [Productos.id_producto], cursor=request.args.get('cursor'))
             return render_template('pages/management_products.html', 
                                 productos=productos_paginados.items,
                                 pagination=productos_paginados,
@@ -708,23 +742,23 @@ def generate_package():
         db_session.add(paquete)
         db_session.flush()
         
-        productos_del_paquete = []
-        
-        for item in productos_seleccionados:
-            producto = db_session.query(Productos).filter_by(id_producto=item['id']).first()
-            if producto and producto.cantidad >= item['cantidad']:
-                paquete_producto = Paquetes_Productos(
-                    id_paquete=paquete.id_paquete,
-                    id_producto=producto.id_producto,
-                    cantidad=item['cantidad']
-                )
-                db_session.add(paquete_producto)
-                productos_del_paquete.append({
-                    'producto': producto,
-                    'cantidad': item['cantidad']
-                })
+        for id_producto, cantidad in cantidades.items():
+            db_session.add(Paquetes_Productos(
+                id_paquete=paquete.id_paquete,
+                id_producto=id_producto,
+                cantidad=cantidad
+            ))
         
         db_session.commit()
+        iniciar_barrido()
+        incrementar('paquetes_total', evento='generado')
+        
+        # Después del commit los productos se recargan juntos y no uno por uno desde la plantilla
+        productos = cargar_productos(list(cantidades))
+        productos_del_paquete = [
+            {'producto': productos[id_producto], 'cantidad': cantidad}
+            for id_producto, cantidad in cantidades.items()
+        ]
         
         return render_template('pages/confirm_package.html', 
                              paquete=paquete, 
@@ -732,8 +766,8 @@ def generate_package():
                              usuario=get_usuario_actual(),
                              perfil=get_perfil_usuario_actual())
         
-    except Exception as e:
-        print(f"Error generando paquete: {e}")
+    except Exception:
+        log.exception("Error generando paquete")
         db_session.rollback()
         return redirect(url_for('products'))
 
@@ -744,16 +778,15 @@ def confirm_package(id):
         sucursal = request.form.get('sucursal')
         
         if not sucursal:
-            paquete = db_session.query(Paquetes).filter_by(id_paquete=id).first()
+            paquete = db_session.query(Paquetes).options(
+                selectinload(Paquetes.paquetes_productos).joinedload(Paquetes_Productos.producto)
+            ).filter_by(id_paquete=id).first()
             productos_del_paquete = []
             if paquete:
-                for item in paquete.paquetes_productos:
-                    producto = db_session.query(Productos).filter_by(id_producto=item.id_producto).first()
-                    if producto:
-                        productos_del_paquete.append({
-                            'producto': producto,
-                            'cantidad': item.cantidad
-                        })
+                productos_del_paquete = [
+                    {'producto': item.producto, 'cantidad': item.cantidad}
+                    for item in paquete.paquetes_productos if item.producto
+                ]
             return render_template('pages/confirm_package.html', 
                                  paquete=paquete, 
                                  productos_del_paquete=productos_del_paquete,
@@ -761,24 +794,31 @@ def confirm_package(id):
                                  perfil=get_perfil_usuario_actual(),
                                  error="Por favor selecciona una sucursal")
         
-        paquete = db_session.query(Paquetes).filter_by(id_paquete=id).first()
+        # Solo un borrador se confirma, y una sola vez aunque lleguen dos envíos del formulario
+        paquete = db_session.query(Paquetes).filter_by(
+            id_paquete=id, estado=Paquetes.BORRADOR
+        ).with_for_update().first()
         if not paquete: 
-            return redirect(url_for('products'))
-        
-        paquete.sucursal = sucursal
+            return redirect(url_for('packages'))
         
         insuficientes = []
-        for item in paquete.paquetes_productos:
-            producto = db_session.query(Productos).filter_by(id_producto=item.id_producto).first()
-            if producto and producto.cantidad < item.cantidad:
-                insuficientes.append({
-                    'nombre': producto.nombre, 
-                    'solicitado': item.cantidad, 
-                    'disponible': producto.cantidad
-                })
+        try:
+            reservar_stock(
+                [{'id': item.id_producto, 'cantidad': item.cantidad} for item in paquete.paquetes_productos],
+                id_empleado=session.get('usuario_id'), id_paquete=paquete.id_paquete
+            )
+        except StockInsuficiente as e:
+            insuficientes = e.insuficientes
         
         if insuficientes:
-            db_session.delete(paquete)
+            # Se deshacen los bloqueos y cualquier descuento parcial antes de borrar el paquete
+            db_session.rollback()
+            # Sin el bloqueo, el barrido pudo borrarlo u otro envío confirmarlo mientras tanto
+            borrador = db_session.query(Paquetes).filter_by(
+                id_paquete=id, estado=Paquetes.BORRADOR
+            ).with_for_update().first()
+            if borrador:
+                db_session.delete(borrador)
             db_session.commit()
             error_msg = "Stock insuficiente:\n" + "\n".join([f"- {p['nombre']}: Solicitado {p['solicitado']}, Disponible {p['disponible']}" for p in insuficientes])
             pagina = request.args.get('pagina', 1, type=int)
@@ -789,7 +829,7 @@ def confirm_package(id):
             else:
                 productos_query = db_session.query(Productos)
                 
-            productos_paginados = paginate(productos_query, pagina, 10)
+            productos_paginados = paginate(productos_query, pagina, 10, orden=None if busqueda else [Productos.id_producto], cursor=request.args.get('cursor'))
             return render_template('pages/management_products.html', 
                                 productos=productos_paginados.items,
                                 pagination=productos_paginados,
@@ -798,23 +838,24 @@ def confirm_package(id):
                                 perfil=get_perfil_usuario_actual(),
                                 error=error_msg)
         
-        for item in paquete.paquetes_productos:
-            producto = db_session.query(Productos).filter_by(id_producto=item.id_producto).first()
-            if producto: 
-                producto.cantidad -= item.cantidad
-        
+        paquete.confirmar(sucursal)
+        registrar_sucursal(sucursal)
+        registrar_despacho(paquete, session.get('usuario_id'))
         db_session.commit()
+        invalidar_codigos([item.id_producto for item in paquete.paquetes_productos])
+        invalidar_fragmentos(PRODUCTOS, PAQUETES)
+        incrementar('paquetes_total', evento='confirmado', sucursal=sucursal)
         return redirect(url_for('packages'))
         
-    except Exception as e:
-        print(f"Error confirmando paquete: {e}")
+    except Exception:
+        log.exception("Error confirmando paquete", extra={'datos': {'id_paquete': id}})
         db_session.rollback()
         return redirect(url_for('products'))
 
 @app.route('/packages/cancel/<int:id>', methods=['POST'])
 @requiere_login
 def cancel_package(id):
-    paquete = db_session.query(Paquetes).filter_by(id_paquete=id).first()
+    paquete = db_session.query(Paquetes).filter_by(id_paquete=id, estado=Paquetes.BORRADOR).first()
     if paquete: 
         db_session.delete(paquete)
         db_session.commit()
@@ -826,8 +867,13 @@ def cancel_package(id):
 def delete_package(id):
     paquete = db_session.query(Paquetes).filter_by(id_paquete=id).first()
     if paquete:
+        quitar_despacho(paquete)
         db_session.delete(paquete)
+        if paquete.estado == Paquetes.CONFIRMADO:
+            db_session.flush()
+            quitar_sucursal(paquete.sucursal)
         db_session.commit()
+        invalidar_fragmentos(PAQUETES)
     return redirect(url_for('packages'))
 
 # ===== GESTIÓN DE EMPLEADOS =====
@@ -845,7 +891,7 @@ def employees():
     else:
         empleados_query = db_session.query(Empleados)
     
-    empleados_paginados = paginate(empleados_query, pagina, por_pagina)
+    empleados_paginados = paginate(empleados_query, pagina, por_pagina, orden=None if busqueda else [Empleados.id_empleado], cursor=request.args.get('cursor'))
     
     roles = db_session.query(Roles).all()
     return render_template('pages/management_employees.html', 
@@ -900,14 +946,17 @@ def add_employee():
         )
         foto_data = manejar_imagen(request.files.get('foto_perfil'))
         if foto_data: 
-            perfil.foto_perfil = foto_data
+            perfil.asignar_foto_perfil(foto_data)
         db_session.add(perfil)
         db_session.commit()
+        invalidar_fragmentos(EMPLEADOS)
+        if foto_data:
+            encolar_imagen(perfil, 'foto_perfil', foto_data)
         
-        print(f"Empleado {empleado.nombre_usuario} agregado exitosamente")
+        log.info("Empleado agregado", extra={'datos': {'usuario': empleado.nombre_usuario}})
         
-    except Exception as e: 
-        print(f"Error agregando empleado: {e}")
+    except Exception:
+        log.exception("Error agregando empleado")
         db_session.rollback()
     
     return redirect(url_for('employees'))
@@ -935,6 +984,7 @@ def edit_employee(id):
             
             # Actualiza el perfil
             perfil = empleado.perfil
+            foto_data = None
             if perfil:
                 campos_perfil = ['nombre', 'apellidoP', 'apellidoM', 'email', 'colonia', 'calle', 'no_exterior']
                 for campo in campos_perfil:
@@ -943,11 +993,14 @@ def edit_employee(id):
                 
                 foto_data = manejar_imagen(request.files.get('foto_perfil'))
                 if foto_data: 
-                    perfil.foto_perfil = foto_data
+                    perfil.asignar_foto_perfil(foto_data)
             
             db_session.commit()
-        except Exception as e: 
-            print(f"Error editando empleado: {e}")
+            invalidar_fragmentos(EMPLEADOS)
+            if perfil and foto_data:
+                encolar_imagen(perfil, 'foto_perfil', foto_data)
+        except Exception:
+            log.exception("Error editando empleado", extra={'datos': {'id_empleado': id}})
             db_session.rollback()
     
     return redirect(url_for('employees'))
@@ -963,41 +1016,25 @@ def delete_employee(id):
         puede_editar_empleado(usuario_actual, id)):
         db_session.delete(empleado)
         db_session.commit()
+        invalidar_fragmentos(EMPLEADOS)
     
     return redirect(url_for('employees'))
 
 # ===== RUTAS DE ARCHIVOS =====
 @app.route('/profile_picture/<int:usuario_id>')
 def profile_picture(usuario_id):
-    empleado = db_session.query(Empleados).filter_by(id_empleado=usuario_id).first()
-    if empleado and empleado.perfil and empleado.perfil.foto_perfil:
-        return Response(empleado.perfil.foto_perfil, mimetype='image/jpeg')
-    return redirect(url_for('static', filename='images/picture_profile_default.png'))
+    return servir_imagen(
+        Perfiles_Empleados.foto_perfil, Perfiles_Empleados.foto_perfil_clave,
+        Perfiles_Empleados.foto_perfil_hash, Perfiles_Empleados.foto_perfil_mimetype,
+        'images/picture_profile_default.png', id_empleado=usuario_id
+    )
 
 @app.route('/product_image/<int:producto_id>')
 def product_image(producto_id):
-    producto = db_session.query(Productos).filter_by(id_producto=producto_id).first()
-    if producto and producto.imagen:
-        try:
-            imagen = Image.open(BytesIO(producto.imagen))
-            formato = imagen.format.lower() if imagen.format else 'jpeg'
-            
-            mime_types = {
-                'jpeg': 'image/jpeg',
-                'jpg': 'image/jpeg', 
-                'png': 'image/png',
-                'gif': 'image/gif',
-                'webp': 'image/webp'
-            }
-            
-            mimetype = mime_types.get(formato, 'image/jpeg')
-            return Response(producto.imagen, mimetype=mimetype)
-            
-        except Exception as e:
-            print(f"Error detectando formato de imagen: {e}")
-            return Response(producto.imagen, mimetype='image/jpeg')
-    
-    return redirect(url_for('static', filename='images/product_default.png'))
+    return servir_imagen(
+        Productos.imagen, Productos.imagen_clave, Productos.imagen_hash, Productos.imagen_mimetype,
+        'images/product_default.png', id_producto=producto_id
+    )
 
 # ===== RUTAS DE PERFIL =====
 @app.route('/profile')
@@ -1020,6 +1057,7 @@ def profile_edit():
                 usuario.telefono = request.form['telefono']
             
             # Actualiza el perfil
+            foto_data = None
             if perfil:
                 campos_perfil = ['nombre', 'apellidoP', 'apellidoM', 'email', 'colonia', 'calle', 'no_exterior']
                 for campo in campos_perfil:
@@ -1028,12 +1066,15 @@ def profile_edit():
                 
                 foto_data = manejar_imagen(request.files.get('foto_perfil'))
                 if foto_data: 
-                    perfil.foto_perfil = foto_data
+                    perfil.asignar_foto_perfil(foto_data)
             
             db_session.commit()
+            invalidar_fragmentos(EMPLEADOS)
+            if perfil and foto_data:
+                encolar_imagen(perfil, 'foto_perfil', foto_data)
             return redirect(url_for('profile'))
-        except Exception as e: 
-            print(f"Error editando perfil: {e}")
+        except Exception:
+            log.exception("Error editando perfil")
     
     return render_template('auth/profile_edit.html', 
                          usuario=usuario, 
@@ -1044,7 +1085,7 @@ def profile_edit():
 def delete_profile_picture():
     perfil = get_perfil_usuario_actual()
     if perfil:
-        perfil.foto_perfil = None
+        perfil.asignar_foto_perfil(None)
         db_session.commit()
     return redirect(url_for('profile'))
 
@@ -1068,10 +1109,51 @@ def profile_other(id):
 def get_foto_perfil(usuario_id):
     return profile_picture(usuario_id)
 
+# ===== API =====
+@app.route('/api/productos/codigos')
+@requiere_sesion
+def api_codigos():
+    """
+    Búsqueda para el escáner: ?codigo=750...&codigo=751... (o separados por comas), hasta 100 por petición
+    """
+    codigos = [codigo.strip() for valor in request.args.getlist('codigo') for codigo in valor.split(',') if codigo.strip()]
+    if not codigos:
+        return jsonify({'error': 'Indica al menos un código'}), 400
+    codigos = list(dict.fromkeys(codigos))[:100]
+    productos = buscar_codigos(codigos)
+    return jsonify({
+        'productos': productos,
+        'no_encontrados': [codigo for codigo in codigos if codigo not in productos],
+    })
+
+# ===== ESTADO DEL SERVIDOR =====
+@app.route('/metrics')
+def metrics():
+    # Para Prometheus: se pide METRICAS_TOKEN; sin él solo responde a localhost si METRICAS_LOCAL=1
+    if not acceso_metricas():
+        return Response('Acceso denegado\n', status=403, mimetype='text/plain')
+    return Response(exponer(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/estado/pool')
+@requiere_login
+@requiere_rol('boss')
+def estado_pool():
+    # Ocupación y esperas del pool de conexiones de este proceso, para dimensionar los workers
+    return jsonify(get_estadisticas_pool())
+
+@app.route('/estado/consultas')
+@requiere_login
+@requiere_rol('boss')
+def estado_consultas():
+    # Consultas y tiempo en la base de datos por endpoint de este proceso
+    return jsonify(get_estadisticas_consultas())
+
 # ===== CONFIGURACIÓN =====
 @app.teardown_appcontext
 def shutdown_session(exception=None):
     db_session.remove()
 
+# Solo para desarrollo; en producción: gunicorn wsgi:app
 if __name__ == '__main__':
+    iniciar_barrido()
     app.run(debug=False)
\ No newline at end of file
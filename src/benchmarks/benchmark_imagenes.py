@@ -0,0 +1,100 @@
+# Benchmark del compresor de imágenes: codificaciones y tiempo de CPU contra el ciclo de calidades anterior
+# Uso (desde src): python -m benchmarks.benchmark_imagenes [carpeta_con_fotos]
+import os
+import sys
+import time
+from io import BytesIO
+from PIL import Image
+import imagenes
+
+def comprimir_imagen_anterior(imagen_data):
+    """
+    Ciclo de compresión original de manejar_imagen (85/70/55/40), como referencia
+    """
+    imagen = Image.open(BytesIO(imagen_data))
+    formato_original = imagen.format
+    formatos_sin_perdida = ['JPEG', 'PNG', 'WEBP']
+    if imagen.width > 600 or imagen.height > 600:
+        imagen.thumbnail((600, 600), Image.Resampling.LANCZOS)
+
+    calidad = 85
+    for intento in range(5):
+        output = BytesIO()
+        if formato_original in formatos_sin_perdida:
+            if formato_original == 'JPEG' and imagen.mode in ('RGBA', 'P'):
+                imagen = imagen.convert('RGB')
+            elif formato_original == 'PNG':
+                imagen.save(output, format='PNG', optimize=True)
+            else:
+                imagen.save(output, format=formato_original, optimize=True)
+        else:
+            if imagen.mode in ('RGBA', 'P'):
+                imagen = imagen.convert('RGB')
+            imagen.save(output, format='JPEG', quality=calidad, optimize=True)
+
+        imagen_comprimida = output.getvalue()
+        if len(imagen_comprimida) <= 1 * 1024 * 1024:
+            return imagen_comprimida
+        calidad -= 15
+        if calidad < 30:
+            break
+    return imagen_comprimida
+
+def generar_corpus():
+    """
+    Fotos sintéticas con ruido (poco compresibles) en los formatos que suben los empleados
+    """
+    corpus = {}
+    for nombre, lado, modo, formato in (
+        ('foto_celular.jpg', 4000, 'RGB', 'JPEG'),
+        ('foto_mediana.jpg', 2400, 'RGB', 'JPEG'),
+        ('captura.png', 1800, 'RGB', 'PNG'),
+        ('logo_transparente.png', 1600, 'RGBA', 'PNG'),
+        ('foto.webp', 3000, 'RGB', 'WEBP'),
+        ('textura.png', 700, 'RGBA', 'PNG'),
+    ):
+        ruido = Image.effect_noise((lado, lado), 60).convert(modo)
+        degradado = Image.linear_gradient('L').resize((lado, lado)).convert(modo)
+        imagen = Image.blend(ruido, degradado, 0.5)
+        if nombre == 'textura.png':
+            imagen = Image.frombytes(modo, (lado, lado), os.urandom(lado * lado * len(modo)))
+        output = BytesIO()
+        imagen.save(output, format=formato, quality=95)
+        corpus[nombre] = output.getvalue()
+    return corpus
+
+def cargar_corpus(carpeta):
+    corpus = {}
+    for nombre in sorted(os.listdir(carpeta)):
+        with open(os.path.join(carpeta, nombre), 'rb') as archivo:
+            corpus[nombre] = archivo.read()
+    return corpus
+
+def medir(funcion, datos):
+    codificaciones = 0
+    guardar = Image.Image.save
+
+    def guardar_contando(imagen, *args, **kwargs):
+        nonlocal codificaciones
+        codificaciones += 1
+        return guardar(imagen, *args, **kwargs)
+
+    Image.Image.save = guardar_contando
+    try:
+        inicio = time.process_time()
+        resultado = funcion(datos)
+        return codificaciones, time.process_time() - inicio, len(resultado)
+    finally:
+        Image.Image.save = guardar
+
+if __name__ == '__main__':
+    corpus = cargar_corpus(sys.argv[1]) if len(sys.argv) > 1 else generar_corpus()
+    print(f"{'imagen':<24}{'original':>10} | {'antes: cod  cpu(s)  bytes':>28} | {'ahora: cod  cpu(s)  bytes':>28}")
+    totales = [0, 0.0, 0, 0.0]
+    for nombre, datos in corpus.items():
+        antes = medir(comprimir_imagen_anterior, datos)
+        ahora = medir(imagenes.comprimir_imagen, datos)
+        totales[0] += antes[0]; totales[1] += antes[1]
+        totales[2] += ahora[0]; totales[3] += ahora[1]
+        print(f"{nombre:<24}{len(datos):>10} | {antes[0]:>10} {antes[1]:>7.3f} {antes[2]:>9} | {ahora[0]:>10} {ahora[1]:>7.3f} {ahora[2]:>9}")
+    print(f"{'total':<34} | {totales[0]:>10} {totales[1]:>7.3f} {'':>9} | {totales[2]:>10} {totales[3]:>7.3f}")
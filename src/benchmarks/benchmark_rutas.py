@@ -0,0 +1,245 @@
+# Benchmark de latencia de las rutas principales sobre una base local (SQLite por defecto o Postgres local)
+# Uso (desde src):
+#   python -m benchmarks.benchmark_rutas --sembrar                 (siembra 100k productos, 1M líneas, 500 empleados)
+#   python -m benchmarks.benchmark_rutas --escala 0.01 --sembrar   (lo mismo al 1%, para pruebas rápidas)
+#   python -m benchmarks.benchmark_rutas --guardar base            (guarda una referencia)
+#   python -m benchmarks.benchmark_rutas --comparar base           (compara contra ella; sale con 1 si hay regresión)
+# Todo corre sin red: el cliente de pruebas de Flask y un servidor HTTP en 127.0.0.1.
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+CARPETA = os.path.dirname(os.path.abspath(__file__))
+CARPETA_REFERENCIAS = os.path.join(CARPETA, 'referencias')
+RUTA_BD = os.path.join(CARPETA, 'benchmark.db')
+
+# ===== ESCENARIOS =====
+# nombre -> función(contexto, rng) que regresa (método, url, datos del formulario)
+ESCENARIOS = {
+    'home': lambda c, rng: ('GET', '/home', None),
+    'productos': lambda c, rng: ('GET', '/products', None),
+    'productos_pagina_final': lambda c, rng: ('GET', f"/products?pagina={c['paginas_productos']}", None),
+    'productos_busqueda': lambda c, rng: ('GET', f"/products?busqueda={quote(rng.choice(['Bistec', 'Molida 1', 'chorizo']))}", None),
+    'productos_codigo_barras': lambda c, rng: ('GET', f"/products?busqueda={rng.choice(c['codigos_barras'])}", None),
+    'paquetes': lambda c, rng: ('GET', '/packages', None),
+    'paquetes_sucursal': lambda c, rng: ('GET', f"/packages?filtro_sucursal={rng.choice(['Centro', 'Norte', 'Mercado'])}", None),
+    'empleados': lambda c, rng: ('GET', '/employees', None),
+    'imagen_producto': lambda c, rng: ('GET', rng.choice(c['imagenes']), None),
+    'generar_paquete': lambda c, rng: ('POST', '/packages/generate', {'productos_data': json.dumps(
+        [{'id': id_producto, 'cantidad': 1} for id_producto in rng.sample(c['ids_productos'], 3)]
+    )}),
+}
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados) + 0.5)) - 1))]
+
+def resumir(latencias, bytes_totales, consultas=None, segundos=None):
+    resumen = {
+        'peticiones': len(latencias),
+        'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+        'p95_ms': round(percentil(latencias, 95) * 1000, 2),
+        'p99_ms': round(percentil(latencias, 99) * 1000, 2),
+        'bytes': round(bytes_totales / len(latencias)) if latencias else 0,
+    }
+    if consultas is not None:
+        resumen['consultas'] = round(consultas / len(latencias), 2) if latencias else 0
+    if segundos:
+        resumen['peticiones_por_segundo'] = round(len(latencias) / segundos, 1)
+    return resumen
+
+def preparar_contexto():
+    from sqlalchemy import func
+    from database import db_session
+    from database.models import Productos
+    from paginacion import contar
+
+    total = contar(db_session.query(Productos))
+    ids = [fila[0] for fila in db_session.query(Productos.id_producto).order_by(func.random()).limit(500)]
+    con_imagen = db_session.query(Productos).filter(Productos.imagen_hash.isnot(None)).limit(50).all()
+    contexto = {
+        'paginas_productos': max(1, (total + 9) // 10),
+        'ids_productos': ids,
+        'codigos_barras': [fila[0] for fila in db_session.query(Productos.codigo_barras).filter(Productos.id_producto.in_(ids[:50]))],
+        'imagenes': [
+            f'/product_image/{p.id_producto}?v={p.imagen_hash}&size={lado}' for p in con_imagen for lado in (40, 120)
+        ] or ['/product_image/1'],
+    }
+    db_session.remove()
+    return contexto
+
+# ===== CLIENTE DE PRUEBAS (SECUENCIAL) =====
+def medir_cliente(app, contexto, escenarios, repeticiones, semilla):
+    from sqlalchemy import event
+    from database import engine
+    from benchmarks.datos_sinteticos import USUARIO_BENCHMARK, CONTRASEÑA_BENCHMARK
+
+    consultas = [0]
+    def contar_consulta(*args):
+        consultas[0] += 1
+    event.listen(engine, 'before_cursor_execute', contar_consulta)
+
+    cliente = app.test_client()
+    cliente.post('/login', data={'nombre_usuario': USUARIO_BENCHMARK, 'contraseña': CONTRASEÑA_BENCHMARK})
+    rng = random.Random(semilla)
+    resultados = {}
+    try:
+        for nombre in escenarios:
+            latencias, bytes_totales, consultas_totales = [], 0, 0
+            # Una petición de calentamiento que no se cuenta
+            metodo, url, datos = ESCENARIOS[nombre](contexto, rng)
+            cliente.open(url, method=metodo, data=datos)
+            for _ in range(repeticiones):
+                metodo, url, datos = ESCENARIOS[nombre](contexto, rng)
+                consultas[0] = 0
+                inicio = time.perf_counter()
+                respuesta = cliente.open(url, method=metodo, data=datos)
+                latencias.append(time.perf_counter() - inicio)
+                bytes_totales += len(respuesta.get_data())
+                consultas_totales += consultas[0]
+            resultados[nombre] = resumir(latencias, bytes_totales, consultas_totales)
+    finally:
+        event.remove(engine, 'before_cursor_execute', contar_consulta)
+    return resultados
+
+# ===== CARGA CONCURRENTE (HTTP LOCAL) =====
+def iniciar_servidor(app):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class PeticionSilenciosa(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    servidor = make_server('127.0.0.1', 0, app, threaded=True, request_handler=PeticionSilenciosa)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+def medir_carga(app, contexto, escenarios, repeticiones, concurrencia, semilla):
+    from benchmarks.datos_sinteticos import USUARIO_BENCHMARK, CONTRASEÑA_BENCHMARK
+
+    servidor = iniciar_servidor(app)
+    base = f'http://127.0.0.1:{servidor.server_port}'
+    cliente = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    cliente.open(base + '/login', urllib.parse.urlencode(
+        {'nombre_usuario': USUARIO_BENCHMARK, 'contraseña': CONTRASEÑA_BENCHMARK}
+    ).encode()).read()
+
+    def peticion(metodo, url, datos):
+        cuerpo = urllib.parse.urlencode(datos).encode() if datos else None
+        inicio = time.perf_counter()
+        with cliente.open(urllib.request.Request(base + url, data=cuerpo, method=metodo)) as respuesta:
+            tamaño = len(respuesta.read())
+        return time.perf_counter() - inicio, tamaño
+
+    rng = random.Random(semilla)
+    resultados = {}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrencia) as hilos:
+            for nombre in escenarios:
+                peticiones = [ESCENARIOS[nombre](contexto, rng) for _ in range(repeticiones * concurrencia)]
+                inicio = time.perf_counter()
+                medidas = list(hilos.map(lambda p: peticion(*p), peticiones))
+                segundos = time.perf_counter() - inicio
+                resultados[nombre] = resumir([m[0] for m in medidas], sum(m[1] for m in medidas), segundos=segundos)
+    finally:
+        servidor.shutdown()
+    return resultados
+
+# ===== REFERENCIAS =====
+def guardar_referencia(nombre, resultados):
+    os.makedirs(CARPETA_REFERENCIAS, exist_ok=True)
+    with open(os.path.join(CARPETA_REFERENCIAS, f'{nombre}.json'), 'w', encoding='utf-8') as archivo:
+        json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+
+def comparar_referencia(nombre, resultados, tolerancia):
+    """
+    Imprime la diferencia contra la referencia; regresa las regresiones (p95 o consultas por petición)
+    """
+    with open(os.path.join(CARPETA_REFERENCIAS, f'{nombre}.json'), encoding='utf-8') as archivo:
+        referencia = json.load(archivo)
+
+    regresiones = []
+    print(f"\nComparación contra '{nombre}' ({referencia.get('fecha', '?')}), tolerancia {tolerancia:.0%}")
+    for modo in ('cliente', 'carga'):
+        for escenario, actual in resultados.get(modo, {}).items():
+            anterior = referencia.get(modo, {}).get(escenario)
+            if not anterior:
+                continue
+            cambio = (actual['p95_ms'] - anterior['p95_ms']) / anterior['p95_ms'] if anterior['p95_ms'] else 0.0
+            marcas = []
+            if cambio > tolerancia:
+                marcas.append('p95')
+            if actual.get('consultas', 0) > anterior.get('consultas', 0):
+                marcas.append('consultas')
+            if marcas:
+                regresiones.append((modo, escenario, marcas))
+            print(f"  {modo:<8}{escenario:<26} p95 {anterior['p95_ms']:>9.2f} -> {actual['p95_ms']:>9.2f} ms ({cambio:+.0%})"
+                  + (f"  consultas {anterior.get('consultas')} -> {actual.get('consultas')}" if 'consultas' in actual else '')
+                  + (f"  REGRESIÓN ({', '.join(marcas)})" if marcas else ''))
+    return regresiones
+
+def imprimir(titulo, resultados):
+    print(f"\n{titulo}")
+    print(f"  {'escenario':<26}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'consultas':>11}{'bytes':>10}{'pet/s':>8}")
+    for nombre, r in resultados.items():
+        print(f"  {nombre:<26}{r['peticiones']:>6}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+              f"{r.get('consultas', '-'):>11}{r['bytes']:>10}{r.get('peticiones_por_segundo', '-'):>8}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark de las rutas de La Poblanita')
+    parser.add_argument('--base', default=f'sqlite:///{RUTA_BD}', help='URL de la base local (por defecto SQLite en benchmarks/)')
+    parser.add_argument('--sembrar', action='store_true', help='borra y vuelve a generar los datos sintéticos')
+    parser.add_argument('--escala', type=float, default=1.0, help='fracción del tamaño completo de los datos')
+    parser.add_argument('--escenarios', default=','.join(ESCENARIOS), help='lista separada por comas')
+    parser.add_argument('--repeticiones', type=int, default=30)
+    parser.add_argument('--concurrencia', type=int, default=8, help='0 para omitir la carga concurrente')
+    parser.add_argument('--semilla', type=int, default=2024)
+    parser.add_argument('--guardar', metavar='NOMBRE')
+    parser.add_argument('--comparar', metavar='NOMBRE')
+    parser.add_argument('--tolerancia', type=float, default=0.2, help='aumento de p95 permitido al comparar')
+    args = parser.parse_args()
+
+    # La URL se fija antes de importar la app para que el engine apunte a la base local
+    os.environ['DATABASE_URL'] = args.base
+    from app import app
+    from benchmarks.datos_sinteticos import sembrar
+
+    if args.sembrar or (args.base.startswith('sqlite:') and not os.path.exists(RUTA_BD)):
+        inicio = time.perf_counter()
+        totales = sembrar(
+            productos=max(10, int(100000 * args.escala)),
+            lineas_paquete=max(10, int(1000000 * args.escala)),
+            empleados=max(1, int(500 * args.escala)),
+            semilla=args.semilla,
+        )
+        print(f"Datos sembrados en {time.perf_counter() - inicio:.1f}s: {totales}")
+
+    escenarios = [e.strip() for e in args.escenarios.split(',') if e.strip()]
+    desconocidos = [e for e in escenarios if e not in ESCENARIOS]
+    if desconocidos:
+        parser.error(f"Escenarios desconocidos: {', '.join(desconocidos)}")
+
+    contexto = preparar_contexto()
+    resultados = {'fecha': time.strftime('%Y-%m-%d %H:%M:%S'), 'base': args.base.split('@')[-1], 'escala': args.escala}
+    resultados['cliente'] = medir_cliente(app, contexto, escenarios, args.repeticiones, args.semilla)
+    imprimir(f"Cliente de pruebas, {args.repeticiones} peticiones por escenario", resultados['cliente'])
+    if args.concurrencia > 0:
+        resultados['carga'] = medir_carga(app, contexto, escenarios, args.repeticiones, args.concurrencia, args.semilla)
+        imprimir(f"HTTP local, {args.concurrencia} clientes concurrentes", resultados['carga'])
+
+    if args.guardar:
+        guardar_referencia(args.guardar, resultados)
+        print(f"\nReferencia guardada en benchmarks/referencias/{args.guardar}.json")
+    if args.comparar:
+        sys.exit(1 if comparar_referencia(args.comparar, resultados, args.tolerancia) else 0)
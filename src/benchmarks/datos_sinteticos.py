@@ -0,0 +1,140 @@
+# Datos sintéticos para los benchmarks: productos, paquetes y empleados con fotos
+# Se insertan por lotes con los modelos de database.models sobre la base de DATABASE_URL
+import random
+from datetime import datetime, timedelta
+from io import BytesIO
+from PIL import Image
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+from database import db_session, engine
+from database.models import (
+    Base, Roles, Empleados, Perfiles_Empleados, Productos, Paquetes, Paquetes_Productos,
+    Imagenes_Variantes, calcular_hash_imagen, describir_imagen, generar_variantes_imagen
+)
+from almacen import guardar_blob
+from database.create_db import poblar_sucursales, registrar_saldos_iniciales
+from database.migraciones import migrar
+from tablero import reconstruir_resumenes
+
+USUARIO_BENCHMARK = 'benchmark'
+CONTRASEÑA_BENCHMARK = 'benchmark'
+SUCURSALES = ['Centro', 'Norte', 'Sur', 'Oriente', 'Poniente', 'Mercado', 'Plaza', 'Carretera']
+CORTES = ['Bistec', 'Molida', 'Costilla', 'Chuleta', 'Arrachera', 'Pechuga', 'Longaniza', 'Chorizo', 'Masa', 'Tortilla']
+LOTE = 10000
+
+def generar_imagenes(cantidad, lado, semilla):
+    """
+    Fotos JPEG distintas (ruido de colores); las filas las reparten para no inflar la base
+    """
+    rng = random.Random(semilla)
+    imagenes = []
+    for _ in range(cantidad):
+        color = tuple(rng.randrange(256) for _ in range(3))
+        imagen = Image.blend(Image.new('RGB', (lado, lado), color), Image.effect_noise((lado, lado), 40).convert('RGB'), 0.3)
+        output = BytesIO()
+        imagen.save(output, format='JPEG', quality=85)
+        descripcion = describir_imagen(output.getvalue())
+        descripcion['hash'] = calcular_hash_imagen(descripcion['datos'])
+        descripcion['clave'] = guardar_blob(descripcion['datos'], descripcion['mimetype'])
+        descripcion['variantes'] = generar_variantes_imagen(descripcion['datos'])
+        imagenes.append(descripcion)
+    return imagenes
+
+def columnas_imagen(prefijo, imagen):
+    if not imagen:
+        return {f'{prefijo}_clave': None, f'{prefijo}_hash': None, f'{prefijo}_mimetype': None,
+                f'{prefijo}_peso': None, f'{prefijo}_ancho': None, f'{prefijo}_alto': None}
+    return {
+        f'{prefijo}_clave': imagen['clave'],
+        f'{prefijo}_hash': imagen['hash'],
+        f'{prefijo}_mimetype': imagen['mimetype'],
+        f'{prefijo}_peso': imagen['peso'],
+        f'{prefijo}_ancho': imagen['ancho'],
+        f'{prefijo}_alto': imagen['alto'],
+    }
+
+def insertar(modelo, filas, columna_id=None):
+    """
+    INSERT de varias filas por lote; con `columna_id` regresa los ids generados en orden
+    """
+    ids = []
+    for inicio in range(0, len(filas), LOTE):
+        lote = filas[inicio:inicio + LOTE]
+        if columna_id is None:
+            db_session.execute(insert(modelo), lote)
+        else:
+            ids.extend(db_session.scalars(insert(modelo).returning(columna_id, sort_by_parameter_order=True), lote))
+    db_session.commit()
+    return ids
+
+def sembrar(productos=100000, lineas_paquete=1000000, empleados=500, semilla=2024):
+    # Borra y recrea todas las tablas: nunca contra una base remota
+    if engine.url.host not in (None, 'localhost', '127.0.0.1'):
+        raise RuntimeError(f"Los datos sintéticos solo se siembran en una base local, no en {engine.url.host}")
+    rng = random.Random(semilla)
+    Base.metadata.drop_all(bind=engine)
+    migrar()
+
+    roles = insertar(Roles, [{'nombre': nombre} for nombre in ('user', 'admin', 'boss')], Roles.id_rol)
+
+    # Las fotos se comparten entre filas, igual que sus miniaturas (por hash)
+    imagenes = generar_imagenes(50, 400, semilla)
+    for imagen in imagenes:
+        db_session.add_all(Imagenes_Variantes.crear_variantes(imagen['variantes'], imagen['hash']))
+    db_session.commit()
+
+    # Empleados: la contraseña se hashea una sola vez porque scrypt es lento a propósito
+    contraseña_hash = generate_password_hash(CONTRASEÑA_BENCHMARK)
+    ahora = datetime.utcnow()
+    filas_empleados = [{
+        'nombre_usuario': USUARIO_BENCHMARK if i == 0 else f'empleado{i:05d}',
+        'contraseña_hash': contraseña_hash,
+        'telefono': f'55{rng.randrange(10 ** 8):08d}',
+        'fecha_registro': ahora - timedelta(days=rng.randrange(1000)),
+        'activo': True,
+        'id_rol': roles[2] if i == 0 else rng.choice(roles),
+    } for i in range(max(1, empleados))]
+    ids_empleados = insertar(Empleados, filas_empleados, Empleados.id_empleado)
+    insertar(Perfiles_Empleados, [{
+        'id_empleado': id_empleado,
+        'nombre': f'Nombre{i}',
+        'apellidoP': rng.choice(CORTES) + 'ez',
+        'apellidoM': rng.choice(SUCURSALES) + 'a',
+        'email': f'empleado{i}@poblanita.test',
+        **columnas_imagen('foto_perfil', imagenes[i % len(imagenes)]),
+    } for i, id_empleado in enumerate(ids_empleados)])
+
+    # Productos: uno de cada diez con imagen
+    ids_productos = insertar(Productos, [{
+        'nombre': f'{rng.choice(CORTES)} {i}',
+        'cantidad': rng.randrange(1000, 100000),
+        'codigo_barras': f'75{i:011d}',
+        **columnas_imagen('imagen', imagenes[i % len(imagenes)] if i % 10 == 0 else None),
+    } for i in range(productos)], Productos.id_producto)
+
+    # Paquetes de 10 líneas con productos distintos, repartidos en el último año
+    por_paquete = min(10, len(ids_productos))
+    total_paquetes = max(1, lineas_paquete // por_paquete)
+    ids_paquetes = insertar(Paquetes, [{
+        'sucursal': rng.choice(SUCURSALES),
+        'fecha_creacion': ahora - timedelta(minutes=rng.randrange(525600)),
+        'estado': Paquetes.CONFIRMADO,
+    } for _ in range(total_paquetes)], Paquetes.id_paquete)
+    lineas = []
+    for id_paquete in ids_paquetes:
+        for id_producto in rng.sample(ids_productos, por_paquete):
+            lineas.append({'id_paquete': id_paquete, 'id_producto': id_producto, 'cantidad': rng.randrange(1, 6)})
+        if len(lineas) >= LOTE:
+            insertar(Paquetes_Productos, lineas)
+            lineas = []
+    insertar(Paquetes_Productos, lineas)
+
+    poblar_sucursales()
+    registrar_saldos_iniciales()
+    reconstruir_resumenes()
+    return {
+        'productos': len(ids_productos),
+        'paquetes': len(ids_paquetes),
+        'lineas_paquete': len(ids_paquetes) * por_paquete,
+        'empleados': len(ids_empleados),
+    }
@@ -0,0 +1,54 @@
+# Bitácora (logging) de la aplicación
+# Una línea JSON por evento con fecha, nivel, módulo y mensaje; los datos extra van en `datos`:
+#   log.info("Paquete confirmado", extra={'datos': {'id_paquete': 3}})
+# LOG_NIVEL (DEBUG, INFO, WARNING, ERROR) y LOG_FORMATO (json o texto) se leen del entorno.
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+LOG_NIVEL = os.getenv('LOG_NIVEL', 'INFO').upper()
+LOG_FORMATO = os.getenv('LOG_FORMATO', 'json')
+
+class FormatoJSON(logging.Formatter):
+    def format(self, registro):
+        evento = {
+            'fecha': datetime.fromtimestamp(registro.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': registro.levelname,
+            'modulo': registro.name,
+            'pid': registro.process,
+            'mensaje': registro.getMessage(),
+        }
+        datos = getattr(registro, 'datos', None)
+        if datos:
+            evento.update(datos)
+        if registro.exc_info:
+            evento['error'] = self.formatException(registro.exc_info)
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+class FormatoTexto(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s: %(message)s')
+
+    def format(self, registro):
+        texto = super().format(registro)
+        datos = getattr(registro, 'datos', None)
+        if datos:
+            texto += ' ' + ' '.join(f'{clave}={valor}' for clave, valor in datos.items())
+        return texto
+
+def configurar_bitacora():
+    raiz = logging.getLogger('poblanita')
+    if raiz.handlers:
+        return raiz
+    manejador = logging.StreamHandler(sys.stdout)
+    manejador.setFormatter(FormatoJSON() if LOG_FORMATO == 'json' else FormatoTexto())
+    raiz.addHandler(manejador)
+    raiz.setLevel(LOG_NIVEL)
+    raiz.propagate = False
+    return raiz
+
+def get_logger(nombre):
+    configurar_bitacora()
+    return logging.getLogger(f'poblanita.{nombre}')
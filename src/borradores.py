@@ -0,0 +1,79 @@
+# Barrido de los paquetes en borrador que nadie confirmó
+# generate_package guarda el paquete como borrador y confirm_package lo confirma; si el usuario cierra la
+# pestaña, el borrador se queda. Un hilo por worker (arranca en post_fork de gunicorn.conf.py) borra cada
+# BORRADORES_INTERVALO segundos, por lotes, los que tienen más de BORRADORES_TTL segundos (con el índice
+# parcial ix_paquetes_borradores).
+# Los borradores que otro proceso está confirmando o barriendo se saltan (FOR UPDATE SKIP LOCKED).
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from database import db_session
+from database.models import Paquetes, Paquetes_Productos
+from metricas import incrementar
+from bitacora import get_logger
+
+log = get_logger('borradores')
+
+BORRADORES_TTL = int(os.getenv('BORRADORES_TTL', 2 * 3600))
+BORRADORES_INTERVALO = int(os.getenv('BORRADORES_INTERVALO', 600))
+BORRADORES_LOTE = 500
+
+hilo_borradores = None
+pid_hilo = None
+candado_hilo = threading.Lock()
+
+def barrer_borradores(ttl=BORRADORES_TTL, lote=BORRADORES_LOTE):
+    """
+    Borra los borradores con más de `ttl` segundos, un commit por lote; regresa cuántos borró
+    """
+    limite = datetime.utcnow() - timedelta(seconds=ttl)
+    total = 0
+    while True:
+        ids = db_session.scalars(
+            select(Paquetes.id_paquete).where(
+                Paquetes.estado == Paquetes.BORRADOR, Paquetes.fecha_creacion < limite
+            ).order_by(Paquetes.fecha_creacion).limit(lote).with_for_update(skip_locked=True)
+        ).all()
+        if not ids:
+            break
+        db_session.execute(
+            delete(Paquetes_Productos).where(Paquetes_Productos.id_paquete.in_(ids)),
+            execution_options={'synchronize_session': False}
+        )
+        db_session.execute(
+            delete(Paquetes).where(Paquetes.id_paquete.in_(ids)),
+            execution_options={'synchronize_session': False}
+        )
+        db_session.commit()
+        total += len(ids)
+    if total:
+        incrementar('paquetes_total', total, evento='expirado')
+        log.info("Borradores de paquetes vencidos borrados", extra={'datos': {'paquetes': total, 'ttl_segundos': ttl}})
+    return total
+
+def barrer_periodicamente():
+    while True:
+        time.sleep(BORRADORES_INTERVALO)
+        try:
+            barrer_borradores()
+        except Exception:
+            log.exception("Error barriendo los borradores de paquetes")
+            db_session.rollback()
+        finally:
+            db_session.remove()
+
+def iniciar_barrido():
+    """
+    Arranca el hilo de barrido de este proceso si aún no existe (al arrancar cada worker; generar un
+    paquete lo vuelve a arrancar si se detuvo o si la app corre fuera de gunicorn)
+    """
+    global hilo_borradores, pid_hilo
+    with candado_hilo:
+        # Cada worker de gunicorn tiene su propio hilo; el del maestro no sobrevive al fork
+        if hilo_borradores is not None and pid_hilo == os.getpid() and hilo_borradores.is_alive():
+            return
+        pid_hilo = os.getpid()
+        hilo_borradores = threading.Thread(target=barrer_periodicamente, name='borradores', daemon=True)
+        hilo_borradores.start()
@@ -0,0 +1,100 @@
+# Buscadores de empleados, productos y paquetes
+# En Postgres los ILIKE '%termino%' se resuelven con índices GIN de trigramas (pg_trgm)
+# y los resultados se ordenan por similitud; en SQLite (pruebas) se usa LIKE normal.
+from sqlalchemy import case, func, or_, select, text, union
+from database import db_session, engine
+from database.models import Empleados, Perfiles_Empleados, Productos, Paquetes, Paquetes_Productos
+from codigos import buscar_codigos
+
+# (tabla, columna) con índice de trigramas, creados por create_db.py
+COLUMNAS_TRIGRAMA = [
+    ('productos', 'nombre'),
+    ('productos', 'codigo_barras'),
+    ('paquetes', 'sucursal'),
+    ('empleados', 'nombre_usuario'),
+    ('empleados', 'telefono'),
+    ('perfiles_empleados', 'nombre'),
+    ('perfiles_empleados', 'apellidoP'),
+    ('perfiles_empleados', 'apellidoM'),
+    ('perfiles_empleados', 'email'),
+]
+
+def es_postgres():
+    return engine.dialect.name == 'postgresql'
+
+def crear_indices_busqueda(conexion):
+    if conexion.dialect.name != 'postgresql':
+        return
+    quote = conexion.dialect.identifier_preparer.quote
+    conexion.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    for tabla, columna in COLUMNAS_TRIGRAMA:
+        nombre_indice = f'ix_{tabla}_{columna.lower()}_trgm'
+        conexion.execute(text(
+            f'CREATE INDEX IF NOT EXISTS {nombre_indice} ON {quote(tabla)} USING gin ({quote(columna)} gin_trgm_ops)'
+        ))
+
+def escapar_like(termino):
+    return termino.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def patron_busqueda(termino):
+    return f'%{escapar_like(termino)}%'
+
+def coincide(columna, termino):
+    return columna.ilike(patron_busqueda(termino), escape='\\')
+
+def relevancia(termino, *columnas):
+    """
+    Expresión para ordenar de más a menos relevante
+    """
+    if es_postgres():
+        return func.greatest(*[func.similarity(func.coalesce(c, ''), termino) for c in columnas]).desc()
+    # Sin pg_trgm: primero los que empiezan con el término
+    return case((or_(*[c.ilike(f'{escapar_like(termino)}%', escape='\\') for c in columnas]), 0), else_=1)
+
+def buscar_empleados(termino):
+    """
+    Buscador de empleados por nombre, apellidos, usuario, email o teléfono
+    """
+    # Cada rama filtra una sola tabla para que Postgres combine sus índices (BitmapOr)
+    ids = union(
+        select(Empleados.id_empleado).where(
+            coincide(Empleados.nombre_usuario, termino) | coincide(Empleados.telefono, termino)
+        ),
+        select(Perfiles_Empleados.id_empleado).where(
+            coincide(Perfiles_Empleados.nombre, termino) |
+            coincide(Perfiles_Empleados.apellidoP, termino) |
+            coincide(Perfiles_Empleados.apellidoM, termino) |
+            coincide(Perfiles_Empleados.email, termino)
+        )
+    )
+    return db_session.query(Empleados).filter(Empleados.id_empleado.in_(ids)).order_by(
+        relevancia(termino, Empleados.nombre_usuario), Empleados.id_empleado
+    )
+
+def buscar_productos(termino):
+    """
+    Buscador de productos por nombre o código de barras exacto (resuelto con el índice de codigos.py)
+    """
+    producto = buscar_codigos([termino]).get(termino)
+    if producto:
+        return db_session.query(Productos).filter(Productos.id_producto == producto['id'])
+    return db_session.query(Productos).filter(coincide(Productos.nombre, termino)).order_by(
+        relevancia(termino, Productos.nombre), Productos.id_producto
+    )
+
+def buscar_paquetes(termino):
+    """
+    Buscador de paquetes por ID, sucursal o productos contenidos
+    """
+    condiciones = [coincide(Paquetes.sucursal, termino)]
+
+    # Buscador por ID de paquete
+    if termino.isdigit():
+        condiciones.append(Paquetes.id_paquete == int(termino))
+    # Buscador por productos: semi-join con los paquetes que contienen productos con ese nombre
+    else:
+        condiciones.append(Paquetes.id_paquete.in_(
+            select(Paquetes_Productos.id_paquete).join(Productos).where(coincide(Productos.nombre, termino))
+        ))
+
+    return db_session.query(Paquetes).filter(or_(*condiciones)).filter(Paquetes.estado == Paquetes.CONFIRMADO)
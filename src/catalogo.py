@@ -0,0 +1,197 @@
+# Importación y exportación masiva de productos (CSV o XLSX)
+# La importación lee el archivo fila por fila y hace un INSERT ... ON CONFLICT (codigo_barras) por lote:
+# los productos nuevos se crean y los existentes actualizan nombre y cantidad. Las diferencias de stock
+# quedan en el historial de movimientos igual que en las altas y ediciones desde la página.
+# La exportación usa un cursor del lado del servidor, así que la memoria no crece con el catálogo.
+import csv
+import io
+import os
+from sqlalchemy import select
+from database import db_session, insert_upsert
+from database.models import Movimientos_Inventario, Productos
+from inventario import registrar_movimientos
+from codigos import invalidar_codigos
+from fragmentos import PAQUETES, PRODUCTOS, invalidar_fragmentos
+from bitacora import get_logger
+
+log = get_logger('catalogo')
+
+IMPORTACION_LOTE = int(os.getenv('IMPORTACION_LOTE', 2000))
+EXPORTACION_LOTE = 1000
+COLUMNAS = ('codigo_barras', 'nombre', 'cantidad')
+LARGO_MAXIMO = {'codigo_barras': 100, 'nombre': 100}
+
+class ErrorImportacion(Exception):
+    pass
+
+# ===== LECTURA =====
+def normalizar_encabezado(encabezado):
+    return [str(columna or '').strip().lower().replace(' ', '_') for columna in encabezado]
+
+def leer_csv(archivo):
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    muestra = texto.read(4096)
+    texto.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    yield from csv.reader(texto, dialecto)
+
+def leer_xlsx(archivo):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ErrorImportacion("Para importar archivos XLSX se necesita el paquete openpyxl")
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        yield from libro.active.iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+def leer_filas(archivo, nombre):
+    """
+    Regresa (número de fila, {columna: valor}) desde la segunda fila; la primera es el encabezado
+    """
+    lector = leer_xlsx(archivo) if nombre.lower().endswith('.xlsx') else leer_csv(archivo)
+    encabezado = normalizar_encabezado(next(lector, []))
+    faltantes = [columna for columna in COLUMNAS if columna not in encabezado]
+    if faltantes:
+        raise ErrorImportacion(f"Faltan las columnas: {', '.join(faltantes)}")
+    posiciones = {columna: encabezado.index(columna) for columna in COLUMNAS}
+    for numero, valores in enumerate(lector, 2):
+        valores = list(valores or [])
+        if not any(valor not in (None, '') for valor in valores):
+            continue
+        yield numero, {
+            columna: valores[posicion] if posicion < len(valores) else None
+            for columna, posicion in posiciones.items()
+        }
+
+def validar_fila(fila):
+    """
+    Regresa (producto, None) o (None, mensaje de error)
+    """
+    producto = {}
+    for columna in ('codigo_barras', 'nombre'):
+        valor = fila[columna]
+        # Excel guarda los códigos de barras numéricos como números
+        if isinstance(valor, float) and valor.is_integer():
+            valor = int(valor)
+        valor = str(valor).strip() if valor is not None else ''
+        if not valor:
+            return None, f"{columna} es obligatorio"
+        if len(valor) > LARGO_MAXIMO[columna]:
+            return None, f"{columna} tiene más de {LARGO_MAXIMO[columna]} caracteres"
+        producto[columna] = valor
+    try:
+        cantidad = float(str(fila['cantidad']).strip())
+    except ValueError:
+        return None, f"cantidad no es un número: {fila['cantidad']}"
+    if not cantidad.is_integer() or cantidad < 0:
+        return None, f"cantidad debe ser un entero mayor o igual a 0: {fila['cantidad']}"
+    producto['cantidad'] = int(cantidad)
+    return producto, None
+
+# ===== IMPORTACIÓN =====
+def importar_lote(productos, id_empleado=None):
+    """
+    Crea o actualiza el lote con un solo INSERT ... ON CONFLICT y registra los cambios de stock.
+    Regresa (creados, actualizados).
+    """
+    codigos = [producto['codigo_barras'] for producto in productos]
+    # Los existentes se bloquean (en orden) para que la diferencia de stock sea exacta
+    anteriores = dict(db_session.execute(
+        select(Productos.codigo_barras, Productos.cantidad)
+        .where(Productos.codigo_barras.in_(codigos))
+        .order_by(Productos.id_producto).with_for_update()
+    ).all())
+
+    sentencia = insert_upsert(Productos).values(productos)
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=['codigo_barras'],
+        set_={'nombre': sentencia.excluded.nombre, 'cantidad': sentencia.excluded.cantidad}
+    ).returning(Productos.id_producto, Productos.codigo_barras)
+    ids = {codigo: id_producto for id_producto, codigo in db_session.execute(sentencia)}
+
+    movimientos = []
+    for producto in productos:
+        anterior = anteriores.get(producto['codigo_barras'])
+        cambio = producto['cantidad'] - (anterior or 0)
+        if cambio:
+            movimientos.append({
+                'id_producto': ids[producto['codigo_barras']],
+                'tipo': Movimientos_Inventario.ENTRADA if anterior is None else Movimientos_Inventario.AJUSTE,
+                'cantidad': cambio,
+                'id_empleado': id_empleado,
+            })
+    registrar_movimientos(movimientos)
+    return len(productos) - len(anteriores), len(anteriores)
+
+def importar_productos(archivo, nombre, id_empleado=None, lote=IMPORTACION_LOTE):
+    """
+    Importa el archivo completo, un commit por lote. Las filas con errores se omiten y se reportan:
+    {'creados', 'actualizados', 'errores': [{'fila', 'codigo_barras', 'error'}]}
+    """
+    resultado = {'creados': 0, 'actualizados': 0, 'errores': []}
+    filas_por_codigo = {}
+    pendientes = []
+
+    def guardar():
+        try:
+            creados, actualizados = importar_lote(pendientes, id_empleado)
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        resultado['creados'] += creados
+        resultado['actualizados'] += actualizados
+        pendientes.clear()
+
+    try:
+        for numero, fila in leer_filas(archivo, nombre):
+            producto, error = validar_fila(fila)
+            if producto and producto['codigo_barras'] in filas_por_codigo:
+                # Un mismo INSERT ... ON CONFLICT no puede tocar dos veces la misma fila
+                error = f"código de barras repetido en la fila {filas_por_codigo[producto['codigo_barras']]}"
+            if error:
+                resultado['errores'].append({'fila': numero, 'codigo_barras': fila['codigo_barras'], 'error': error})
+                continue
+            filas_por_codigo[producto['codigo_barras']] = numero
+            pendientes.append(producto)
+            if len(pendientes) >= lote:
+                guardar()
+        if pendientes:
+            guardar()
+    finally:
+        # También si falla un lote: los anteriores ya tienen commit
+        if resultado['creados'] or resultado['actualizados']:
+            invalidar_codigos()
+            invalidar_fragmentos(PRODUCTOS, PAQUETES)
+
+    log.info("Productos importados", extra={'datos': {
+        'archivo': nombre, 'creados': resultado['creados'],
+        'actualizados': resultado['actualizados'], 'errores': len(resultado['errores']),
+    }})
+    return resultado
+
+# ===== EXPORTACIÓN =====
+def exportar_productos(lote=EXPORTACION_LOTE):
+    """
+    Genera el CSV por partes (sin imágenes) leyendo con un cursor del lado del servidor
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(('id_producto',) + COLUMNAS)
+    yield buffer.getvalue()
+
+    resultado = db_session.execute(
+        select(Productos.id_producto, Productos.codigo_barras, Productos.nombre, Productos.cantidad)
+        .order_by(Productos.id_producto)
+        .execution_options(stream_results=True, yield_per=lote)
+    )
+    for filas in resultado.partitions():
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows(filas)
+        yield buffer.getvalue()
@@ -0,0 +1,144 @@
+# Índice en memoria de códigos de barras para el escáner del mostrador
+# Cada proceso guarda codigo_barras -> {id, nombre, cantidad} de todos los productos (se carga al primer uso).
+# Lo que cambia productos llama a invalidar_codigos después del commit; la invalidación también se
+# agrega a un archivo en CODIGOS_DIR que los demás procesos (workers de gunicorn, importaciones desde
+# la terminal) revisan con un os.stat antes de cada búsqueda, así que ninguno responde con stock viejo.
+import os
+import tempfile
+import threading
+from database import db_session
+from database.models import Productos
+from metricas import incrementar
+
+CODIGOS_DIR = os.getenv('CODIGOS_DIR', os.path.join(tempfile.gettempdir(), 'la_poblanita_codigos'))
+TAMAÑO_MAXIMO_INVALIDACIONES = 1024 * 1024
+TODOS = '*'
+
+por_codigo = {}
+codigo_de = {}
+cargado = False
+# Aumenta con cada invalidación; lo leído de la base no se guarda si cambió mientras tanto
+generacion = 0
+candado_indice = threading.Lock()
+
+# Hasta dónde se leyó el archivo de invalidaciones (si cambia el inodo, se rotó y se recarga todo)
+posicion = 0
+inodo = None
+
+def ruta_invalidaciones():
+    return os.path.join(CODIGOS_DIR, 'invalidaciones.log')
+
+def guardar(id_producto, codigo_barras, nombre, cantidad):
+    quitar(id_producto)
+    por_codigo[codigo_barras] = {'id': id_producto, 'nombre': nombre, 'cantidad': cantidad}
+    codigo_de[id_producto] = codigo_barras
+
+def quitar(id_producto):
+    codigo = codigo_de.pop(id_producto, None)
+    if codigo is not None:
+        por_codigo.pop(codigo, None)
+
+def aplicar_invalidacion(ids):
+    global cargado, generacion
+    generacion += 1
+    if ids is None:
+        cargado = False
+        return
+    for id_producto in ids:
+        quitar(id_producto)
+
+def estado_archivo():
+    try:
+        estado = os.stat(ruta_invalidaciones())
+    except FileNotFoundError:
+        return None, 0
+    return estado.st_ino, estado.st_size
+
+def sincronizar():
+    """
+    Aplica las invalidaciones que otros procesos agregaron al archivo desde la última lectura
+    """
+    global posicion, inodo
+    if not CODIGOS_DIR:
+        return
+    inodo_actual, tamaño = estado_archivo()
+    if inodo_actual != inodo:
+        if inodo is not None or posicion:
+            aplicar_invalidacion(None)
+            return
+        # El archivo se creó después de cargar el índice: se lee desde el principio
+        inodo = inodo_actual
+    if tamaño <= posicion:
+        return
+    with open(ruta_invalidaciones(), 'rb') as archivo:
+        archivo.seek(posicion)
+        nuevo = archivo.read(tamaño - posicion)
+    # Solo hasta la última línea completa
+    completo = nuevo[:nuevo.rfind(b'\n') + 1]
+    posicion += len(completo)
+    for linea in completo.decode().split():
+        aplicar_invalidacion(None if linea == TODOS else [int(linea)])
+
+def cargar_indice():
+    global cargado, posicion, inodo
+    # El estado del archivo se toma antes de leer: lo que llegue durante la carga se aplica después
+    if CODIGOS_DIR:
+        inodo, posicion = estado_archivo()
+    por_codigo.clear()
+    codigo_de.clear()
+    for fila in db_session.query(Productos.id_producto, Productos.codigo_barras, Productos.nombre, Productos.cantidad):
+        guardar(*fila)
+    cargado = True
+
+def buscar_codigos(codigos):
+    """
+    {codigo_barras: {id, nombre, cantidad}} de los códigos que existen. Los que no están en el
+    índice (productos agregados o editados recién) se buscan en la base y se agregan.
+    """
+    with candado_indice:
+        sincronizar()
+        if not cargado:
+            cargar_indice()
+        encontrados = {codigo: dict(por_codigo[codigo]) for codigo in codigos if codigo in por_codigo}
+        generacion_consulta = generacion
+    faltantes = [codigo for codigo in codigos if codigo not in encontrados]
+    incrementar('codigos_busquedas_total', len(encontrados), origen='memoria')
+    if not faltantes:
+        return encontrados
+
+    filas = db_session.query(
+        Productos.id_producto, Productos.codigo_barras, Productos.nombre, Productos.cantidad
+    ).filter(Productos.codigo_barras.in_(faltantes)).all()
+    with candado_indice:
+        sincronizar()
+        for fila in filas:
+            if generacion == generacion_consulta:
+                guardar(*fila)
+            encontrados[fila.codigo_barras] = {'id': fila.id_producto, 'nombre': fila.nombre, 'cantidad': fila.cantidad}
+    incrementar('codigos_busquedas_total', len(filas), origen='base')
+    incrementar('codigos_busquedas_total', len(faltantes) - len(filas), origen='no_encontrado')
+    return encontrados
+
+def invalidar_codigos(ids=None):
+    """
+    Después del commit que cambió esos productos (o todos con ids=None), en este proceso y en los demás
+    """
+    with candado_indice:
+        aplicar_invalidacion(ids)
+    if not CODIGOS_DIR:
+        return
+    os.makedirs(CODIGOS_DIR, exist_ok=True)
+    ruta = ruta_invalidaciones()
+    if estado_archivo()[1] > TAMAÑO_MAXIMO_INVALIDACIONES:
+        # Un archivo nuevo (otro inodo) hace que cada proceso recargue su índice
+        with open(ruta + f'.{os.getpid()}.tmp', 'wb') as archivo:
+            archivo.write(f'{TODOS}\n'.encode())
+        os.replace(ruta + f'.{os.getpid()}.tmp', ruta)
+        return
+    linea = TODOS if ids is None else ' '.join(str(id_producto) for id_producto in ids)
+    # Una sola escritura con O_APPEND: las líneas de procesos distintos no se mezclan
+    descriptor = os.open(ruta, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(descriptor, f'{linea}\n'.encode())
+    finally:
+        os.close(descriptor)
@@ -0,0 +1,194 @@
+# Envío de correos en segundo plano
+# Las rutas solo encolan el mensaje de Flask-Mail y regresan; un hilo por proceso los envía por lotes
+# reusando la misma conexión SMTP, que se cierra tras CORREO_INACTIVIDAD segundos sin correos.
+# Si un envío falla se reintenta con espera exponencial hasta CORREO_REINTENTOS veces.
+# CORREO_DESTINO elige a dónde van: smtp (por defecto), archivo (.eml en CORREO_DIR) o memoria (pruebas).
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from metricas import incrementar, fijar, registrar_recolector
+from bitacora import get_logger
+
+log = get_logger('correos')
+
+CORREO_DESTINO = os.getenv('CORREO_DESTINO', 'smtp')
+CORREO_DIR = os.getenv('CORREO_DIR', os.path.join(os.path.dirname(__file__), 'correos_enviados'))
+CORREO_LOTE = int(os.getenv('CORREO_LOTE', 20))
+CORREO_REINTENTOS = int(os.getenv('CORREO_REINTENTOS', 5))
+CORREO_ESPERA_BASE = float(os.getenv('CORREO_ESPERA_BASE', 2))
+CORREO_ESPERA_MAXIMA = float(os.getenv('CORREO_ESPERA_MAXIMA', 300))
+CORREO_INACTIVIDAD = float(os.getenv('CORREO_INACTIVIDAD', 30))
+
+# ===== DESTINOS =====
+class DestinoSMTP:
+    # Mantiene abierta la conexión de Flask-Mail entre lotes
+    def __init__(self, correo):
+        self.correo = correo
+        self.pila = None
+        self.conexion = None
+
+    def enviar(self, mensaje):
+        if self.conexion is None:
+            self.pila = ExitStack()
+            self.conexion = self.pila.enter_context(self.correo.connect())
+        self.conexion.send(mensaje)
+
+    def cerrar(self):
+        if self.pila is None:
+            return
+        pila, self.pila, self.conexion = self.pila, None, None
+        try:
+            pila.close()
+        except Exception:
+            # El servidor pudo haber cerrado la conexión antes
+            log.debug("La conexión SMTP ya estaba cerrada")
+
+class DestinoArchivo:
+    # Un .eml por mensaje, para revisar los correos sin servidor SMTP
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self.numero = itertools.count(1)
+
+    def enviar(self, mensaje):
+        os.makedirs(self.directorio, exist_ok=True)
+        nombre = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{next(self.numero)}.eml"
+        with open(os.path.join(self.directorio, nombre), 'wb') as archivo:
+            archivo.write(mensaje.as_bytes())
+
+    def cerrar(self):
+        pass
+
+class DestinoMemoria:
+    def __init__(self):
+        self.enviados = []
+
+    def enviar(self, mensaje):
+        self.enviados.append(mensaje)
+
+    def cerrar(self):
+        pass
+
+def crear_destino(correo):
+    if CORREO_DESTINO == 'archivo':
+        return DestinoArchivo(CORREO_DIR)
+    if CORREO_DESTINO == 'memoria':
+        return DestinoMemoria()
+    return DestinoSMTP(correo)
+
+# ===== COLA =====
+aplicacion = None
+destino = None
+
+# Montículo de (momento en que se puede enviar, secuencia, intento, mensaje)
+pendientes = []
+secuencia = itertools.count()
+condicion = threading.Condition()
+enviando = 0
+hilo_correos = None
+pid_hilo = None
+
+def encolar_correo(mensaje, momento=None, intento=0):
+    """
+    Agrega el mensaje a la cola de este proceso y regresa de inmediato
+    """
+    with condicion:
+        heapq.heappush(pendientes, (momento or time.monotonic(), next(secuencia), intento, mensaje))
+        condicion.notify()
+    iniciar_hilo()
+
+def iniciar_hilo():
+    # Se crea al primer uso para que cada worker de gunicorn tenga su propio hilo
+    global hilo_correos, pid_hilo
+    with condicion:
+        if hilo_correos is not None and pid_hilo == os.getpid() and hilo_correos.is_alive():
+            return
+        pid_hilo = os.getpid()
+        hilo_correos = threading.Thread(target=despachar_correos, name='correos', daemon=True)
+        hilo_correos.start()
+
+def tomar_lote():
+    """
+    Espera hasta que haya correos listos y toma hasta CORREO_LOTE; lista vacía si pasó el tiempo de inactividad
+    """
+    global enviando
+    with condicion:
+        while True:
+            ahora = time.monotonic()
+            if pendientes and pendientes[0][0] <= ahora:
+                lote = []
+                while pendientes and pendientes[0][0] <= ahora and len(lote) < CORREO_LOTE:
+                    lote.append(heapq.heappop(pendientes))
+                enviando = len(lote)
+                return lote
+            espera = pendientes[0][0] - ahora if pendientes else CORREO_INACTIVIDAD
+            if not condicion.wait(espera) and not pendientes:
+                return []
+
+def reintentar(mensaje, intento, error):
+    if intento >= CORREO_REINTENTOS:
+        incrementar('correos_total', estado='fallido')
+        log.error("No se pudo enviar el correo", extra={'datos': {
+            'asunto': mensaje.subject, 'destinatarios': list(mensaje.recipients), 'intentos': intento + 1, 'error': str(error),
+        }})
+        return
+    espera = min(CORREO_ESPERA_BASE * 2 ** intento, CORREO_ESPERA_MAXIMA)
+    incrementar('correos_total', estado='reintento')
+    log.warning("Falló el envío del correo, se reintentará", extra={'datos': {
+        'asunto': mensaje.subject, 'intento': intento + 1, 'espera_segundos': espera, 'error': str(error),
+    }})
+    encolar_correo(mensaje, time.monotonic() + espera, intento + 1)
+
+def enviar_lote(lote):
+    global enviando
+    for i, (_, _, intento, mensaje) in enumerate(lote):
+        try:
+            destino.enviar(mensaje)
+            incrementar('correos_total', estado='enviado')
+        except Exception as e:
+            # Una conexión rota no sirve para el resto del lote
+            destino.cerrar()
+            reintentar(mensaje, intento, e)
+        finally:
+            with condicion:
+                enviando = len(lote) - i - 1
+                condicion.notify_all()
+
+def despachar_correos():
+    while True:
+        lote = tomar_lote()
+        if not lote:
+            destino.cerrar()
+            continue
+        try:
+            with aplicacion.app_context():
+                enviar_lote(lote)
+        except Exception:
+            log.exception("Error inesperado en el hilo de correos")
+
+def esperar_correos(segundos):
+    """
+    Espera a que se vacíe la cola (sin contar los reintentos programados más allá del plazo)
+    """
+    limite = time.monotonic() + segundos
+    with condicion:
+        while enviando or (pendientes and pendientes[0][0] <= limite):
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return False
+            condicion.wait(min(restante, 0.1))
+    return True
+
+def correos_en_cola():
+    with condicion:
+        return len(pendientes) + enviando
+
+def instalar_correos(app, correo):
+    global aplicacion, destino
+    aplicacion = app
+    destino = crear_destino(correo)
+    registrar_recolector(lambda: fijar('correos_en_cola', correos_en_cola()))
+    return destino
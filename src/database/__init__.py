@@ -1,7 +1,12 @@
 # Base de datos Supabase
 
-from sqlalchemy import create_engine, MetaData
+import threading
+import time
+from contextvars import ContextVar
+from sqlalchemy import create_engine, event, MetaData
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
 
 from dotenv import load_dotenv
 import os
@@ -14,8 +19,188 @@ DB_HOST = os.getenv('DB_HOST')
 DB_PORT = os.getenv('DB_PORT')
 DB_NAME = os.getenv('DB_NAME')
 
-engine = create_engine(f'postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
+# DATABASE_URL reemplaza a las variables DB_* (p. ej. sqlite:///... para pruebas locales)
+DATABASE_URL = os.getenv('DATABASE_URL') or f'postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+
+# ===== POOL DE CONEXIONES =====
+# El puerto 6543 de Supabase es PgBouncer en modo transacción: las conexiones se comparten entre
+# transacciones, así que los SET de sesión no duran y el pooler limita el total de conexiones.
+# Con DB_POOL=null cada petición abre y cierra su conexión y el único pool es el de PgBouncer;
+# con DB_POOL=queue cada proceso guarda hasta DB_POOL_SIZE + DB_MAX_OVERFLOW conexiones.
+DB_POOL = os.getenv('DB_POOL', 'queue')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 300))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 15000))
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', '1' if DB_PORT == '6543' else '0') == '1'
+# Detrás de PgBouncer el límite va en el rol (ALTER ROLE <usuario> SET statement_timeout = 15000, ver README);
+# con DB_TIMEOUT_SET_LOCAL=1 se manda además un SET LOCAL al iniciar cada transacción (una ida y vuelta más)
+DB_TIMEOUT_SET_LOCAL = os.getenv('DB_TIMEOUT_SET_LOCAL', '0') == '1'
+
+estadisticas_pool = {
+    'conexiones': 0,
+    'checkouts': 0,
+    'esperas': 0,
+    'espera_total': 0.0,
+    'espera_maxima': 0.0,
+    'timeouts': 0,
+}
+candado_estadisticas = threading.Lock()
+
+class PoolMedido(QueuePool):
+    """
+    QueuePool que mide cuánto espera cada petición por una conexión libre
+    """
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with candado_estadisticas:
+                estadisticas_pool['timeouts'] += 1
+            raise
+        finally:
+            espera = time.perf_counter() - inicio
+            with candado_estadisticas:
+                estadisticas_pool['esperas'] += 1
+                estadisticas_pool['espera_total'] += espera
+                estadisticas_pool['espera_maxima'] = max(estadisticas_pool['espera_maxima'], espera)
+
+def opciones_engine(url):
+    if url.get_backend_name() == 'sqlite':
+        return {}
+
+    opciones = {'pool_pre_ping': DB_POOL_PRE_PING}
+    if DB_POOL == 'null':
+        opciones['poolclass'] = NullPool
+    else:
+        opciones.update(
+            poolclass=PoolMedido,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_use_lifo=True,
+        )
+    # PgBouncer en modo transacción no acepta parámetros de arranque; ahí el límite es el del rol
+    if DB_STATEMENT_TIMEOUT and not DB_PGBOUNCER:
+        opciones['connect_args'] = {'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'}
+    return opciones
+
+url = make_url(DATABASE_URL)
+engine = create_engine(url, **opciones_engine(url))
+
+@event.listens_for(engine, 'connect')
+def contar_conexion(conexion_dbapi, registro):
+    with candado_estadisticas:
+        estadisticas_pool['conexiones'] += 1
+
+@event.listens_for(engine, 'checkout')
+def contar_checkout(conexion_dbapi, registro, proxy):
+    with candado_estadisticas:
+        estadisticas_pool['checkouts'] += 1
+
+if DB_STATEMENT_TIMEOUT and DB_PGBOUNCER and DB_TIMEOUT_SET_LOCAL and url.get_backend_name() == 'postgresql':
+    @event.listens_for(engine, 'begin')
+    def limitar_duracion(conexion):
+        conexion.exec_driver_sql(f'SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT}')
+
+def get_estadisticas_pool():
+    """
+    Contadores del pool de este proceso más su ocupación actual
+    """
+    with candado_estadisticas:
+        estadisticas = dict(estadisticas_pool)
+    pool = engine.pool
+    estadisticas['tipo'] = type(pool).__name__
+    if isinstance(pool, QueuePool):
+        estadisticas.update(
+            tamaño=pool.size(),
+            en_uso=pool.checkedout(),
+            libres=pool.checkedin(),
+            overflow=max(0, pool.overflow()),
+            maximo=pool.size() + DB_MAX_OVERFLOW,
+        )
+    estadisticas['espera_promedio'] = estadisticas['espera_total'] / estadisticas['esperas'] if estadisticas['esperas'] else 0.0
+    return estadisticas
+
+# ===== PERFIL DE CONSULTAS =====
+# Cada petición coloca aquí su PerfilConsultas (ver perfilador.py); fuera de una petición no se mide nada.
+# Con DB_EXPLAIN_MS > 0 se guarda el plan de los SELECT que tarden al menos esos milisegundos.
+DB_EXPLAIN_MS = float(os.getenv('DB_EXPLAIN_MS', 0))
+CONSULTAS_LENTAS = 3
+
+perfil_actual = ContextVar('perfil_consultas', default=None)
+
+class PerfilConsultas:
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo = 0.0
+        self.lentas = []
+
+    def registrar(self, sentencia, duracion, plan=None):
+        self.consultas += 1
+        self.tiempo += duracion
+        # Solo las más lentas, de mayor a menor: [(duración, sentencia, plan)]
+        if len(self.lentas) < CONSULTAS_LENTAS or duracion > self.lentas[-1][0]:
+            self.lentas.append((duracion, sentencia, plan))
+            self.lentas.sort(key=lambda consulta: consulta[0], reverse=True)
+            del self.lentas[CONSULTAS_LENTAS:]
+
+def explicar_consulta(conexion_dbapi, sentencia, parametros):
+    """
+    Plan de ejecución de la sentencia con un cursor aparte (sin pasar por los eventos del engine)
+    """
+    es_sqlite = engine.dialect.name == 'sqlite'
+    cursor = conexion_dbapi.cursor()
+    try:
+        # En Postgres un error aborta la transacción; el savepoint lo aísla
+        if not es_sqlite:
+            cursor.execute('SAVEPOINT explicar_consulta')
+        try:
+            cursor.execute(('EXPLAIN QUERY PLAN ' if es_sqlite else 'EXPLAIN ') + sentencia, parametros)
+            plan = '\n'.join(' '.join(str(valor) for valor in fila) for fila in cursor.fetchall())
+        except Exception as e:
+            if not es_sqlite:
+                cursor.execute('ROLLBACK TO SAVEPOINT explicar_consulta')
+            return f'Sin plan: {e}'
+        if not es_sqlite:
+            cursor.execute('RELEASE SAVEPOINT explicar_consulta')
+        return plan
+    finally:
+        cursor.close()
+
+@event.listens_for(engine, 'before_cursor_execute')
+def iniciar_consulta(conexion, cursor, sentencia, parametros, contexto, executemany):
+    if contexto is not None and perfil_actual.get() is not None:
+        contexto.inicio_consulta = time.perf_counter()
+
+@event.listens_for(engine, 'after_cursor_execute')
+def terminar_consulta(conexion, cursor, sentencia, parametros, contexto, executemany):
+    perfil = perfil_actual.get()
+    inicio = getattr(contexto, 'inicio_consulta', None)
+    if perfil is None or inicio is None:
+        return
+    duracion = time.perf_counter() - inicio
+    plan = None
+    if (DB_EXPLAIN_MS and duracion * 1000 >= DB_EXPLAIN_MS and not executemany
+            and sentencia.lstrip().upper().startswith('SELECT')):
+        plan = explicar_consulta(cursor.connection, sentencia, parametros)
+    perfil.registrar(sentencia, duracion, plan)
+
+# ===== UPSERTS =====
+def insert_upsert(modelo):
+    """
+    INSERT del dialecto en uso, que admite on_conflict_do_update (Postgres y SQLite para pruebas)
+    """
+    if engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(modelo)
 
 
 db_session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
-metadata = MetaData()
\ No newline at end of file
+metadata = MetaData()
@@ -0,0 +1,9 @@
+# Archivo para borrar los paquetes en borrador que nadie confirmó
+# La aplicación ya los barre sola (ver borradores.py); esto sirve para un cron o para cambiar el plazo:
+#   python -m database.barrer_borradores [segundos]
+import sys
+from borradores import BORRADORES_TTL, barrer_borradores
+
+if __name__ == '__main__':
+    ttl = int(sys.argv[1]) if len(sys.argv) > 1 else BORRADORES_TTL
+    print(f"Borradores de paquetes borrados: {barrer_borradores(ttl)}.")
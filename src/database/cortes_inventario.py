@@ -0,0 +1,7 @@
+# Archivo para guardar los cortes de inventario
+# Se ejecuta periódicamente (p. ej. cada noche con cron) para que las consultas de stock
+# a una fecha partan del último corte y no de todo el historial de movimientos
+from inventario import crear_cortes
+
+if __name__ == '__main__':
+    print(f"Cortes de inventario guardados para {crear_cortes()} productos.")
@@ -1,7 +1,83 @@
 # Archivo para crear la base de datos
-from database.models import Base
-from database import engine
+from datetime import datetime
+from sqlalchemy import exists, func, insert, literal, select
+from database.models import Productos, Perfiles_Empleados, Paquetes, Sucursales, Movimientos_Inventario, Resumen_Despachos_Diarios, calcular_hash_imagen, describir_imagen
+from database import db_session
+from database.migraciones import migrar
+from tablero import reconstruir_resumenes
+from bitacora import get_logger
+
+log = get_logger('create_db')
+
+def completar_metadatos_imagenes(lote=100):
+    """
+    Calcula hash, tipo MIME, peso y dimensiones de las imágenes guardadas antes de existir esas columnas
+    """
+    for modelo, columna_id, prefijo in (
+        (Productos, Productos.id_producto, 'imagen'),
+        (Perfiles_Empleados, Perfiles_Empleados.id_perfil_empleado, 'foto_perfil'),
+    ):
+        columna_datos = getattr(modelo, prefijo)
+        while True:
+            filas = db_session.query(columna_id, columna_datos).filter(
+                columna_datos.isnot(None),
+                getattr(modelo, f'{prefijo}_hash').is_(None) | getattr(modelo, f'{prefijo}_mimetype').is_(None)
+            ).limit(lote).all()
+            if not filas:
+                break
+            actualizaciones = []
+            for id_fila, datos in filas:
+                imagen = describir_imagen(datos)
+                actualizaciones.append({
+                    columna_id.key: id_fila,
+                    f'{prefijo}_hash': calcular_hash_imagen(datos),
+                    f'{prefijo}_mimetype': imagen['mimetype'],
+                    f'{prefijo}_peso': imagen['peso'],
+                    f'{prefijo}_ancho': imagen['ancho'],
+                    f'{prefijo}_alto': imagen['alto'],
+                })
+            db_session.bulk_update_mappings(modelo, actualizaciones)
+            db_session.commit()
+
+def poblar_sucursales():
+    """
+    Llena la tabla de sucursales con las que ya tienen paquetes confirmados
+    """
+    existentes = {s.nombre for s in db_session.query(Sucursales.nombre)}
+    nombres = db_session.query(Paquetes.sucursal).filter(Paquetes.estado == Paquetes.CONFIRMADO).distinct()
+    db_session.add_all([Sucursales(nombre=s.sucursal) for s in nombres if s.sucursal and s.sucursal not in existentes])
+    db_session.commit()
+
+def registrar_saldos_iniciales():
+    """
+    Movimiento inicial de los productos que aún no lo tienen: el stock actual menos lo que
+    ya se movió desde que existe el historial, con la fecha del primer movimiento
+    """
+    ya_movido = select(
+        Movimientos_Inventario.id_producto,
+        func.sum(Movimientos_Inventario.cantidad).label('cantidad'),
+        func.min(Movimientos_Inventario.fecha).label('fecha')
+    ).group_by(Movimientos_Inventario.id_producto).subquery()
+    sin_inicial = select(
+        Productos.id_producto,
+        literal(Movimientos_Inventario.INICIAL),
+        Productos.cantidad - func.coalesce(ya_movido.c.cantidad, 0),
+        func.coalesce(ya_movido.c.fecha, datetime.utcnow())
+    ).outerjoin(ya_movido, ya_movido.c.id_producto == Productos.id_producto).where(~exists().where(
+        Movimientos_Inventario.id_producto == Productos.id_producto,
+        Movimientos_Inventario.tipo == Movimientos_Inventario.INICIAL
+    ))
+    db_session.execute(insert(Movimientos_Inventario).from_select(
+        ['id_producto', 'tipo', 'cantidad', 'fecha'], sin_inicial
+    ))
+    db_session.commit()
 
 if __name__ == '__main__':
-    Base.metadata.create_all(bind=engine)
-    print("Base de datos creada correctamente.")
\ No newline at end of file
+    # Tablas, columnas e índices (ver database/migraciones.py)
+    migrar()
+    completar_metadatos_imagenes()
+    poblar_sucursales()
+    registrar_saldos_iniciales()
+    if not db_session.query(exists().where(Resumen_Despachos_Diarios.id_resumen.isnot(None))).scalar():
+        reconstruir_resumenes()
+    print("Base de datos creada correctamente.")
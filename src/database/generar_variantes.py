@@ -0,0 +1,38 @@
+# Archivo para generar las miniaturas de las imágenes ya guardadas
+# Se ejecuta después de create_db.py, que calcula los hashes faltantes
+from sqlalchemy import exists
+from database.models import Productos, Perfiles_Empleados, Imagenes_Variantes, generar_variantes_imagen
+from database import db_session
+from almacen import leer_blob
+
+def generar_variantes_faltantes(lote=50):
+    total = 0
+    for columna_hash, columna_datos, columna_clave in (
+        (Productos.imagen_hash, Productos.imagen, Productos.imagen_clave),
+        (Perfiles_Empleados.foto_perfil_hash, Perfiles_Empleados.foto_perfil, Perfiles_Empleados.foto_perfil_clave),
+    ):
+        ultimo_hash = ''
+        while True:
+            filas = db_session.query(columna_hash, columna_datos, columna_clave).filter(
+                columna_hash > ultimo_hash,
+                ~exists().where(Imagenes_Variantes.hash_original == columna_hash)
+            ).order_by(columna_hash).limit(lote).all()
+            if not filas:
+                break
+
+            procesados = set()
+            for hash_original, datos, clave in filas:
+                if hash_original in procesados:
+                    continue
+                procesados.add(hash_original)
+                datos = datos or leer_blob(clave)
+                db_session.add_all(Imagenes_Variantes.crear_variantes(generar_variantes_imagen(datos), hash_original))
+
+            db_session.commit()
+            db_session.expunge_all()
+            total += len(procesados)
+            ultimo_hash = filas[-1][0]
+    return total
+
+if __name__ == '__main__':
+    print(f"Miniaturas generadas para {generar_variantes_faltantes()} imágenes.")
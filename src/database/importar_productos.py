@@ -0,0 +1,31 @@
+# Archivo para importar o exportar el catálogo de productos desde la terminal
+#   python -m database.importar_productos productos.csv      (o .xlsx)
+#   python -m database.importar_productos --exportar productos.csv
+import argparse
+import time
+from catalogo import ErrorImportacion, IMPORTACION_LOTE, exportar_productos, importar_productos
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Importa o exporta productos (codigo_barras, nombre, cantidad)")
+    parser.add_argument('archivo', help="CSV o XLSX a importar, o CSV de salida con --exportar")
+    parser.add_argument('--exportar', action='store_true', help="Escribe el catálogo en el archivo en lugar de importarlo")
+    parser.add_argument('--lote', type=int, default=IMPORTACION_LOTE, help="Filas por INSERT al importar")
+    parser.add_argument('--empleado', type=int, default=None, help="ID del empleado que queda en los movimientos de stock")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    if args.exportar:
+        with open(args.archivo, 'w', encoding='utf-8', newline='') as salida:
+            for parte in exportar_productos():
+                salida.write(parte)
+        print(f"Catálogo exportado a {args.archivo} en {time.perf_counter() - inicio:.1f} s.")
+    else:
+        try:
+            with open(args.archivo, 'rb') as entrada:
+                resultado = importar_productos(entrada, args.archivo, args.empleado, args.lote)
+        except ErrorImportacion as e:
+            raise SystemExit(f"No se pudo importar: {e}")
+        for fila in resultado['errores']:
+            print(f"Fila {fila['fila']}: {fila['error']}")
+        print(f"{resultado['creados']} productos nuevos, {resultado['actualizados']} actualizados y "
+              f"{len(resultado['errores'])} filas con errores en {time.perf_counter() - inicio:.1f} s.")
@@ -0,0 +1,228 @@
+# Migraciones versionadas del esquema
+#   python -m database.migraciones              aplica las pendientes
+#   python -m database.migraciones --verificar  revisa con EXPLAIN que las consultas usen los índices
+# Cada migración es una función numerada que recibe la conexión de su transacción; la tabla
+# versiones_esquema guarda las aplicadas. Deben poder correr sobre una base recién creada con los
+# modelos actuales (la versión 1 hace create_all), así que solo crean lo que falta y nunca borran datos.
+import argparse
+from datetime import datetime
+from sqlalchemy import case, exists, insert, inspect, select, text, update
+from database import engine
+from database.models import (
+    Base, Empleados, Movimientos_Inventario, Paquetes, Paquetes_Productos, Perfiles_Empleados, Productos,
+    Versiones_Esquema
+)
+from busqueda import crear_indices_busqueda
+from tablero import fechar_paquetes_sin_fecha
+from bitacora import get_logger
+
+log = get_logger('migraciones')
+
+MIGRACIONES = []
+
+def migracion(version, descripcion, verificaciones=()):
+    """
+    Registra la función como migración. verificaciones: [(descripción, función que regresa el select, [índices])]
+    """
+    def registrar(funcion):
+        MIGRACIONES.append({
+            'version': version, 'descripcion': descripcion, 'aplicar': funcion, 'verificaciones': verificaciones,
+        })
+        return funcion
+    return registrar
+
+# ===== OPERACIONES =====
+def agregar_columnas_faltantes(conexion):
+    """
+    create_all no modifica tablas existentes, agrega las columnas nuevas del modelo
+    """
+    inspector = inspect(conexion)
+    quote = conexion.dialect.identifier_preparer.quote
+    for tabla in Base.metadata.sorted_tables:
+        if not inspector.has_table(tabla.name):
+            continue
+        existentes = {columna['name'] for columna in inspector.get_columns(tabla.name)}
+        for columna in tabla.columns:
+            if columna.name not in existentes:
+                tipo = columna.type.compile(dialect=conexion.dialect)
+                conexion.execute(text(f'ALTER TABLE {quote(tabla.name)} ADD COLUMN {quote(columna.name)} {tipo}'))
+                log.info("Columna agregada", extra={'datos': {'tabla': tabla.name, 'columna': columna.name}})
+
+def crear_indices(conexion, modelo, *nombres):
+    """
+    Crea los índices declarados en el modelo que todavía no existen
+    """
+    indices = {indice.name: indice for indice in modelo.__table__.indexes}
+    for nombre in nombres:
+        if nombre not in {indice['name'] for indice in inspect(conexion).get_indexes(modelo.__tablename__)}:
+            indices[nombre].create(conexion)
+            log.info("Índice agregado", extra={'datos': {'tabla': modelo.__tablename__, 'indice': nombre}})
+
+# ===== MIGRACIONES =====
+@migracion(1, "Esquema anterior a las migraciones: tablas, columnas agregadas después e índices de búsqueda", [
+    ("Productos con poco stock (tablero)",
+     lambda: select(Productos.id_producto).where(Productos.cantidad <= 10).order_by(Productos.cantidad).limit(10),
+     ['ix_productos_cantidad']),
+])
+def esquema_inicial(conexion):
+    Base.metadata.create_all(bind=conexion)
+    agregar_columnas_faltantes(conexion)
+    crear_indices(conexion, Productos, 'ix_productos_cantidad')
+    crear_indices_busqueda(conexion)
+
+@migracion(2, "Índices de llaves foráneas, del listado de paquetes y de los movimientos por paquete", [
+    ("Listado de paquetes con productos, más recientes primero",
+     lambda: select(Paquetes.id_paquete).where(
+         exists().where(Paquetes_Productos.id_paquete == Paquetes.id_paquete)
+     ).order_by(Paquetes.fecha_creacion.desc(), Paquetes.id_paquete.desc()).limit(10),
+     ['ix_paquetes_fecha_creacion', 'ix_paquetes_productos_paquete']),
+    ("Paquetes en un rango de fechas",
+     lambda: select(Paquetes.id_paquete).where(
+         Paquetes.fecha_creacion >= datetime(2025, 1, 1), Paquetes.fecha_creacion <= datetime(2025, 1, 31)
+     ),
+     ['ix_paquetes_fecha_creacion']),
+    ("Productos de un paquete",
+     lambda: select(Paquetes_Productos.id_producto, Paquetes_Productos.cantidad).where(Paquetes_Productos.id_paquete == 1),
+     ['ix_paquetes_productos_paquete']),
+    ("Paquetes que contienen un producto (borrar producto)",
+     lambda: select(Paquetes_Productos.id_paquete).where(Paquetes_Productos.id_producto == 1),
+     ['ix_paquetes_productos_producto']),
+    ("Empleados de un rol",
+     lambda: select(Empleados.id_empleado).where(Empleados.id_rol == 1),
+     ['ix_empleados_id_rol']),
+    ("Perfil de un empleado",
+     lambda: select(Perfiles_Empleados.id_perfil_empleado).where(Perfiles_Empleados.id_empleado == 1),
+     ['ix_perfiles_empleados_id_empleado']),
+    ("Empleado que confirmó un paquete (tablero)",
+     lambda: select(Movimientos_Inventario.id_empleado).where(
+         Movimientos_Inventario.id_paquete == 1, Movimientos_Inventario.tipo == Movimientos_Inventario.SALIDA_PAQUETE
+     ).limit(1),
+     ['ix_movimientos_inventario_paquete']),
+])
+def indices_llaves_y_paquetes(conexion):
+    crear_indices(conexion, Empleados, 'ix_empleados_id_rol')
+    crear_indices(conexion, Perfiles_Empleados, 'ix_perfiles_empleados_id_empleado')
+    crear_indices(conexion, Paquetes, 'ix_paquetes_fecha_creacion')
+    crear_indices(conexion, Paquetes_Productos, 'ix_paquetes_productos_paquete', 'ix_paquetes_productos_producto')
+    crear_indices(conexion, Movimientos_Inventario, 'ix_movimientos_inventario_paquete')
+
+@migracion(3, "Columnas con la clave de las imágenes en el almacén (los BLOB se mueven con database/mover_imagenes.py)")
+def claves_almacen_imagenes(conexion):
+    agregar_columnas_faltantes(conexion)
+
+@migracion(4, "Estado de los paquetes (borrador o confirmado) e índice parcial de los borradores", [
+    ("Listado de paquetes confirmados, más recientes primero",
+     lambda: select(Paquetes.id_paquete).where(Paquetes.estado == Paquetes.CONFIRMADO).order_by(
+         Paquetes.fecha_creacion.desc(), Paquetes.id_paquete.desc()
+     ).limit(10),
+     ['ix_paquetes_fecha_creacion']),
+    ("Borradores vencidos (barrido)",
+     lambda: select(Paquetes.id_paquete).where(
+         Paquetes.estado == Paquetes.BORRADOR, Paquetes.fecha_creacion < datetime(2025, 1, 1)
+     ).order_by(Paquetes.fecha_creacion).limit(500),
+     ['ix_paquetes_borradores']),
+])
+def estado_paquetes(conexion):
+    agregar_columnas_faltantes(conexion)
+    # Los "Por asignar" son borradores; los que no tienen productos ya no se mostraban en el historial,
+    # así que también quedan como borradores y el barrido los quita
+    conexion.execute(update(Paquetes).where(Paquetes.estado.is_(None)).values(estado=case(
+        (Paquetes.sucursal == Paquetes.SIN_SUCURSAL, Paquetes.BORRADOR),
+        (~exists().where(Paquetes_Productos.id_paquete == Paquetes.id_paquete), Paquetes.BORRADOR),
+        else_=Paquetes.CONFIRMADO
+    )))
+    if conexion.dialect.name == 'postgresql':
+        conexion.execute(text('ALTER TABLE paquetes ALTER COLUMN estado SET NOT NULL'))
+    crear_indices(conexion, Paquetes, 'ix_paquetes_borradores')
+
+@migracion(5, "Fecha de los paquetes que no la tienen (resúmenes del tablero y barrido de borradores)")
+def fecha_paquetes(conexion):
+    # La de su salida de inventario es la que registrar_despacho usó al confirmarlos
+    conexion.execute(fechar_paquetes_sin_fecha())
+
+# ===== EJECUCIÓN =====
+def versiones_aplicadas(conexion):
+    if not inspect(conexion).has_table(Versiones_Esquema.__tablename__):
+        return set()
+    return set(conexion.scalars(select(Versiones_Esquema.version)))
+
+def bloquear_migraciones(conexion):
+    # Dos procesos migrando a la vez se esperan (el candado se libera con la transacción)
+    if conexion.dialect.name == 'postgresql':
+        conexion.execute(text('SELECT pg_advisory_xact_lock(hashtext(:nombre))'), {'nombre': 'versiones_esquema'})
+
+def migrar(hasta=None):
+    """
+    Aplica en orden las migraciones pendientes, cada una en su propia transacción; regresa las aplicadas
+    """
+    Versiones_Esquema.__table__.create(bind=engine, checkfirst=True)
+    aplicadas = []
+    for pendiente in sorted(MIGRACIONES, key=lambda m: m['version']):
+        if hasta is not None and pendiente['version'] > hasta:
+            break
+        with engine.begin() as conexion:
+            bloquear_migraciones(conexion)
+            if pendiente['version'] in versiones_aplicadas(conexion):
+                continue
+            pendiente['aplicar'](conexion)
+            conexion.execute(insert(Versiones_Esquema).values(
+                version=pendiente['version'], descripcion=pendiente['descripcion'], fecha=datetime.utcnow()
+            ))
+        log.info("Migración aplicada", extra={'datos': {'version': pendiente['version'], 'descripcion': pendiente['descripcion']}})
+        aplicadas.append(pendiente['version'])
+    return aplicadas
+
+def explicar(conexion, sentencia):
+    compilada = sentencia.compile(dialect=conexion.dialect, compile_kwargs={'literal_binds': True})
+    if conexion.dialect.name == 'sqlite':
+        filas = conexion.exec_driver_sql(f'EXPLAIN QUERY PLAN {compilada}').fetchall()
+    else:
+        filas = conexion.exec_driver_sql(f'EXPLAIN {compilada}').fetchall()
+    return '\n'.join(' '.join(str(valor) for valor in fila) for fila in filas)
+
+def verificar_indices():
+    """
+    EXPLAIN de las consultas de cada migración aplicada: [(version, descripción, índices faltantes, plan)].
+    En Postgres se desactiva el seq scan para saber si el índice se puede usar aunque la tabla sea pequeña.
+    """
+    resultados = []
+    # Sin commit: el SET LOCAL se descarta al cerrar la conexión
+    with engine.connect() as conexion:
+        if conexion.dialect.name == 'postgresql':
+            conexion.execute(text('SET LOCAL enable_seqscan = off'))
+        aplicadas = versiones_aplicadas(conexion)
+        for registrada in sorted(MIGRACIONES, key=lambda m: m['version']):
+            if registrada['version'] not in aplicadas:
+                continue
+            for descripcion, consulta, indices in registrada['verificaciones']:
+                plan = explicar(conexion, consulta())
+                faltantes = [indice for indice in indices if indice not in plan]
+                resultados.append((registrada['version'], descripcion, faltantes, plan))
+    return resultados
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Migraciones del esquema de la base de datos")
+    parser.add_argument('--hasta', type=int, default=None, help="Aplica solo hasta esta versión")
+    parser.add_argument('--verificar', action='store_true', help="Revisa con EXPLAIN que las consultas usen los índices")
+    parser.add_argument('--estado', action='store_true', help="Muestra las migraciones aplicadas y pendientes")
+    args = parser.parse_args()
+
+    if args.estado:
+        with engine.connect() as conexion:
+            aplicadas = versiones_aplicadas(conexion)
+        for registrada in sorted(MIGRACIONES, key=lambda m: m['version']):
+            marca = 'aplicada ' if registrada['version'] in aplicadas else 'pendiente'
+            print(f"{registrada['version']:>3} {marca} {registrada['descripcion']}")
+    elif args.verificar:
+        fallidas = 0
+        for version, descripcion, faltantes, plan in verificar_indices():
+            if faltantes:
+                fallidas += 1
+                print(f"FALLA  v{version} {descripcion}: no usa {', '.join(faltantes)}\n{plan}\n")
+            else:
+                print(f"OK     v{version} {descripcion}")
+        if fallidas:
+            raise SystemExit(1)
+    else:
+        aplicadas = migrar(args.hasta)
+        print(f"Migraciones aplicadas: {', '.join(map(str, aplicadas))}." if aplicadas else "El esquema está al día.")
@@ -1,16 +1,68 @@
 import os
+import hashlib
+from io import BytesIO
+from PIL import Image
 from flask import url_for
 from werkzeug.utils import secure_filename
 from datetime import datetime
 from sqlalchemy import (
-    Column, Integer, String, Text, ForeignKey, DateTime, Boolean, LargeBinary
+    Column, Integer, SmallInteger, String, Text, ForeignKey, Date, DateTime, Boolean, LargeBinary, UniqueConstraint, Index, text
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.ext.declarative import declarative_base
 from werkzeug.security import generate_password_hash, check_password_hash
+from almacen import guardar_blob
 
 Base = declarative_base()
 
+def calcular_hash_imagen(datos):
+    return hashlib.sha256(datos).hexdigest() if datos else None
+
+# Lados en px de las miniaturas que se generan para las vistas de listado
+LADOS_VARIANTES = (40, 120)
+
+def generar_variantes_imagen(datos):
+    """
+    Miniaturas WEBP de la imagen para cada lado de LADOS_VARIANTES
+    """
+    variantes = {}
+    try:
+        imagen = Image.open(BytesIO(datos))
+        imagen = imagen.convert('RGBA' if 'A' in imagen.getbands() or 'transparency' in imagen.info else 'RGB')
+    except Exception:
+        return variantes
+
+    # De la más grande a la más chica, cada una se reduce a partir de la anterior
+    for lado in sorted(LADOS_VARIANTES, reverse=True):
+        imagen.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+        output = BytesIO()
+        imagen.save(output, format='WEBP', quality=80)
+        variantes[lado] = output.getvalue()
+    return variantes
+
+def mimetype_seguro(mimetype):
+    """
+    El tipo MIME si es de un formato de imagen que Pillow reconoce; si no, image/jpeg.
+    Nunca se sirve el tipo que mandó el navegador (image/svg+xml o text/html ejecutarían scripts)
+    """
+    Image.init()
+    if mimetype and mimetype.startswith('image/') and mimetype in Image.MIME.values():
+        return mimetype
+    return 'image/jpeg'
+
+def describir_imagen(datos):
+    """
+    Datos de la imagen con su tipo MIME, peso y dimensiones (solo lee la cabecera);
+    ancho y alto quedan en None si Pillow no la reconoce
+    """
+    try:
+        imagen = Image.open(BytesIO(datos))
+        mimetype = mimetype_seguro(Image.MIME.get(imagen.format))
+        ancho, alto = imagen.size
+    except Exception:
+        mimetype, ancho, alto = 'image/jpeg', None, None
+    return {'datos': datos, 'mimetype': mimetype, 'peso': len(datos), 'ancho': ancho, 'alto': alto}
+
 # ===================== TABLA ROLES =====================
 class Roles(Base):
     __tablename__ = 'roles'
@@ -34,7 +86,7 @@ class Empleados(Base):
     telefono = Column(String(20), nullable=False)
     fecha_registro = Column(DateTime, default=datetime.utcnow)
     activo = Column(Boolean, default=True)
-    id_rol = Column(Integer, ForeignKey('roles.id_rol'), nullable=False)
+    id_rol = Column(Integer, ForeignKey('roles.id_rol'), nullable=False, index=True)
 
     rol = relationship("Roles", back_populates="empleados")
     perfil = relationship(
@@ -53,6 +105,11 @@ class Empleados(Base):
     def verificar_contraseña(self, contraseña):
         return check_password_hash(self.contraseña_hash, contraseña)
 
+    def get_foto_perfil_url(self, lado=None):
+        if self.perfil:
+            return self.perfil.get_foto_perfil_url(lado)
+        return url_for('static', filename='images/picture_profile_default.png')
+
     def __repr__(self):
         return f'<Empleado {self.nombre_usuario}>'
 
@@ -69,14 +126,31 @@ class Perfiles_Empleados(Base):
     colonia = Column(Text, nullable=True)
     calle = Column(Text, nullable=True)
     no_exterior = Column(Text, nullable=True)
-    foto_perfil = Column(LargeBinary(length=16777215), nullable=True)
-    id_empleado = Column(Integer, ForeignKey('empleados.id_empleado'), nullable=False)
+    # Solo las fotos guardadas antes del almacén; las nuevas van a foto_perfil_clave (ver almacen.py)
+    foto_perfil = deferred(Column(LargeBinary(length=16777215), nullable=True))
+    foto_perfil_clave = Column(String(64), nullable=True)
+    foto_perfil_hash = Column(String(64), nullable=True)
+    foto_perfil_mimetype = Column(String(50), nullable=True)
+    foto_perfil_peso = Column(Integer, nullable=True)
+    foto_perfil_ancho = Column(Integer, nullable=True)
+    foto_perfil_alto = Column(Integer, nullable=True)
+    id_empleado = Column(Integer, ForeignKey('empleados.id_empleado'), nullable=False, index=True)
 
     empleado = relationship("Empleados", back_populates="perfil")
 
-    def get_foto_perfil_url(self):
-        if self.foto_perfil:
-            return url_for('get_picture_profile', usuario_id=self.id_empleado)
+    def asignar_foto_perfil(self, imagen):
+        imagen = imagen or {}
+        self.foto_perfil = None
+        self.foto_perfil_clave = guardar_blob(imagen.get('datos'), imagen.get('mimetype'))
+        self.foto_perfil_hash = calcular_hash_imagen(imagen.get('datos'))
+        self.foto_perfil_mimetype = imagen.get('mimetype')
+        self.foto_perfil_peso = imagen.get('peso')
+        self.foto_perfil_ancho = imagen.get('ancho')
+        self.foto_perfil_alto = imagen.get('alto')
+
+    def get_foto_perfil_url(self, lado=None):
+        if self.foto_perfil_hash:
+            return url_for('profile_picture', usuario_id=self.id_empleado, v=self.foto_perfil_hash, size=lado)
         else:
             return url_for('static', filename='images/picture_profile_default.png')
 
@@ -93,7 +167,7 @@ class Perfiles_Empleados(Base):
             if extension not in extension_permitida:
                 raise ValueError("Formato de imagen no permitido")
 
-            self.foto_perfil = archivo_foto.read()
+            self.asignar_foto_perfil(describir_imagen(archivo_foto.read()))
 
     def __repr__(self):
         return f'<PerfilEmpleado {self.nombre} {self.apellidoP}>'
@@ -105,9 +179,16 @@ class Productos(Base):
 
     id_producto = Column(Integer, primary_key=True, autoincrement=True)
     nombre = Column(String(100), nullable=False)
-    cantidad = Column(Integer, nullable=False)
+    cantidad = Column(Integer, nullable=False, index=True)
     codigo_barras = Column(String(100), unique=True, nullable=False)
-    imagen = Column(LargeBinary(length=16777215), nullable=True)
+    # Solo las imágenes guardadas antes del almacén; las nuevas van a imagen_clave (ver almacen.py)
+    imagen = deferred(Column(LargeBinary(length=16777215), nullable=True))
+    imagen_clave = Column(String(64), nullable=True)
+    imagen_hash = Column(String(64), nullable=True)
+    imagen_mimetype = Column(String(50), nullable=True)
+    imagen_peso = Column(Integer, nullable=True)
+    imagen_ancho = Column(Integer, nullable=True)
+    imagen_alto = Column(Integer, nullable=True)
 
     paquetes_productos = relationship("Paquetes_Productos", back_populates="producto")
 
@@ -116,17 +197,127 @@ class Productos(Base):
         self.cantidad = cantidad
         self.codigo_barras = codigo_barras
 
+    def asignar_imagen(self, imagen):
+        imagen = imagen or {}
+        self.imagen = None
+        self.imagen_clave = guardar_blob(imagen.get('datos'), imagen.get('mimetype'))
+        self.imagen_hash = calcular_hash_imagen(imagen.get('datos'))
+        self.imagen_mimetype = imagen.get('mimetype')
+        self.imagen_peso = imagen.get('peso')
+        self.imagen_ancho = imagen.get('ancho')
+        self.imagen_alto = imagen.get('alto')
+
+    def get_imagen_url(self, lado=None):
+        if self.imagen_hash:
+            return url_for('product_image', producto_id=self.id_producto, v=self.imagen_hash, size=lado)
+        else:
+            return url_for('static', filename='images/product_default.png')
+
     def __repr__(self):
         return f'<Producto {self.nombre}>'
 
 
+# ===================== TABLA MOVIMIENTOS INVENTARIO =====================
+# Historial de solo inserción de cada cambio de stock; Productos.cantidad es el saldo actual.
+# Sin llaves foráneas para que el historial se conserve aunque se borre el producto, el empleado o el paquete.
+class Movimientos_Inventario(Base):
+    __tablename__ = 'movimientos_inventario'
+    __table_args__ = (
+        Index('ix_movimientos_inventario_producto', 'id_producto', 'id_movimiento'),
+        # Parcial: la mayoría de los movimientos (entradas, ajustes) no son de un paquete
+        Index('ix_movimientos_inventario_paquete', 'id_paquete',
+              postgresql_where=text('id_paquete IS NOT NULL'), sqlite_where=text('id_paquete IS NOT NULL')),
+    )
+
+    INICIAL = 0
+    ENTRADA = 1
+    SALIDA_PAQUETE = 2
+    AJUSTE = 3
+    TIPOS = {INICIAL: 'Inicial', ENTRADA: 'Entrada', SALIDA_PAQUETE: 'Salida en paquete', AJUSTE: 'Ajuste manual'}
+
+    id_movimiento = Column(Integer, primary_key=True, autoincrement=True)
+    id_producto = Column(Integer, nullable=False)
+    tipo = Column(SmallInteger, nullable=False)
+    cantidad = Column(Integer, nullable=False)
+    id_empleado = Column(Integer, nullable=True)
+    id_paquete = Column(Integer, nullable=True)
+    fecha = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<MovimientoInventario {self.TIPOS.get(self.tipo)} producto={self.id_producto} {self.cantidad:+d}>'
+
+
+# ===================== TABLA CORTES INVENTARIO =====================
+# Saldo de un producto hasta cierto movimiento, para no recorrer todo el historial
+class Cortes_Inventario(Base):
+    __tablename__ = 'cortes_inventario'
+    __table_args__ = (Index('ix_cortes_inventario_producto', 'id_producto', 'fecha'),)
+
+    id_corte = Column(Integer, primary_key=True, autoincrement=True)
+    id_producto = Column(Integer, nullable=False)
+    cantidad = Column(Integer, nullable=False)
+    id_ultimo_movimiento = Column(Integer, nullable=False)
+    fecha = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<CorteInventario producto={self.id_producto} {self.cantidad} @{self.id_ultimo_movimiento}>'
+
+
+# ===================== TABLA IMAGENES VARIANTES =====================
+class Imagenes_Variantes(Base):
+    __tablename__ = 'imagenes_variantes'
+    __table_args__ = (UniqueConstraint('hash_original', 'lado'),)
+
+    id_imagen_variante = Column(Integer, primary_key=True, autoincrement=True)
+    hash_original = Column(String(64), nullable=False)
+    lado = Column(Integer, nullable=False)
+    mimetype = Column(String(50), nullable=False)
+    datos = Column(LargeBinary, nullable=False)
+
+    @classmethod
+    def crear_variantes(cls, variantes, hash_original):
+        return [
+            cls(hash_original=hash_original, lado=lado, mimetype='image/webp', datos=datos)
+            for lado, datos in variantes.items()
+        ]
+
+    def __repr__(self):
+        return f'<ImagenVariante {self.hash_original[:8]} {self.lado}px>'
+
+
+# ===================== TABLA SUCURSALES =====================
+class Sucursales(Base):
+    __tablename__ = 'sucursales'
+
+    id_sucursal = Column(Integer, primary_key=True, autoincrement=True)
+    nombre = Column(Text, unique=True, nullable=False)
+
+    def __repr__(self):
+        return f'<Sucursal {self.nombre}>'
+
+
 # ===================== TABLA PAQUETES =====================
+# Un paquete generado es un borrador hasta que se confirma con su sucursal; solo los confirmados aparecen
+# en el historial y el tablero. Los borradores que nadie confirma se borran solos (ver borradores.py).
 class Paquetes(Base):
     __tablename__ = 'paquetes'
+    __table_args__ = (
+        # Orden y rangos de fecha del listado de paquetes (paginación por fecha_creacion, id_paquete)
+        Index('ix_paquetes_fecha_creacion', 'fecha_creacion', 'id_paquete'),
+        # Parcial: solo los borradores, que son pocos, para encontrar los vencidos
+        Index('ix_paquetes_borradores', 'fecha_creacion',
+              postgresql_where=text('estado = 0'), sqlite_where=text('estado = 0')),
+    )
+
+    BORRADOR = 0
+    CONFIRMADO = 1
+    ESTADOS = {BORRADOR: 'Borrador', CONFIRMADO: 'Confirmado'}
+    SIN_SUCURSAL = 'Por asignar'
 
     id_paquete = Column(Integer, primary_key=True, autoincrement=True)
     sucursal = Column(Text, nullable=False)
     fecha_creacion = Column(DateTime, default=datetime.utcnow)
+    estado = Column(SmallInteger, nullable=False, default=BORRADOR)
 
     paquetes_productos = relationship(
         "Paquetes_Productos", 
@@ -134,8 +325,13 @@ class Paquetes(Base):
         cascade="all, delete-orphan"
     )
 
-    def __init__(self, sucursal="Por asignar"):
+    def __init__(self, sucursal=SIN_SUCURSAL):
         self.sucursal = sucursal
+        self.estado = self.BORRADOR
+
+    def confirmar(self, sucursal):
+        self.sucursal = sucursal
+        self.estado = self.CONFIRMADO
 
     def __repr__(self):
         return f'<Paquete {self.id_paquete}>'
@@ -144,6 +340,11 @@ class Paquetes(Base):
 # ===================== TABLA INTERMEDIA PAQUETES_PRODUCTOS =====================
 class Paquetes_Productos(Base):
     __tablename__ = 'paquetes_productos'
+    # Postgres no indexa las llaves foráneas: productos de un paquete y paquetes de un producto
+    __table_args__ = (
+        Index('ix_paquetes_productos_paquete', 'id_paquete', 'id_producto'),
+        Index('ix_paquetes_productos_producto', 'id_producto'),
+    )
 
     id_paquete_producto = Column(Integer, primary_key=True, autoincrement=True)
     id_paquete = Column(Integer, ForeignKey('paquetes.id_paquete', ondelete='CASCADE'), nullable=False)
@@ -154,4 +355,62 @@ class Paquetes_Productos(Base):
     producto = relationship("Productos", back_populates="paquetes_productos")
 
     def __repr__(self):
-        return f'<PaqueteProducto paquete={self.id_paquete} producto={self.id_producto}>'
\ No newline at end of file
+        return f'<PaqueteProducto paquete={self.id_paquete} producto={self.id_producto}>'
+
+
+# ===================== TABLAS DE RESUMEN DEL TABLERO =====================
+# Totales por día que se suman al confirmar un paquete y se restan al borrarlo (ver tablero.py),
+# para que /home no agrupe todo el historial de paquetes. La fecha es la de creación del paquete.
+class Resumen_Despachos_Diarios(Base):
+    __tablename__ = 'resumen_despachos_diarios'
+    __table_args__ = (UniqueConstraint('fecha', 'sucursal', name='uq_resumen_despachos_fecha_sucursal'),)
+
+    id_resumen = Column(Integer, primary_key=True, autoincrement=True)
+    fecha = Column(Date, nullable=False)
+    sucursal = Column(Text, nullable=False)
+    paquetes = Column(Integer, nullable=False, default=0)
+    unidades = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ResumenDespachos {self.fecha} {self.sucursal}>'
+
+
+class Resumen_Productos_Diarios(Base):
+    __tablename__ = 'resumen_productos_diarios'
+    __table_args__ = (UniqueConstraint('fecha', 'id_producto', name='uq_resumen_productos_fecha_producto'),)
+
+    id_resumen = Column(Integer, primary_key=True, autoincrement=True)
+    fecha = Column(Date, nullable=False)
+    id_producto = Column(Integer, nullable=False)
+    unidades = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ResumenProductos {self.fecha} producto={self.id_producto}>'
+
+
+# Solo los paquetes confirmados desde que existe el historial de movimientos tienen empleado
+class Resumen_Empleados_Diarios(Base):
+    __tablename__ = 'resumen_empleados_diarios'
+    __table_args__ = (UniqueConstraint('fecha', 'id_empleado', name='uq_resumen_empleados_fecha_empleado'),)
+
+    id_resumen = Column(Integer, primary_key=True, autoincrement=True)
+    fecha = Column(Date, nullable=False)
+    id_empleado = Column(Integer, nullable=False)
+    paquetes = Column(Integer, nullable=False, default=0)
+    unidades = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ResumenEmpleados {self.fecha} empleado={self.id_empleado}>'
+
+
+# ===================== TABLA VERSIONES ESQUEMA =====================
+# Migraciones aplicadas (ver database/migraciones.py)
+class Versiones_Esquema(Base):
+    __tablename__ = 'versiones_esquema'
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    descripcion = Column(Text, nullable=False)
+    fecha = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<VersionEsquema {self.version}>'
@@ -0,0 +1,87 @@
+# Archivo para mover al almacén (ver almacen.py) las imágenes que todavía están como BLOB en la base
+# Uso (desde src): python -m database.mover_imagenes [--lote 50] [--limpiar]
+# Se puede correr con la aplicación funcionando y repetir las veces que sea: cada lote sube los archivos
+# y después, en un commit, deja la clave y borra el BLOB solo de las filas que no cambiaron mientras tanto.
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, select
+from database import db_session
+from database.models import Productos, Perfiles_Empleados, calcular_hash_imagen
+from almacen import get_almacen, guardar_blob
+from bitacora import get_logger
+
+log = get_logger('mover_imagenes')
+
+# Un archivo subido hace menos de esto puede ser de una petición que aún no hace commit
+ANTIGÜEDAD_HUERFANOS = timedelta(hours=24)
+
+def mover_imagenes(lote=50):
+    """
+    Sube al almacén los BLOB de Productos y Perfiles_Empleados por lotes; regresa cuántas filas movió
+    """
+    total = 0
+    for modelo, columna_id, prefijo in (
+        (Productos, Productos.id_producto, 'imagen'),
+        (Perfiles_Empleados, Perfiles_Empleados.id_perfil_empleado, 'foto_perfil'),
+    ):
+        columna_datos = getattr(modelo, prefijo)
+        columna_clave = getattr(modelo, f'{prefijo}_clave')
+        columna_mimetype = getattr(modelo, f'{prefijo}_mimetype')
+        tabla = modelo.__table__
+        # Si alguien sube otra imagen mientras tanto, la fila ya tiene clave y no se toca
+        sentencia = tabla.update().where(
+            tabla.c[columna_id.key] == bindparam('b_id'), tabla.c[f'{prefijo}_clave'].is_(None)
+        ).values({prefijo: None, f'{prefijo}_clave': bindparam('b_clave'), f'{prefijo}_hash': bindparam('b_hash')})
+
+        ultimo_id = 0
+        while True:
+            filas = db_session.execute(
+                select(columna_id, columna_datos, columna_mimetype).where(
+                    columna_id > ultimo_id, columna_datos.isnot(None), columna_clave.is_(None)
+                ).order_by(columna_id).limit(lote)
+            ).all()
+            if not filas:
+                break
+            movidas = []
+            for id_fila, datos, mimetype in filas:
+                clave = guardar_blob(datos, mimetype)
+                movidas.append({'b_id': id_fila, 'b_clave': clave, 'b_hash': calcular_hash_imagen(datos)})
+            db_session.execute(sentencia, movidas)
+            db_session.commit()
+            total += len(movidas)
+            ultimo_id = filas[-1][0]
+            log.info("Imágenes movidas al almacén", extra={'datos': {'tabla': tabla.name, 'filas': len(movidas), 'hasta_id': ultimo_id}})
+    return total
+
+def limpiar_huerfanos(antigüedad=ANTIGÜEDAD_HUERFANOS):
+    """
+    Borra del almacén los archivos que ya no usa ninguna fila (imágenes reemplazadas u optimizadas,
+    productos borrados); regresa cuántos borró
+    """
+    usadas = set()
+    for modelo, prefijo in ((Productos, 'imagen'), (Perfiles_Empleados, 'foto_perfil')):
+        columna_clave = getattr(modelo, f'{prefijo}_clave')
+        usadas.update(db_session.scalars(select(columna_clave).where(columna_clave.isnot(None)).distinct()))
+    db_session.remove()
+
+    limite = datetime.utcnow() - antigüedad
+    almacen = get_almacen()
+    borradas = 0
+    for clave, fecha in almacen.listar():
+        if clave not in usadas and fecha < limite:
+            almacen.borrar(clave)
+            borradas += 1
+    return borradas
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mueve al almacén las imágenes guardadas en la base")
+    parser.add_argument('--lote', type=int, default=50, help="Filas por commit")
+    parser.add_argument('--limpiar', action='store_true', help="Después borra del almacén los archivos sin usar")
+    args = parser.parse_args()
+
+    print(f"Imágenes movidas al almacén: {mover_imagenes(args.lote)}.")
+    if args.limpiar:
+        print(f"Archivos sin usar borrados: {limpiar_huerfanos()}.")
+    if db_session.get_bind().dialect.name == 'postgresql':
+        print("Postgres reutiliza el espacio de los BLOB tras el VACUUM; para devolverlo al disco: "
+              "VACUUM FULL productos, perfiles_empleados;")
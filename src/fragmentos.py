@@ -0,0 +1,176 @@
+# Caché de fragmentos HTML de los listados (/products y /packages)
+# Se guarda ya renderizada la parte de la página que no depende del usuario (todo menos la barra de
+# navegación) con clave ruta + filtros normalizados + página, así que la misma tabla sirve a todos.
+# Cada grupo de datos (productos, paquetes) tiene un número de versión que forma parte de la clave; las
+# rutas que escriben llaman a invalidar_fragmentos después del commit y eso sube la versión: lo anterior
+# ya no se vuelve a leer y sale solo por LRU o TTL. Los conteos de la paginación (paginacion.py) usan las
+# mismas versiones, así que también se enteran de las escrituras de otros workers.
+# CACHE_DESTINO elige dónde viven:
+#   memoria (por defecto): LRU con TTL en cada proceso; las versiones son archivos en CACHE_DIR (se suma un
+#       byte por invalidación y la versión es el tamaño) para que todos los workers se enteren con un os.stat
+#   redis: compartido entre workers y servidores (CACHE_REDIS_URL y el paquete redis)
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from markupsafe import Markup
+from metricas import incrementar
+from bitacora import get_logger
+
+log = get_logger('fragmentos')
+
+CACHE_DESTINO = os.getenv('CACHE_DESTINO', 'memoria')
+CACHE_TTL = int(os.getenv('CACHE_TTL', 60))
+CACHE_MAXIMO = int(os.getenv('CACHE_MAXIMO', 500))
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'la_poblanita_cache'))
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_PREFIJO = 'fragmentos:'
+
+PRODUCTOS = 'productos'
+PAQUETES = 'paquetes'
+EMPLEADOS = 'empleados'
+GRUPOS = (PRODUCTOS, PAQUETES, EMPLEADOS)
+
+# ===== DESTINOS =====
+class CacheMemoria:
+    def __init__(self, maximo, directorio):
+        self.maximo = maximo
+        self.directorio = directorio
+        self.entradas = OrderedDict()
+        self.candado = threading.Lock()
+        # Sin CACHE_DIR las versiones solo valen en este proceso
+        self.versiones_locales = {}
+
+    def leer(self, clave):
+        with self.candado:
+            entrada = self.entradas.get(clave)
+            if entrada is None:
+                return None
+            valor, vence = entrada
+            if vence < time.monotonic():
+                del self.entradas[clave]
+                return None
+            self.entradas.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor, ttl):
+        with self.candado:
+            self.entradas[clave] = (valor, time.monotonic() + ttl)
+            self.entradas.move_to_end(clave)
+            while len(self.entradas) > self.maximo:
+                self.entradas.popitem(last=False)
+
+    def ruta_version(self, grupo):
+        return os.path.join(self.directorio, f'{grupo}.version')
+
+    def versiones(self, grupos):
+        if not self.directorio:
+            return [self.versiones_locales.get(grupo, 0) for grupo in grupos]
+        resultado = []
+        for grupo in grupos:
+            try:
+                resultado.append(os.stat(self.ruta_version(grupo)).st_size)
+            except FileNotFoundError:
+                resultado.append(0)
+        return resultado
+
+    def invalidar(self, grupo):
+        if not self.directorio:
+            self.versiones_locales[grupo] = self.versiones_locales.get(grupo, 0) + 1
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        # Un byte con O_APPEND: las invalidaciones de procesos distintos nunca se pierden
+        descriptor = os.open(self.ruta_version(grupo), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(descriptor, b'.')
+        finally:
+            os.close(descriptor)
+
+class CacheRedis:
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("Para CACHE_DESTINO=redis se necesita el paquete redis")
+        self.cliente = redis.Redis.from_url(url)
+
+    def leer(self, clave):
+        valor = self.cliente.get(CACHE_PREFIJO + clave)
+        return valor.decode() if valor is not None else None
+
+    def guardar(self, clave, valor, ttl):
+        self.cliente.set(CACHE_PREFIJO + clave, valor.encode(), ex=ttl)
+
+    def versiones(self, grupos):
+        return [int(valor or 0) for valor in self.cliente.mget([f'{CACHE_PREFIJO}version:{grupo}' for grupo in grupos])]
+
+    def invalidar(self, grupo):
+        self.cliente.incr(f'{CACHE_PREFIJO}version:{grupo}')
+
+cache = None
+candado_cache = threading.Lock()
+
+def get_cache():
+    global cache
+    with candado_cache:
+        if cache is None:
+            cache = CacheRedis(CACHE_REDIS_URL) if CACHE_DESTINO == 'redis' else CacheMemoria(CACHE_MAXIMO, CACHE_DIR)
+        return cache
+
+# ===== OPERACIONES =====
+def normalizar_argumentos(argumentos):
+    """
+    Filtros de la URL sin vacíos, sin la primera página y en orden, para que ?a=1&b= y ?b=&a=1 compartan clave
+    """
+    pares = sorted((nombre, valor.strip()) for nombre, valor in argumentos.items(multi=True) if valor.strip())
+    return '&'.join(f'{nombre}={valor}' for nombre, valor in pares if (nombre, valor) != ('pagina', '1'))
+
+def fragmento_en_cache(ruta, argumentos, grupos, generar, variante=None):
+    """
+    HTML del fragmento de la ruta con esos filtros; si no está (o cambió alguno de los grupos) lo genera
+    con `generar()` y lo guarda. `variante` separa los fragmentos que cambian según el permiso del usuario.
+    Si el caché falla se genera sin él.
+    """
+    try:
+        almacen = get_cache()
+        versiones = almacen.versiones(grupos)
+        clave = f"{ruta}?{normalizar_argumentos(argumentos)}#{'.'.join(map(str, versiones))}"
+        if variante:
+            clave += f'@{variante}'
+        guardado = almacen.leer(clave)
+    except Exception:
+        log.exception("Error leyendo el caché de fragmentos", extra={'datos': {'ruta': ruta}})
+        return Markup(generar())
+    if guardado is not None:
+        incrementar('cache_fragmentos_total', ruta=ruta, resultado='acierto')
+        return Markup(guardado)
+
+    incrementar('cache_fragmentos_total', ruta=ruta, resultado='fallo')
+    html = generar()
+    try:
+        almacen.guardar(clave, str(html), CACHE_TTL)
+    except Exception:
+        log.exception("Error guardando en el caché de fragmentos", extra={'datos': {'ruta': ruta}})
+    return Markup(html)
+
+def versiones_grupos():
+    """
+    Versión actual de todos los grupos; None si el caché falla
+    """
+    try:
+        return tuple(get_cache().versiones(GRUPOS))
+    except Exception:
+        log.exception("Error leyendo las versiones del caché de fragmentos")
+        return None
+
+def invalidar_fragmentos(*grupos):
+    """
+    Después del commit que cambió esos datos, en todos los procesos
+    """
+    try:
+        almacen = get_cache()
+        for grupo in grupos:
+            almacen.invalidar(grupo)
+    except Exception:
+        log.exception("Error invalidando el caché de fragmentos", extra={'datos': {'grupos': grupos}})
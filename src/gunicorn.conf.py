@@ -0,0 +1,73 @@
+# Configuración de gunicorn (se carga sola al ejecutar gunicorn desde src/)
+#   gunicorn wsgi:app
+# Cada worker tiene su propio pool de conexiones: WORKERS * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+# no debe pasar del límite de conexiones del pooler de Supabase.
+import multiprocessing
+import os
+import tempfile
+
+# Directorio donde cada worker deja sus métricas para que /metrics las sume (ver metricas.py)
+os.environ.setdefault('METRICAS_DIR', os.path.join(tempfile.gettempdir(), 'la_poblanita_metricas'))
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# gthread: hilos por worker, sirve con psycopg2 sin parches.
+# gevent: requiere instalar gevent y psycogreen (psycopg2 se parchea en post_fork).
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100))
+
+# Las subidas de imágenes (hasta 15MB) pueden tardar en redes lentas
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Reinicia los workers de vez en cuando para liberar la memoria que deja PIL
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# La app se importa una vez en el proceso maestro y los workers comparten esa memoria
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOGLEVEL', 'info')
+
+def on_starting(server):
+    from metricas import limpiar_directorio
+    limpiar_directorio()
+
+def worker_exit(server, worker):
+    from correos import esperar_correos
+    from metricas import volcar
+    # Los correos encolados viven en la memoria del worker
+    if not esperar_correos(graceful_timeout / 2):
+        worker.log.warning(f"Worker {worker.pid}: quedaron correos sin enviar")
+    volcar(forzar=True)
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+    from borradores import iniciar_barrido
+    from database import engine
+    from wsgi import calentar_codigos, calentar_conexiones, calentar_plantillas
+
+    # Las conexiones heredadas del maestro no se comparten entre procesos
+    engine.dispose(close=False)
+    try:
+        conexiones = calentar_conexiones()
+    except Exception as e:
+        conexiones = 0
+        worker.log.warning(f"No se pudieron abrir las conexiones iniciales: {e}")
+    plantillas = calentar_plantillas()
+    try:
+        codigos = calentar_codigos()
+    except Exception as e:
+        codigos = 0
+        worker.log.warning(f"No se pudo cargar el índice de códigos de barras: {e}")
+    # Cada worker barre los borradores abandonados aunque nunca genere un paquete
+    iniciar_barrido()
+    worker.log.info(f"Worker {worker.pid}: {conexiones} conexiones, {plantillas} plantillas y {codigos} códigos listos")
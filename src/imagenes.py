@@ -0,0 +1,126 @@
+# Procesamiento de imágenes en segundo plano
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from PIL import Image
+from database import db_session
+from database.models import Imagenes_Variantes, Productos, calcular_hash_imagen, describir_imagen, generar_variantes_imagen
+from fragmentos import PAQUETES, PRODUCTOS, invalidar_fragmentos
+from metricas import incrementar
+from bitacora import get_logger
+
+log = get_logger('imagenes')
+
+# Las imágenes se guardan tal cual en la petición y un proceso aparte las optimiza
+PROCESOS_IMAGENES = int(os.getenv('PROCESOS_IMAGENES', 2))
+
+hilos_imagenes = ThreadPoolExecutor(max_workers=PROCESOS_IMAGENES, thread_name_prefix='imagenes')
+pool_procesos = None
+candado_pool = threading.Lock()
+
+def get_pool_procesos():
+    # Se crea al primer uso para que cada worker de gunicorn tenga su propio pool
+    global pool_procesos
+    with candado_pool:
+        if pool_procesos is None:
+            pool_procesos = ProcessPoolExecutor(max_workers=PROCESOS_IMAGENES)
+        return pool_procesos
+
+PESO_MAXIMO_IMAGEN = 1 * 1024 * 1024
+LADO_MAXIMO_IMAGEN = 600
+CALIDAD_IMAGEN = 85
+
+def codificar_imagen(imagen, formato, calidad):
+    output = BytesIO()
+    imagen.save(output, format=formato, quality=calidad, optimize=formato == 'JPEG')
+    return output.getvalue()
+
+def comprimir_imagen(imagen_data):
+    """
+    Redimensiona y comprime la imagen para que pese 1MB o menos con una sola codificación
+    """
+    if len(imagen_data) <= PESO_MAXIMO_IMAGEN:
+        return imagen_data
+
+    try:
+        imagen = Image.open(BytesIO(imagen_data))
+        log.debug("Imagen original", extra={'datos': {'formato': imagen.format, 'tamaño': imagen.size, 'modo': imagen.mode}})
+
+        # En JPEG decodifica directo a una escala reducida
+        imagen.draft('RGB', (LADO_MAXIMO_IMAGEN, LADO_MAXIMO_IMAGEN))
+
+        # Siempre a un formato con pérdida: WEBP si tiene transparencia, JPEG si no
+        tiene_alfa = 'A' in imagen.getbands() or 'transparency' in imagen.info
+        formato = 'WEBP' if tiene_alfa else 'JPEG'
+        imagen = imagen.convert('RGBA' if tiene_alfa else 'RGB')
+
+        if imagen.width > LADO_MAXIMO_IMAGEN or imagen.height > LADO_MAXIMO_IMAGEN:
+            imagen.thumbnail((LADO_MAXIMO_IMAGEN, LADO_MAXIMO_IMAGEN), Image.Resampling.LANCZOS)
+            log.debug("Imagen redimensionada", extra={'datos': {'tamaño': imagen.size}})
+
+        # A 600px ni el ruido puro llega a 1MB (unos 260KB en JPEG y 640KB en WEBP con alfa a calidad 85),
+        # así que no hace falta buscar otra calidad
+        calidad = CALIDAD_IMAGEN
+        imagen_comprimida = codificar_imagen(imagen, formato, calidad)
+
+        log.info("Imagen comprimida", extra={'datos': {
+            'bytes_entrada': len(imagen_data), 'bytes_salida': len(imagen_comprimida), 'formato': formato, 'calidad': calidad
+        }})
+        return imagen_comprimida if len(imagen_comprimida) < len(imagen_data) else imagen_data
+
+    except Exception:
+        log.exception("Error procesando imagen con PIL")
+        return imagen_data
+
+def optimizar_imagen(datos):
+    """
+    Trabajo del pool de procesos: imagen comprimida con sus metadatos y miniaturas
+    """
+    imagen = describir_imagen(comprimir_imagen(datos))
+    imagen['variantes'] = generar_variantes_imagen(imagen['datos'])
+    return imagen
+
+def guardar_variantes_imagen(imagen):
+    """
+    Agrega a la sesión las miniaturas de la imagen si aún no existen (se comparten por hash)
+    """
+    hash_original = calcular_hash_imagen(imagen['datos'])
+    if db_session.query(Imagenes_Variantes.id_imagen_variante).filter_by(hash_original=hash_original).first():
+        return
+    db_session.add_all(Imagenes_Variantes.crear_variantes(imagen['variantes'], hash_original))
+
+def procesar_imagen_guardada(modelo, id_fila, prefijo, datos):
+    hash_original = calcular_hash_imagen(datos)
+    try:
+        imagen = get_pool_procesos().submit(optimizar_imagen, datos).result()
+        incrementar('imagenes_procesadas_total')
+        incrementar('imagenes_bytes_entrada_total', len(datos))
+        incrementar('imagenes_bytes_salida_total', len(imagen['datos']))
+
+        objeto = db_session.get(modelo, id_fila)
+        # Si la imagen cambió mientras se procesaba, se descarta el resultado
+        if not objeto or getattr(objeto, f'{prefijo}_hash') != hash_original:
+            return
+
+        guardar_variantes_imagen(imagen)
+        cambio = calcular_hash_imagen(imagen['datos']) != hash_original
+        if cambio:
+            getattr(objeto, f'asignar_{prefijo}')(imagen)
+        db_session.commit()
+        # Los listados guardados llevan la URL con el hash anterior
+        if cambio and modelo is Productos:
+            invalidar_fragmentos(PRODUCTOS, PAQUETES)
+    except Exception:
+        log.exception("Error optimizando imagen", extra={'datos': {'tabla': modelo.__tablename__, 'id': id_fila}})
+        db_session.rollback()
+    finally:
+        db_session.remove()
+
+def encolar_imagen(objeto, prefijo, imagen):
+    """
+    Encola la optimización de la imagen recién guardada en el objeto (después del commit)
+    """
+    modelo = type(objeto)
+    id_fila = modelo.__mapper__.primary_key_from_instance(objeto)[0]
+    hilos_imagenes.submit(procesar_imagen_guardada, modelo, id_fila, prefijo, imagen['datos'])
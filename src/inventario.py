@@ -0,0 +1,219 @@
+# Stock de los productos: reservas de los paquetes e historial de movimientos
+# Los productos se leen en una sola consulta (bloqueados con FOR UPDATE al confirmar, siempre
+# en orden de id para que dos confirmaciones simultáneas no se bloqueen entre sí) y el
+# descuento se aplica con un solo UPDATE que vuelve a comprobar el stock en la base de datos.
+# Cada cambio queda en movimientos_inventario; Productos.cantidad es el saldo que se mantiene al día.
+from datetime import datetime, timedelta
+from sqlalchemy import case, func, insert, select, update
+from database import db_session
+from database.models import Productos, Movimientos_Inventario, Cortes_Inventario
+from codigos import invalidar_codigos
+from fragmentos import PRODUCTOS, invalidar_fragmentos
+
+class StockInsuficiente(Exception):
+    def __init__(self, insuficientes):
+        super().__init__('Stock insuficiente')
+        self.insuficientes = insuficientes
+
+class CantidadInvalida(ValueError):
+    def __init__(self, id_producto, cantidad):
+        super().__init__(f'Cantidad no válida para el producto {id_producto}: {cantidad}')
+        self.id_producto = id_producto
+        self.cantidad = cantidad
+
+def agrupar_cantidades(items):
+    """
+    Suma las cantidades solicitadas por producto: [{'id', 'cantidad'}] -> {id_producto: cantidad}
+    Cada cantidad tiene que ser mayor que cero; si no, CantidadInvalida
+    """
+    cantidades = {}
+    for item in items:
+        id_producto = int(item['id'])
+        cantidad = int(item['cantidad'])
+        if cantidad <= 0:
+            raise CantidadInvalida(id_producto, cantidad)
+        cantidades[id_producto] = cantidades.get(id_producto, 0) + cantidad
+    return cantidades
+
+def cargar_productos(ids, bloquear=False):
+    """
+    Productos por id en una sola consulta; con `bloquear` quedan bloqueados hasta el commit
+    """
+    if not ids:
+        return {}
+    query = db_session.query(Productos).filter(Productos.id_producto.in_(ids)).order_by(Productos.id_producto).populate_existing()
+    if bloquear:
+        query = query.with_for_update()
+    return {producto.id_producto: producto for producto in query}
+
+def validar_stock(cantidades, productos):
+    insuficientes = []
+    for id_producto, cantidad in cantidades.items():
+        producto = productos.get(id_producto)
+        if not producto or producto.cantidad < cantidad:
+            insuficientes.append({
+                'nombre': producto.nombre if producto else f'Producto {id_producto}',
+                'solicitado': cantidad,
+                'disponible': producto.cantidad if producto else 0
+            })
+    return insuficientes
+
+# ===== MOVIMIENTOS =====
+def registrar_movimientos(movimientos):
+    """
+    Inserta los movimientos [{'id_producto', 'tipo', 'cantidad', ...}] en un solo INSERT de varias filas
+    """
+    if not movimientos:
+        return
+    fecha = datetime.utcnow()
+    db_session.execute(insert(Movimientos_Inventario), [
+        {'id_empleado': None, 'id_paquete': None, 'fecha': fecha, **movimiento} for movimiento in movimientos
+    ])
+
+def aplicar_movimientos(cambios, tipo, id_empleado=None, id_paquete=None):
+    """
+    Suma los cambios {id_producto: +/-cantidad} al saldo con un solo UPDATE y los registra.
+    Los productos que quedarían en negativo no se modifican ni se registran; regresa cuántos se actualizaron.
+    """
+    cambios = {id_producto: cantidad for id_producto, cantidad in cambios.items() if cantidad}
+    if not cambios:
+        return 0
+    cambio = case(cambios, value=Productos.id_producto)
+    actualizados = set(db_session.scalars(
+        update(Productos)
+        .where(Productos.id_producto.in_(list(cambios)), Productos.cantidad + cambio >= 0)
+        .values(cantidad=Productos.cantidad + cambio)
+        .returning(Productos.id_producto)
+        .execution_options(synchronize_session=False)
+    ))
+    # El historial solo lleva lo que sí cambió el saldo
+    registrar_movimientos([
+        {'id_producto': id_producto, 'tipo': tipo, 'cantidad': cantidad, 'id_empleado': id_empleado, 'id_paquete': id_paquete}
+        for id_producto, cantidad in cambios.items() if id_producto in actualizados
+    ])
+    # Las cantidades en memoria ya no corresponden a la base de datos
+    for producto in db_session.identity_map.values():
+        if isinstance(producto, Productos) and producto.id_producto in cambios:
+            db_session.expire(producto, ['cantidad'])
+    return len(actualizados)
+
+def descontar_stock(cantidades, id_empleado=None, id_paquete=None):
+    """
+    Descuenta todas las cantidades con un solo UPDATE condicionado a que alcance el stock.
+    Si algún producto no alcanza los demás ya quedaron descontados: hay que hacer rollback.
+    """
+    cambios = {id_producto: -cantidad for id_producto, cantidad in cantidades.items()}
+    actualizados = aplicar_movimientos(cambios, Movimientos_Inventario.SALIDA_PAQUETE, id_empleado, id_paquete)
+    if actualizados != len([c for c in cambios.values() if c]):
+        raise StockInsuficiente(validar_stock(cantidades, cargar_productos(list(cantidades))))
+
+def reservar_stock(items, id_empleado=None, id_paquete=None):
+    """
+    Bloquea los productos, valida en memoria y descuenta el stock.
+    Lanza StockInsuficiente con el detalle si algún producto no alcanza (hacer rollback).
+    """
+    cantidades = agrupar_cantidades(items)
+    productos = cargar_productos(list(cantidades), bloquear=True)
+    insuficientes = validar_stock(cantidades, productos)
+    if insuficientes:
+        raise StockInsuficiente(insuficientes)
+    descontar_stock(cantidades, id_empleado, id_paquete)
+    return productos
+
+def registrar_alta(producto, id_empleado=None):
+    """
+    Entrada con el stock inicial de un producto nuevo (el saldo ya viene en el INSERT)
+    """
+    db_session.flush()
+    if producto.cantidad:
+        registrar_movimientos([{
+            'id_producto': producto.id_producto, 'tipo': Movimientos_Inventario.ENTRADA,
+            'cantidad': producto.cantidad, 'id_empleado': id_empleado
+        }])
+
+def ajustar_stock(producto, nueva_cantidad, id_empleado=None):
+    """
+    Ajuste manual: registra la diferencia entre el saldo actual (bloqueado) y la cantidad capturada
+    """
+    if nueva_cantidad < 0:
+        raise ValueError("La cantidad no puede ser negativa")
+    db_session.refresh(producto, ['cantidad'], with_for_update=True)
+    aplicar_movimientos({producto.id_producto: nueva_cantidad - producto.cantidad}, Movimientos_Inventario.AJUSTE, id_empleado)
+
+# ===== SALDOS Y CORTES =====
+def calcular_existencias(fecha=None, hasta_movimiento=None, ids=None):
+    """
+    Stock por producto a una fecha (o hasta un movimiento): el último corte anterior
+    más los movimientos posteriores a él. {id_producto: cantidad}
+    """
+    condiciones_corte, condiciones_movimiento = [], []
+    if fecha is not None:
+        condiciones_corte.append(Cortes_Inventario.fecha <= fecha)
+        condiciones_movimiento.append(Movimientos_Inventario.fecha <= fecha)
+    if hasta_movimiento is not None:
+        condiciones_corte.append(Cortes_Inventario.id_ultimo_movimiento <= hasta_movimiento)
+        condiciones_movimiento.append(Movimientos_Inventario.id_movimiento <= hasta_movimiento)
+    if ids is not None:
+        condiciones_corte.append(Cortes_Inventario.id_producto.in_(ids))
+        condiciones_movimiento.append(Movimientos_Inventario.id_producto.in_(ids))
+
+    ultimos = select(func.max(Cortes_Inventario.id_corte)).where(*condiciones_corte).group_by(Cortes_Inventario.id_producto)
+    cortes = select(
+        Cortes_Inventario.id_producto, Cortes_Inventario.cantidad, Cortes_Inventario.id_ultimo_movimiento
+    ).where(Cortes_Inventario.id_corte.in_(ultimos)).subquery()
+
+    existencias = {c.id_producto: c.cantidad for c in db_session.execute(select(cortes.c.id_producto, cortes.c.cantidad))}
+    posteriores = db_session.execute(
+        select(Movimientos_Inventario.id_producto, func.sum(Movimientos_Inventario.cantidad))
+        .outerjoin(cortes, cortes.c.id_producto == Movimientos_Inventario.id_producto)
+        .where(Movimientos_Inventario.id_movimiento > func.coalesce(cortes.c.id_ultimo_movimiento, 0), *condiciones_movimiento)
+        .group_by(Movimientos_Inventario.id_producto)
+    )
+    for id_producto, cantidad in posteriores:
+        existencias[id_producto] = existencias.get(id_producto, 0) + cantidad
+    return existencias
+
+def crear_cortes(margen=timedelta(minutes=5)):
+    """
+    Guarda el saldo de los productos con movimientos desde su último corte.
+    Se deja un margen para no cortar a la mitad de transacciones que aún no terminan.
+    """
+    hasta = datetime.utcnow() - margen
+    limite = db_session.query(func.max(Movimientos_Inventario.id_movimiento)).filter(Movimientos_Inventario.fecha <= hasta).scalar()
+    if not limite:
+        return 0
+    anterior = db_session.query(func.max(Cortes_Inventario.id_ultimo_movimiento)).scalar() or 0
+    if limite <= anterior:
+        return 0
+
+    con_movimientos = select(Movimientos_Inventario.id_producto).where(
+        Movimientos_Inventario.id_movimiento > anterior, Movimientos_Inventario.id_movimiento <= limite
+    ).distinct()
+    existencias = calcular_existencias(hasta_movimiento=limite, ids=con_movimientos)
+    if not existencias:
+        return 0
+    db_session.execute(insert(Cortes_Inventario), [
+        {'id_producto': id_producto, 'cantidad': cantidad, 'id_ultimo_movimiento': limite, 'fecha': hasta}
+        for id_producto, cantidad in existencias.items()
+    ])
+    db_session.commit()
+    return len(existencias)
+
+def reconstruir_saldos(ids=None):
+    """
+    Recalcula Productos.cantidad desde el historial (último corte + movimientos); regresa los corregidos
+    """
+    existencias = calcular_existencias(ids=ids)
+    query = db_session.query(Productos.id_producto, Productos.cantidad)
+    if ids is not None:
+        query = query.filter(Productos.id_producto.in_(ids))
+    diferentes = [
+        {'id_producto': id_producto, 'cantidad': existencias.get(id_producto, 0)}
+        for id_producto, cantidad in query if cantidad != existencias.get(id_producto, 0)
+    ]
+    if diferentes:
+        db_session.bulk_update_mappings(Productos, diferentes)
+        db_session.commit()
+        invalidar_codigos([fila['id_producto'] for fila in diferentes])
+        invalidar_fragmentos(PRODUCTOS)
+    return len(diferentes)
@@ -0,0 +1,365 @@
+# Métricas en formato de texto de Prometheus (/metrics)
+# Cada proceso acumula sus métricas en memoria. Con METRICAS_DIR (gunicorn.conf.py lo define) cada
+# worker vuelca una copia a <METRICAS_DIR>/<pid>-<inicio>.json cada METRICAS_INTERVALO segundos y al salir
+# (con la hora de arranque en el nombre un pid reutilizado no pisa la copia del worker anterior),
+# y /metrics suma las de todos: los contadores y histogramas de workers ya terminados se conservan,
+# los medidores (peticiones en curso, pool) solo cuentan los de procesos vivos.
+# Cada METRICAS_CONSOLIDAR segundos un worker pasa las copias de los procesos terminados a acumulado.json
+# y las borra, con el directorio bloqueado (flock) para que /metrics no las cuente dos veces ni ninguna.
+import hmac
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+METRICAS_DIR = os.getenv('METRICAS_DIR')
+METRICAS_INTERVALO = float(os.getenv('METRICAS_INTERVALO', 5))
+METRICAS_CONSOLIDAR = float(os.getenv('METRICAS_CONSOLIDAR', 60))
+METRICAS_TOKEN = os.getenv('METRICAS_TOKEN')
+# Sin token /metrics no responde; detrás de un proxy toda petición llega desde localhost
+METRICAS_LOCAL = os.getenv('METRICAS_LOCAL') == '1'
+PREFIJO = 'poblanita_'
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# nombre -> (tipo, ayuda)
+DESCRIPCIONES = {
+    'http_peticiones_total': ('counter', 'Peticiones atendidas por endpoint, método y código de estado'),
+    'http_duracion_segundos': ('histogram', 'Duración de las peticiones por endpoint'),
+    'http_en_curso': ('gauge', 'Peticiones que se están atendiendo'),
+    'bd_consultas_total': ('counter', 'Consultas SQL por endpoint'),
+    'bd_tiempo_segundos_total': ('counter', 'Tiempo en la base de datos por endpoint'),
+    'bd_pool_conexiones_total': ('counter', 'Conexiones abiertas por el pool'),
+    'bd_pool_checkouts_total': ('counter', 'Conexiones tomadas del pool'),
+    'bd_pool_espera_segundos_total': ('counter', 'Tiempo esperando una conexión libre'),
+    'bd_pool_timeouts_total': ('counter', 'Esperas de conexión que vencieron'),
+    'bd_pool_en_uso': ('gauge', 'Conexiones del pool en uso'),
+    'bd_pool_libres': ('gauge', 'Conexiones del pool disponibles'),
+    'bd_pool_overflow': ('gauge', 'Conexiones abiertas por encima del tamaño del pool'),
+    'imagenes_procesadas_total': ('counter', 'Imágenes optimizadas en segundo plano'),
+    'imagenes_bytes_entrada_total': ('counter', 'Bytes de las imágenes subidas'),
+    'imagenes_bytes_salida_total': ('counter', 'Bytes de las imágenes ya optimizadas'),
+    'imagenes_servidas_total': ('counter', 'Imágenes servidas, por origen (almacén, BLOB en la base o miniatura)'),
+    'imagenes_compresion_ratio': ('gauge', 'Bytes de salida entre bytes de entrada de las imágenes'),
+    'paquetes_total': ('counter', 'Paquetes generados, confirmados (por sucursal) y borradores vencidos'),
+    'correos_total': ('counter', 'Correos enviados, reintentados y fallidos'),
+    'correos_en_cola': ('gauge', 'Correos esperando envío'),
+    'cache_fragmentos_total': ('counter', 'Fragmentos de los listados servidos desde el caché (acierto) o renderizados (fallo)'),
+    'codigos_busquedas_total': ('counter', 'Códigos de barras buscados, por origen de la respuesta'),
+}
+
+contadores = {}
+histogramas = {}
+medidores = {}
+candado_metricas = threading.Lock()
+ultimo_volcado = 0.0
+ultima_consolidacion = 0.0
+# (pid, hora de arranque) de este proceso; se recalcula después de un fork
+identidad_proceso = None
+
+ACUMULADO = 'acumulado.json'
+
+# Funciones que actualizan métricas tomadas de otros módulos justo antes de exponerlas o volcarlas
+recolectores = []
+
+def registrar_recolector(funcion):
+    recolectores.append(funcion)
+    return funcion
+
+def recolectar():
+    for funcion in recolectores:
+        funcion()
+
+def clave(nombre, etiquetas):
+    return nombre, tuple(sorted(etiquetas.items()))
+
+def incrementar(nombre, valor=1, **etiquetas):
+    with candado_metricas:
+        llave = clave(nombre, etiquetas)
+        contadores[llave] = contadores.get(llave, 0) + valor
+
+def observar(nombre, valor, **etiquetas):
+    with candado_metricas:
+        llave = clave(nombre, etiquetas)
+        histograma = histogramas.setdefault(llave, [[0] * len(BUCKETS_SEGUNDOS), 0.0, 0])
+        for i, limite in enumerate(BUCKETS_SEGUNDOS):
+            if valor <= limite:
+                histograma[0][i] += 1
+        histograma[1] += valor
+        histograma[2] += 1
+
+def fijar_contador(nombre, valor, **etiquetas):
+    # Para contadores que ya lleva otro módulo (p. ej. el pool): se guarda el total del proceso
+    with candado_metricas:
+        contadores[clave(nombre, etiquetas)] = valor
+
+def fijar(nombre, valor, **etiquetas):
+    with candado_metricas:
+        medidores[clave(nombre, etiquetas)] = valor
+
+def sumar_medidor(nombre, valor, **etiquetas):
+    with candado_metricas:
+        llave = clave(nombre, etiquetas)
+        medidores[llave] = medidores.get(llave, 0) + valor
+
+# ===== VARIOS PROCESOS =====
+def identidad():
+    global identidad_proceso
+    pid = os.getpid()
+    if identidad_proceso is None or identidad_proceso[0] != pid:
+        identidad_proceso = (pid, time.time_ns())
+    return identidad_proceso
+
+def nombre_copia(pid, inicio):
+    return f'{pid}-{inicio}.json'
+
+def copia_local():
+    pid, inicio = identidad()
+    with candado_metricas:
+        return {
+            'pid': pid,
+            'inicio': inicio,
+            'contadores': [[n, dict(e), v] for (n, e), v in contadores.items()],
+            'histogramas': [[n, dict(e), h[0], h[1], h[2]] for (n, e), h in histogramas.items()],
+            'medidores': [[n, dict(e), v] for (n, e), v in medidores.items()],
+        }
+
+def escribir_json(ruta, datos):
+    # Se escribe aparte y se renombra: nadie lee un archivo a medias
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(datos, archivo)
+    os.replace(temporal, ruta)
+
+def leer_json(ruta):
+    try:
+        with open(ruta, encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        return None
+
+@contextmanager
+def candado_directorio(exclusivo=False):
+    """
+    Bloquea METRICAS_DIR entre procesos: compartido para leer las copias, exclusivo para consolidarlas
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(METRICAS_DIR, '.candado'), 'a') as archivo:
+        fcntl.flock(archivo, fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(archivo, fcntl.LOCK_UN)
+
+def volcar(forzar=False):
+    """
+    Guarda la copia de este proceso para que /metrics de otro worker la sume
+    """
+    global ultimo_volcado, ultima_consolidacion
+    if not METRICAS_DIR:
+        return
+    ahora = time.monotonic()
+    if not forzar and ahora - ultimo_volcado < METRICAS_INTERVALO:
+        return
+    ultimo_volcado = ahora
+    recolectar()
+    os.makedirs(METRICAS_DIR, exist_ok=True)
+    escribir_json(os.path.join(METRICAS_DIR, nombre_copia(*identidad())), copia_local())
+    if not forzar and ahora - ultima_consolidacion >= METRICAS_CONSOLIDAR:
+        ultima_consolidacion = ahora
+        consolidar()
+
+def proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+
+def leer_copias():
+    """
+    (acumulado, [(nombre, copia, vivo)]) de METRICAS_DIR sin la de este proceso; llamar con el directorio bloqueado
+    """
+    acumulado = leer_json(os.path.join(METRICAS_DIR, ACUMULADO)) or {'contadores': [], 'histogramas': [], 'procesos': []}
+    consolidadas = set(acumulado['procesos'])
+    propia = nombre_copia(*identidad())
+    copias = []
+    for nombre in os.listdir(METRICAS_DIR):
+        if not nombre.endswith('.json') or nombre in (propia, ACUMULADO) or nombre in consolidadas:
+            continue
+        copia = leer_json(os.path.join(METRICAS_DIR, nombre))
+        if copia is not None:
+            copias.append((nombre, copia))
+    # Si el pid se reutilizó, la copia más reciente es la del proceso vivo
+    ultimo_inicio = {os.getpid(): identidad()[1]}
+    for _, copia in copias:
+        ultimo_inicio[copia['pid']] = max(ultimo_inicio.get(copia['pid'], 0), copia.get('inicio', 0))
+    return acumulado, [
+        (nombre, copia, copia.get('inicio', 0) == ultimo_inicio[copia['pid']] and proceso_vivo(copia['pid']))
+        for nombre, copia in copias
+    ]
+
+def copias_procesos():
+    copias = [copia_local()]
+    if not METRICAS_DIR or not os.path.isdir(METRICAS_DIR):
+        return copias
+    with candado_directorio():
+        acumulado, leidas = leer_copias()
+    copias.append({'contadores': acumulado['contadores'], 'histogramas': acumulado['histogramas'], 'medidores': []})
+    for _, copia, vivo in leidas:
+        if not vivo:
+            copia['medidores'] = []
+        copias.append(copia)
+    return copias
+
+def consolidar():
+    """
+    Suma a acumulado.json las copias de los procesos terminados y las borra; regresa cuántas pasó
+    """
+    if not METRICAS_DIR or fcntl is None:
+        return 0
+    with candado_directorio(exclusivo=True):
+        acumulado, leidas = leer_copias()
+        # Las que ya se sumaron en la consolidación anterior y no se alcanzaron a borrar
+        for nombre in acumulado['procesos']:
+            try:
+                os.remove(os.path.join(METRICAS_DIR, nombre))
+            except FileNotFoundError:
+                pass
+        terminadas = [(nombre, copia) for nombre, copia, vivo in leidas if not vivo]
+        if not terminadas:
+            return 0
+        suma_contadores, suma_histogramas, _ = sumar_copias([acumulado] + [copia for _, copia in terminadas])
+        # Primero queda el acumulado con los nombres que ya incluye y después se borran las copias
+        escribir_json(os.path.join(METRICAS_DIR, ACUMULADO), {
+            'contadores': [[n, dict(e), v] for (n, e), v in suma_contadores.items()],
+            'histogramas': [[n, dict(e), h[0], h[1], h[2]] for (n, e), h in suma_histogramas.items()],
+            'procesos': [nombre for nombre, _ in terminadas],
+        })
+        for nombre, _ in terminadas:
+            os.remove(os.path.join(METRICAS_DIR, nombre))
+    return len(terminadas)
+
+def limpiar_directorio():
+    """
+    Al arrancar el servidor: las copias de una ejecución anterior no se suman
+    """
+    if not METRICAS_DIR or not os.path.isdir(METRICAS_DIR):
+        return
+    for nombre in os.listdir(METRICAS_DIR):
+        if nombre.endswith('.json') or nombre.endswith('.tmp'):
+            os.remove(os.path.join(METRICAS_DIR, nombre))
+
+# ===== FORMATO DE TEXTO =====
+def escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def formatear_etiquetas(etiquetas):
+    if not etiquetas:
+        return ''
+    return '{' + ','.join(f'{k}="{escapar(v)}"' for k, v in sorted(etiquetas.items())) + '}'
+
+def formatear_numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+def sumar_copias(copias):
+    """
+    Suma de las copias: (contadores, histogramas, medidores) con las mismas llaves que en memoria
+    """
+    suma_contadores, suma_histogramas, suma_medidores = {}, {}, {}
+    for copia in copias:
+        for nombre, etiquetas, valor in copia['contadores']:
+            llave = clave(nombre, etiquetas)
+            suma_contadores[llave] = suma_contadores.get(llave, 0) + valor
+        for nombre, etiquetas, buckets, suma, cuenta in copia['histogramas']:
+            llave = clave(nombre, etiquetas)
+            actual = suma_histogramas.setdefault(llave, [[0] * len(BUCKETS_SEGUNDOS), 0.0, 0])
+            actual[0] = [a + b for a, b in zip(actual[0], buckets)]
+            actual[1] += suma
+            actual[2] += cuenta
+        for nombre, etiquetas, valor in copia.get('medidores', []):
+            llave = clave(nombre, etiquetas)
+            suma_medidores[llave] = suma_medidores.get(llave, 0) + valor
+    return suma_contadores, suma_histogramas, suma_medidores
+
+def exponer():
+    """
+    Texto para Prometheus con la suma de todos los procesos
+    """
+    recolectar()
+    suma_contadores, suma_histogramas, suma_medidores = sumar_copias(copias_procesos())
+
+    entrada = suma_contadores.get(clave('imagenes_bytes_entrada_total', {}), 0)
+    if entrada:
+        suma_medidores[clave('imagenes_compresion_ratio', {})] = suma_contadores.get(clave('imagenes_bytes_salida_total', {}), 0) / entrada
+
+    series = {}
+    for (nombre, etiquetas), valor in list(suma_contadores.items()) + list(suma_medidores.items()):
+        series.setdefault(nombre, []).append(f'{PREFIJO}{nombre}{formatear_etiquetas(dict(etiquetas))} {formatear_numero(valor)}')
+    for (nombre, etiquetas), (buckets, suma, cuenta) in suma_histogramas.items():
+        etiquetas = dict(etiquetas)
+        lineas = series.setdefault(nombre, [])
+        for limite, acumulado in zip(BUCKETS_SEGUNDOS, buckets):
+            lineas.append(f'{PREFIJO}{nombre}_bucket{formatear_etiquetas({**etiquetas, "le": limite})} {acumulado}')
+        lineas.append(f'{PREFIJO}{nombre}_bucket{formatear_etiquetas({**etiquetas, "le": "+Inf"})} {cuenta}')
+        lineas.append(f'{PREFIJO}{nombre}_sum{formatear_etiquetas(etiquetas)} {formatear_numero(suma)}')
+        lineas.append(f'{PREFIJO}{nombre}_count{formatear_etiquetas(etiquetas)} {cuenta}')
+
+    salida = []
+    for nombre in sorted(series):
+        tipo, ayuda = DESCRIPCIONES.get(nombre, ('untyped', nombre))
+        salida.append(f'# HELP {PREFIJO}{nombre} {ayuda}')
+        salida.append(f'# TYPE {PREFIJO}{nombre} {tipo}')
+        salida.extend(sorted(series[nombre]) if tipo != 'histogram' else series[nombre])
+    return '\n'.join(salida) + '\n'
+
+# ===== FLASK =====
+def acceso_metricas():
+    if METRICAS_TOKEN:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICAS_TOKEN}')
+    return METRICAS_LOCAL and request.remote_addr in ('127.0.0.1', '::1')
+
+def recolectar_pool():
+    from database import get_estadisticas_pool
+    estadisticas = get_estadisticas_pool()
+    fijar_contador('bd_pool_conexiones_total', estadisticas['conexiones'])
+    fijar_contador('bd_pool_checkouts_total', estadisticas['checkouts'])
+    fijar_contador('bd_pool_espera_segundos_total', estadisticas['espera_total'])
+    fijar_contador('bd_pool_timeouts_total', estadisticas['timeouts'])
+    fijar('bd_pool_en_uso', estadisticas.get('en_uso', 0))
+    fijar('bd_pool_libres', estadisticas.get('libres', 0))
+    fijar('bd_pool_overflow', estadisticas.get('overflow', 0))
+
+def instalar_metricas(app):
+    registrar_recolector(recolectar_pool)
+
+    @app.before_request
+    def iniciar_metricas():
+        g.inicio_metricas = time.perf_counter()
+        sumar_medidor('http_en_curso', 1)
+
+    @app.after_request
+    def registrar_peticion(response):
+        inicio = g.get('inicio_metricas')
+        if inicio is not None:
+            endpoint = request.endpoint or 'sin_endpoint'
+            incrementar('http_peticiones_total', endpoint=endpoint, metodo=request.method, estado=str(response.status_code))
+            observar('http_duracion_segundos', time.perf_counter() - inicio, endpoint=endpoint)
+        return response
+
+    @app.teardown_request
+    def terminar_metricas(exception=None):
+        if g.pop('inicio_metricas', None) is not None:
+            sumar_medidor('http_en_curso', -1)
+        volcar()
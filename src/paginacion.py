@@ -0,0 +1,164 @@
+# Paginación de los listados
+import math
+import threading
+import time
+from datetime import datetime
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import event, tuple_
+from database import db_session
+from config import Config
+from fragmentos import versiones_grupos
+
+serializador_cursor = URLSafeSerializer(Config.SECRET_KEY, salt='paginacion')
+
+# ===== CONTEO CACHEADO =====
+# COUNT(*) de cada consulta filtrada; se descarta con cualquier escritura o al vencer. La clave lleva las
+# versiones de fragmentos.py: las escrituras de otros workers (invalidar_fragmentos) también lo descartan
+SEGUNDOS_CONTEO = 60
+conteos = {}
+candado_conteos = threading.Lock()
+
+def contar(query):
+    compilado = query.statement.compile()
+    clave = (compilado.string, tuple(sorted((k, str(v)) for k, v in compilado.params.items())), versiones_grupos())
+    ahora = time.monotonic()
+    with candado_conteos:
+        guardado = conteos.get(clave)
+    if guardado and ahora - guardado[1] < SEGUNDOS_CONTEO:
+        return guardado[0]
+
+    total = query.order_by(None).count()
+    with candado_conteos:
+        conteos[clave] = (total, ahora)
+    return total
+
+@event.listens_for(db_session, 'after_flush')
+def limpiar_conteos(session, flush_context):
+    with candado_conteos:
+        conteos.clear()
+
+# ===== CURSORES =====
+def codificar_valor(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else valor
+
+def decodificar_valor(columna, valor):
+    return datetime.fromisoformat(valor) if valor is not None and columna.type.python_type is datetime else valor
+
+def crear_cursor(item, orden, direccion, page):
+    return serializador_cursor.dumps({
+        'd': direccion,
+        'p': page,
+        'k': [codificar_valor(getattr(item, columna.key)) for columna in orden]
+    })
+
+def leer_cursor(cursor, orden):
+    try:
+        datos = serializador_cursor.loads(cursor)
+        return datos['d'], int(datos['p']), [decodificar_valor(c, v) for c, v in zip(orden, datos['k'])]
+    except (BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+class Pagination:
+    def __init__(self, items, page, per_page, total, has_next=None, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.pages = math.ceil(total / per_page) if per_page > 0 and total is not None else page + (1 if has_next else 0)
+        self.hay_siguiente = has_next
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        if self.hay_siguiente is not None:
+            return self.hay_siguiente
+        return self.page < self.pages
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    def iter_pages(self, left_edge=2, left_current=2, right_current=2, right_edge=2):
+
+        total_pages = self.pages
+        if total_pages <= 1:
+            return
+
+        left_range = range(1, min(left_edge, total_pages) + 1)
+        right_range = range(max(total_pages - right_edge + 1, left_edge + 1), total_pages + 1)
+
+        current_page = self.page
+        middle_range = range(
+            max(current_page - left_current, left_edge + 1),
+            min(current_page + right_current + 1, right_range[0] if right_range else total_pages + 1)
+        )
+
+        last = 0
+        for page_num in left_range:
+            yield page_num
+            last = page_num
+
+        if last + 1 < middle_range[0] if middle_range else last + 1 < right_range[0] if right_range else False:
+            yield None
+
+        for page_num in middle_range:
+            yield page_num
+            last = page_num
+
+        if last + 1 < right_range[0] if right_range else False:
+            yield None
+
+        for page_num in right_range:
+            yield page_num
+
+# ===== FUNCIÓN DE PAGINACIÓN =====
+def paginate(query, page, per_page, orden=None, cursor=None, descendente=False, con_total=True):
+    """
+    Pagina la consulta. Con `orden` (columnas únicas en conjunto) la navegación anterior/siguiente
+    usa cursores sobre esas columnas en lugar de OFFSET; los números de página siguen usando OFFSET.
+    """
+    page = max(1, page)
+
+    if not orden:
+        total = contar(query) if con_total else query.count()
+        items = query.offset((page - 1) * per_page).limit(per_page).all()
+        return Pagination(items, page, per_page, total)
+
+    total = contar(query) if con_total else None
+    llave = tuple_(*orden)
+    datos_cursor = leer_cursor(cursor, orden) if cursor else None
+
+    if datos_cursor:
+        direccion, page, valores = datos_cursor
+        # Hacia atrás se recorre en el orden inverso y luego se voltea el resultado
+        ascendente = (direccion == 'sig') != descendente
+        query = query.filter(llave > tuple_(*valores) if ascendente else llave < tuple_(*valores))
+    else:
+        direccion = 'sig'
+        ascendente = not descendente
+
+    query = query.order_by(*[c.asc() if ascendente else c.desc() for c in orden])
+    if not datos_cursor:
+        query = query.offset((page - 1) * per_page)
+    items = query.limit(per_page + 1).all()
+    hay_mas = len(items) > per_page
+    items = items[:per_page]
+    if direccion == 'ant':
+        items.reverse()
+
+    has_next = hay_mas if direccion == 'sig' else True
+
+    pagination = Pagination(items, page, per_page, total, has_next=has_next)
+    if items:
+        pagination.next_cursor = crear_cursor(items[-1], orden, 'sig', page + 1) if pagination.has_next else None
+        pagination.prev_cursor = crear_cursor(items[0], orden, 'ant', page - 1) if page > 1 else None
+    return pagination
@@ -0,0 +1,111 @@
+# Perfil de consultas SQL por petición
+# Cuenta las consultas y el tiempo en la base de datos de cada petición (eventos del engine en database).
+# En modo debug (o con PERFILADOR_HEADERS=1) lo agrega al encabezado Server-Timing; siempre se acumula
+# por endpoint para /estado/consultas y /metrics, y las peticiones que pasan los umbrales van a la bitácora.
+import os
+import threading
+import time
+from flask import g, request
+from database import PerfilConsultas, perfil_actual
+from metricas import incrementar
+from bitacora import get_logger
+
+log = get_logger('perfilador')
+
+PERFILADOR_HEADERS = os.getenv('PERFILADOR_HEADERS') == '1'
+CONSULTAS_ALERTA = int(os.getenv('PERFILADOR_CONSULTAS_ALERTA', 30))
+MS_ALERTA = float(os.getenv('PERFILADOR_MS_ALERTA', 500))
+
+estadisticas_endpoints = {}
+candado_endpoints = threading.Lock()
+
+def resumir_sentencia(sentencia, largo=120):
+    return ' '.join(sentencia.split())[:largo]
+
+def encabezado_server_timing(perfil, duracion):
+    # Las descripciones van entre comillas: se quitan las que traiga la sentencia
+    partes = [
+        f'db;dur={perfil.tiempo * 1000:.2f};desc="{perfil.consultas} consultas"',
+        f'app;dur={duracion * 1000:.2f}',
+    ]
+    for i, (tiempo, sentencia, plan) in enumerate(perfil.lentas, 1):
+        descripcion = resumir_sentencia(sentencia, 80).replace('"', "'").replace('\\', '')
+        partes.append(f'sql{i};dur={tiempo * 1000:.2f};desc="{descripcion}"')
+    return ', '.join(partes)
+
+def acumular(endpoint, perfil, duracion):
+    with candado_endpoints:
+        estadisticas = estadisticas_endpoints.setdefault(endpoint, {
+            'peticiones': 0, 'consultas': 0, 'tiempo_bd': 0.0, 'tiempo_total': 0.0,
+            'maximo_consultas': 0, 'consulta_mas_lenta_ms': 0.0, 'consulta_mas_lenta': None,
+        })
+        estadisticas['peticiones'] += 1
+        estadisticas['consultas'] += perfil.consultas
+        estadisticas['tiempo_bd'] += perfil.tiempo
+        estadisticas['tiempo_total'] += duracion
+        estadisticas['maximo_consultas'] = max(estadisticas['maximo_consultas'], perfil.consultas)
+        if perfil.lentas and perfil.lentas[0][0] * 1000 > estadisticas['consulta_mas_lenta_ms']:
+            estadisticas['consulta_mas_lenta_ms'] = round(perfil.lentas[0][0] * 1000, 2)
+            estadisticas['consulta_mas_lenta'] = resumir_sentencia(perfil.lentas[0][1], 300)
+
+def registrar_alerta(endpoint, perfil, duracion):
+    """
+    Evento en la bitácora para las peticiones con muchas consultas, lentas o con planes guardados
+    """
+    con_plan = any(plan for _, _, plan in perfil.lentas)
+    if perfil.consultas < CONSULTAS_ALERTA and perfil.tiempo * 1000 < MS_ALERTA and not con_plan:
+        return
+    log.warning("Petición con muchas consultas o consultas lentas", extra={'datos': {
+        'endpoint': endpoint,
+        'metodo': request.method,
+        'ruta': request.path,
+        'consultas': perfil.consultas,
+        'tiempo_bd_ms': round(perfil.tiempo * 1000, 2),
+        'tiempo_total_ms': round(duracion * 1000, 2),
+        'lentas': [
+            {'ms': round(tiempo * 1000, 2), 'sentencia': resumir_sentencia(sentencia, 500), 'plan': plan}
+            for tiempo, sentencia, plan in perfil.lentas
+        ],
+    }})
+
+def get_estadisticas_consultas():
+    """
+    Acumulado por endpoint en este proceso, con promedios por petición
+    """
+    with candado_endpoints:
+        copia = {endpoint: dict(estadisticas) for endpoint, estadisticas in estadisticas_endpoints.items()}
+    for estadisticas in copia.values():
+        peticiones = estadisticas['peticiones']
+        estadisticas['consultas_promedio'] = round(estadisticas['consultas'] / peticiones, 2)
+        estadisticas['tiempo_bd_promedio_ms'] = round(estadisticas['tiempo_bd'] / peticiones * 1000, 2)
+        estadisticas['tiempo_total_promedio_ms'] = round(estadisticas['tiempo_total'] / peticiones * 1000, 2)
+        estadisticas['tiempo_bd'] = round(estadisticas['tiempo_bd'], 4)
+        estadisticas['tiempo_total'] = round(estadisticas['tiempo_total'], 4)
+    return copia
+
+def instalar_perfilador(app):
+    @app.before_request
+    def iniciar_perfil():
+        g.perfil_consultas = PerfilConsultas()
+        g.token_perfil = perfil_actual.set(g.perfil_consultas)
+        g.inicio_peticion = time.perf_counter()
+
+    @app.after_request
+    def agregar_server_timing(response):
+        perfil = g.get('perfil_consultas')
+        if perfil is not None and (app.debug or PERFILADOR_HEADERS):
+            response.headers['Server-Timing'] = encabezado_server_timing(perfil, time.perf_counter() - g.inicio_peticion)
+        return response
+
+    @app.teardown_request
+    def terminar_perfil(exception=None):
+        perfil = g.pop('perfil_consultas', None)
+        if perfil is None:
+            return
+        perfil_actual.reset(g.pop('token_perfil'))
+        duracion = time.perf_counter() - g.pop('inicio_peticion')
+        endpoint = request.endpoint or 'sin_endpoint'
+        acumular(endpoint, perfil, duracion)
+        incrementar('bd_consultas_total', perfil.consultas, endpoint=endpoint)
+        incrementar('bd_tiempo_segundos_total', perfil.tiempo, endpoint=endpoint)
+        registrar_alerta(endpoint, perfil, duracion)
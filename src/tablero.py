@@ -0,0 +1,186 @@
+# Tablero de /home
+# Los totales por día viven en las tablas de resumen, que se actualizan en la misma transacción que
+# confirma o borra un paquete; el tablero solo lee los últimos días de esas tablas y los productos con
+# menos stock (índice en Productos.cantidad), así que no depende del tamaño del historial.
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import Date, cast, delete, func, insert, select, update
+from database import db_session, insert_upsert
+from database.models import (
+    Movimientos_Inventario, Paquetes, Paquetes_Productos, Perfiles_Empleados, Productos,
+    Resumen_Despachos_Diarios, Resumen_Empleados_Diarios, Resumen_Productos_Diarios
+)
+
+TABLERO_STOCK_BAJO = int(os.getenv('TABLERO_STOCK_BAJO', 10))
+TABLERO_DIAS = 7
+TABLERO_DIAS_EMPLEADOS = 30
+TABLERO_LIMITE = 10
+
+def sumar_en_resumen(modelo, filas, claves, campos):
+    """
+    INSERT ... ON CONFLICT DO UPDATE que suma los campos; la base resuelve las confirmaciones simultáneas
+    """
+    if not filas:
+        return
+    # Siempre en el mismo orden para que dos transacciones no se bloqueen entre sí
+    filas = sorted(filas, key=lambda fila: tuple(str(fila[c]) for c in claves))
+    sentencia = insert_upsert(modelo).values(filas)
+    tabla = modelo.__table__
+    db_session.execute(sentencia.on_conflict_do_update(
+        index_elements=claves,
+        set_={campo: tabla.c[campo] + sentencia.excluded[campo] for campo in campos}
+    ))
+
+def empleado_del_despacho(id_paquete):
+    # El paquete no guarda quién lo confirmó; el historial de movimientos sí
+    return db_session.scalar(select(Movimientos_Inventario.id_empleado).where(
+        Movimientos_Inventario.id_paquete == id_paquete,
+        Movimientos_Inventario.tipo == Movimientos_Inventario.SALIDA_PAQUETE,
+        Movimientos_Inventario.id_empleado.isnot(None)
+    ).limit(1))
+
+def registrar_despacho(paquete, id_empleado=None, signo=1):
+    """
+    Suma (o resta con signo=-1) el paquete confirmado a los resúmenes; no hace commit
+    """
+    # La fecha se guarda en el paquete para que quitar_despacho y reconstruir_resumenes usen el mismo día
+    if paquete.fecha_creacion is None:
+        paquete.fecha_creacion = datetime.utcnow()
+    fecha = paquete.fecha_creacion.date()
+    por_producto = defaultdict(int)
+    for item in paquete.paquetes_productos:
+        por_producto[item.id_producto] += item.cantidad
+    unidades = sum(por_producto.values())
+
+    sumar_en_resumen(Resumen_Despachos_Diarios, [
+        {'fecha': fecha, 'sucursal': paquete.sucursal, 'paquetes': signo, 'unidades': signo * unidades}
+    ], ['fecha', 'sucursal'], ['paquetes', 'unidades'])
+    sumar_en_resumen(Resumen_Productos_Diarios, [
+        {'fecha': fecha, 'id_producto': id_producto, 'unidades': signo * cantidad}
+        for id_producto, cantidad in por_producto.items()
+    ], ['fecha', 'id_producto'], ['unidades'])
+    if id_empleado is not None:
+        sumar_en_resumen(Resumen_Empleados_Diarios, [
+            {'fecha': fecha, 'id_empleado': id_empleado, 'paquetes': signo, 'unidades': signo * unidades}
+        ], ['fecha', 'id_empleado'], ['paquetes', 'unidades'])
+
+def quitar_despacho(paquete):
+    """
+    Antes de borrar un paquete confirmado, lo resta de los resúmenes
+    """
+    if paquete.estado != Paquetes.CONFIRMADO:
+        return
+    registrar_despacho(paquete, empleado_del_despacho(paquete.id_paquete), signo=-1)
+
+def fechar_paquetes_sin_fecha():
+    """
+    UPDATE que pone fecha a los paquetes que no la tienen: la de su salida de inventario o, si no hay, la actual
+    """
+    salida = select(func.min(Movimientos_Inventario.fecha)).where(
+        Movimientos_Inventario.id_paquete == Paquetes.id_paquete
+    ).scalar_subquery()
+    return update(Paquetes).where(Paquetes.fecha_creacion.is_(None)).values(
+        fecha_creacion=func.coalesce(salida, datetime.utcnow())
+    ).execution_options(synchronize_session=False)
+
+def fecha_de(columna):
+    # CAST(... AS DATE) en SQLite da un número; date() da el texto que espera la columna Date
+    if db_session.get_bind().dialect.name == 'sqlite':
+        return func.date(columna)
+    return cast(columna, Date)
+
+def reconstruir_resumenes():
+    """
+    Recalcula todos los resúmenes desde los paquetes confirmados (al instalar o si se desajustan)
+    """
+    # Sin fecha no hay día en el que sumarlos (y la columna fecha de los resúmenes no admite NULL)
+    db_session.execute(fechar_paquetes_sin_fecha())
+    fecha = fecha_de(Paquetes.fecha_creacion).label('fecha')
+    confirmados = Paquetes.estado == Paquetes.CONFIRMADO
+    empleados = select(
+        Movimientos_Inventario.id_paquete,
+        func.min(Movimientos_Inventario.id_empleado).label('id_empleado')
+    ).where(
+        Movimientos_Inventario.tipo == Movimientos_Inventario.SALIDA_PAQUETE,
+        Movimientos_Inventario.id_paquete.isnot(None),
+        Movimientos_Inventario.id_empleado.isnot(None)
+    ).group_by(Movimientos_Inventario.id_paquete).subquery()
+
+    for modelo in (Resumen_Despachos_Diarios, Resumen_Productos_Diarios, Resumen_Empleados_Diarios):
+        db_session.execute(delete(modelo))
+
+    db_session.execute(insert(Resumen_Despachos_Diarios).from_select(
+        ['fecha', 'sucursal', 'paquetes', 'unidades'],
+        select(fecha, Paquetes.sucursal, func.count(func.distinct(Paquetes.id_paquete)), func.sum(Paquetes_Productos.cantidad))
+        .join(Paquetes_Productos, Paquetes_Productos.id_paquete == Paquetes.id_paquete)
+        .where(confirmados).group_by(fecha, Paquetes.sucursal)
+    ))
+    db_session.execute(insert(Resumen_Productos_Diarios).from_select(
+        ['fecha', 'id_producto', 'unidades'],
+        select(fecha, Paquetes_Productos.id_producto, func.sum(Paquetes_Productos.cantidad))
+        .join(Paquetes_Productos, Paquetes_Productos.id_paquete == Paquetes.id_paquete)
+        .where(confirmados).group_by(fecha, Paquetes_Productos.id_producto)
+    ))
+    db_session.execute(insert(Resumen_Empleados_Diarios).from_select(
+        ['fecha', 'id_empleado', 'paquetes', 'unidades'],
+        select(fecha, empleados.c.id_empleado, func.count(func.distinct(Paquetes.id_paquete)), func.sum(Paquetes_Productos.cantidad))
+        .join(Paquetes_Productos, Paquetes_Productos.id_paquete == Paquetes.id_paquete)
+        .join(empleados, empleados.c.id_paquete == Paquetes.id_paquete)
+        .where(confirmados).group_by(fecha, empleados.c.id_empleado)
+    ))
+    db_session.commit()
+
+def get_tablero():
+    """
+    Datos de /home: despachos por sucursal de los últimos días, productos más movidos,
+    paquetes por empleado y productos con poco stock
+    """
+    hoy = datetime.utcnow().date()
+    dias = [hoy - timedelta(days=i) for i in range(TABLERO_DIAS - 1, -1, -1)]
+
+    sucursales = {}
+    for fila in db_session.query(Resumen_Despachos_Diarios).filter(Resumen_Despachos_Diarios.fecha >= dias[0]):
+        sucursal = sucursales.setdefault(fila.sucursal, {
+            'sucursal': fila.sucursal, 'por_dia': dict.fromkeys(dias, 0), 'unidades': 0, 'paquetes': 0,
+        })
+        sucursal['por_dia'][fila.fecha] = fila.unidades
+        sucursal['unidades'] += fila.unidades
+        sucursal['paquetes'] += fila.paquetes
+    despachos = sorted(
+        (sucursal for sucursal in sucursales.values() if sucursal['paquetes']),
+        key=lambda sucursal: sucursal['unidades'], reverse=True
+    )
+
+    unidades = func.sum(Resumen_Productos_Diarios.unidades).label('unidades')
+    mas_movidos = db_session.query(Productos.id_producto, Productos.nombre, Productos.cantidad, unidades).join(
+        Productos, Productos.id_producto == Resumen_Productos_Diarios.id_producto
+    ).filter(Resumen_Productos_Diarios.fecha >= dias[0]).group_by(
+        Productos.id_producto, Productos.nombre, Productos.cantidad
+    ).having(unidades > 0).order_by(unidades.desc()).limit(TABLERO_LIMITE).all()
+
+    paquetes = func.sum(Resumen_Empleados_Diarios.paquetes).label('paquetes')
+    por_empleado = db_session.query(
+        Perfiles_Empleados.nombre, Perfiles_Empleados.apellidoP, paquetes,
+        func.sum(Resumen_Empleados_Diarios.unidades).label('unidades')
+    ).join(
+        Perfiles_Empleados, Perfiles_Empleados.id_empleado == Resumen_Empleados_Diarios.id_empleado
+    ).filter(
+        Resumen_Empleados_Diarios.fecha >= hoy - timedelta(days=TABLERO_DIAS_EMPLEADOS - 1)
+    ).group_by(
+        Resumen_Empleados_Diarios.id_empleado, Perfiles_Empleados.nombre, Perfiles_Empleados.apellidoP
+    ).having(paquetes > 0).order_by(paquetes.desc()).limit(TABLERO_LIMITE).all()
+
+    stock_bajo = db_session.query(Productos.id_producto, Productos.nombre, Productos.cantidad).filter(
+        Productos.cantidad <= TABLERO_STOCK_BAJO
+    ).order_by(Productos.cantidad, Productos.id_producto).limit(TABLERO_LIMITE).all()
+
+    return {
+        'dias': dias,
+        'despachos': despachos,
+        'mas_movidos': mas_movidos,
+        'por_empleado': por_empleado,
+        'stock_bajo': stock_bajo,
+        'stock_bajo_limite': TABLERO_STOCK_BAJO,
+        'dias_empleados': TABLERO_DIAS_EMPLEADOS,
+    }
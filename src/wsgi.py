@@ -0,0 +1,44 @@
+# Punto de entrada para producción
+# Desde src/: gunicorn wsgi:app (la configuración se lee de gunicorn.conf.py)
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+from app import app
+from codigos import buscar_codigos, por_codigo
+from database import db_session, engine, DB_POOL_SIZE
+
+application = app
+
+def calentar_conexiones(cantidad=DB_POOL_SIZE):
+    """
+    Abre de una vez las conexiones del pool para que la primera petición no pague la conexión
+    """
+    if not isinstance(engine.pool, QueuePool):
+        return 0
+    conexiones = []
+    try:
+        for _ in range(min(cantidad, engine.pool.size())):
+            conexion = engine.connect()
+            conexion.execute(text('SELECT 1'))
+            conexiones.append(conexion)
+    finally:
+        for conexion in conexiones:
+            conexion.close()
+    return len(conexiones)
+
+def calentar_plantillas():
+    """
+    Compila todas las plantillas de Jinja antes de recibir peticiones
+    """
+    nombres = [n for n in app.jinja_env.list_templates() if n.endswith('.html')]
+    for nombre in nombres:
+        app.jinja_env.get_template(nombre)
+    return len(nombres)
+
+def calentar_codigos():
+    """
+    Carga el índice de códigos de barras para que el primer escaneo no espere la consulta completa
+    """
+    with app.app_context():
+        buscar_codigos([])
+        db_session.remove()
+    return len(por_codigo)